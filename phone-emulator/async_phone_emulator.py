@@ -0,0 +1,212 @@
+import asyncio
+import aiohttp
+import socketio
+
+from latency import LatencyRecorder
+from phone_emulator import PhoneEventType, PhoneStateMachine
+from reconnect import default_reconnect_policy
+from talk_buffer import DEFAULT_CAPACITY, DROP
+from timer_wheel import event_loop_timer_wheel
+
+# An emulator that runs as a coroutine, so one event loop can host thousands of phones.
+# The public methods (key_press, off_hook, talk, ...) must be called from the loop's thread.
+class AsyncPhoneEmulator(PhoneStateMachine) :
+    __slots__ = ('_events', '_outbox', '_reconnect_task', '_transports')
+
+    def __init__(self, phone_number, server_url, ssl_verify=False, timers=None, transcript=None, latency_recorder=None,
+            http_session=None, trace=None, reconnect_policy=None, transports=None, serializer='default', media=None,
+            talk_capacity=DEFAULT_CAPACITY, talk_policy=DROP, talk_batch=1, profile=None, event_log=None) :
+        super().__init__(phone_number, server_url, timers, transcript, latency_recorder=latency_recorder, trace=trace,
+            reconnect_policy=reconnect_policy if reconnect_policy is not None else default_reconnect_policy(), media=media,
+            talk_capacity=talk_capacity, talk_policy=talk_policy, talk_batch=talk_batch, profile=profile,
+            event_log=event_log)
+        # the engine decides when phones stop, so don't let each client hook Ctrl-C, and
+        # reconnecting is left to the reconnect policy
+        if http_session is None :
+            self._sio = socketio.AsyncClient(ssl_verify=ssl_verify, handle_sigint=False, reconnection=False,
+                serializer=serializer)
+        else :
+            # engineio builds a new SSLContext (tens of milliseconds of CPU) for every websocket
+            # connection made with ssl_verify=False, so leave verification to the shared session's
+            # connector instead
+            self._sio = socketio.AsyncClient(http_session=http_session, handle_sigint=False, reconnection=False,
+                serializer=serializer, websocket_extra_options=None if ssl_verify else {'ssl' : False})
+        self._events = asyncio.Queue()
+        self._outbox = []
+        self._reconnect_task = None
+        self._transports = transports
+        self._register_socket_events()
+
+    async def run(self, connect_limiter=None) :
+        try :
+            if connect_limiter is not None :
+                async with connect_limiter :
+                    await self._connect()
+            else :
+                await self._connect()
+        except socketio.exceptions.ConnectionError :
+            # this gets handled in the event loop
+            pass
+
+        queue = self._events
+        running = True
+        while running :
+            # handle everything that has piled up since the last wakeup together
+            events = [await queue.get()]
+            while not queue.empty() :
+                events.append(queue.get_nowait())
+
+            done = len(events)
+            for i, event in enumerate(events) :
+                if event.type == PhoneEventType.SHUTDOWN :
+                    events = events[:i]
+                    done = i
+                    running = False
+                    break
+            self._dispatch_batch(events)
+            await self._flush_outbox()
+            if not running :
+                self._shutting_down()
+                if self._reconnect_task is not None :
+                    self._reconnect_task.cancel()
+                if self._emit_hangup :
+                    await self._sio.emit('hang_up')
+            for _ in range(done) :
+                queue.task_done()
+
+        await self._sio.disconnect()
+
+    async def _connect(self) :
+        await self._sio.connect(self._server_url, auth={'phoneNumber' : self._phone_number}, transports=self._transports)
+
+    def _reconnect(self) :
+        self._reconnect_task = asyncio.ensure_future(self._reconnect_now())
+
+    async def _reconnect_now(self) :
+        try :
+            await self._connect()
+        except socketio.exceptions.ConnectionError :
+            # reported through connect_error
+            pass
+        finally :
+            self._reconnect_task = None
+
+    # handlers are plain functions, so anything they send is queued up and awaited in order afterwards
+    async def _flush_outbox(self) :
+        while self._outbox :
+            outbox = self._outbox
+            self._outbox = []
+            for event, args in outbox :
+                await self._sio.emit(event, *args)
+
+    def _put_event(self, event) :
+        self._events.put_nowait(event)
+
+    def _emit(self, event, *args) :
+        self._outbox.append((event, args))
+
+    def _start_timer(self, delay, callback) :
+        if self._timers is None :
+            # phones can be created before the loop is running, so pick up its wheel lazily
+            self._timers = event_loop_timer_wheel()
+        return super()._start_timer(delay, callback)
+
+# Hosts a set of AsyncPhoneEmulators on the current event loop.  They share one aiohttp session
+# (connection setup, DNS cache and SSL context), and their call setup latencies all go into one
+# LatencyRecorder (and, if given, one TraceWriter).  They also share a reconnect policy, and with
+# it the token bucket that limits how fast they reconnect after losing the server.
+#
+# With trunk_size, phones don't get a connection each: they are carried trunk_size at a time over
+# PhoneTrunks (see trunk.py) instead, which reconnect on their own.  transports and serializer are
+# as for PhoneEmulator.  With media (a MediaStats; see media.py), connected calls carry audio frames.
+# talk_batch is handed to each (untrunked) phone.  With event_log (an EventLog; see event_log.py),
+# every phone logs each event it dispatches there.
+class PhoneEngine :
+
+    def __init__(self, server_url, ssl_verify=False, max_concurrent_connects=100, latency_recorder=None, trace=None,
+            reconnect_policy=None, trunk_size=None, transports=None, serializer='default', media=None, talk_batch=1,
+            event_log=None) :
+        self._server_url = server_url
+        self._ssl_verify = ssl_verify
+        self._max_concurrent_connects = max_concurrent_connects
+        self._latency_recorder = latency_recorder if latency_recorder is not None else LatencyRecorder()
+        self._trace = trace
+        self._reconnect_policy = reconnect_policy if reconnect_policy is not None else default_reconnect_policy()
+        self._trunk_size = trunk_size
+        self._transports = transports
+        self._serializer = serializer
+        self._media = media
+        self._talk_batch = talk_batch
+        self._event_log = event_log
+        self._http_session = None
+        self._phones = {}
+        self._trunks = []
+        self._tasks = []
+
+    @property
+    def phones(self) :
+        return self._phones
+
+    @property
+    def latency_recorder(self) :
+        return self._latency_recorder
+
+    @property
+    def reconnect_stats(self) :
+        return self._reconnect_policy.stats
+
+    @property
+    def media(self) :
+        return self._media
+
+    # The number of connections the phones use
+    @property
+    def connections(self) :
+        return len(self._trunks) if self._trunk_size else len(self._phones)
+
+    # Must be called on the loop the phones will run on
+    def add_phone(self, phone_number) :
+        if self._http_session is None :
+            # no limit on connections, as every phone keeps its own open
+            self._http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0,
+                ssl=self._ssl_verify))
+        if self._trunk_size :
+            if not self._trunks or len(self._trunks[-1]) >= self._trunk_size :
+                from trunk import PhoneTrunk
+                self._trunks.append(PhoneTrunk(self._server_url, self._ssl_verify, self._latency_recorder, self._trace,
+                    self._http_session, self._transports, self._serializer, self._media, self._event_log))
+            phone = self._trunks[-1].add_phone(phone_number)
+        else :
+            phone = AsyncPhoneEmulator(phone_number, self._server_url, self._ssl_verify,
+                latency_recorder=self._latency_recorder, http_session=self._http_session, trace=self._trace,
+                reconnect_policy=self._reconnect_policy, transports=self._transports, serializer=self._serializer,
+                media=self._media, talk_batch=self._talk_batch, event_log=self._event_log)
+        self._phones[phone_number] = phone
+        return phone
+
+    async def start(self) :
+        if self._trunks :
+            await asyncio.gather(*(trunk.start() for trunk in self._trunks))
+            return
+        # limit how many phones are in the middle of connecting at once, so a large fleet
+        # doesn't flood the server with simultaneous handshakes
+        limiter = asyncio.Semaphore(self._max_concurrent_connects)
+        for phone in self._phones.values() :
+            self._tasks.append(asyncio.create_task(phone.run(limiter)))
+
+    async def shutdown(self) :
+        await asyncio.gather(*(trunk.shutdown() for trunk in self._trunks), return_exceptions=True)
+        for phone in self._phones.values() :
+            phone.shutdown()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._http_session is not None :
+            await self._http_session.close()
+            self._http_session = None
+
+    async def run_until(self, stop_event) :
+        await self.start()
+        try :
+            await stop_event.wait()
+        finally :
+            await self.shutdown()
@@ -0,0 +1,678 @@
+import argparse
+import asyncio
+import gc
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+from async_phone_emulator import AsyncPhoneEmulator, PhoneEngine
+from phone_emulator import PhoneEmulator, PhoneEvent, PhoneEventType, PhoneState, PhoneStateMachine
+from profiling import HandlerProfile
+from talk_buffer import DEFAULT_CAPACITY
+from timer_wheel import ManualTimerWheel
+
+SERVER_URL = 'http://localhost:5000'
+# recorded traces (see event_trace.py) to replay as the dispatch regression corpus
+TRACE_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traces')
+
+# A phone with nothing attached, so only the state machine itself is measured
+class _BarePhone(PhoneStateMachine) :
+    __slots__ = ()
+
+    def _put_event(self, event) :
+        pass
+
+    def _emit(self, event, *args) :
+        pass
+
+# Stands in for socketio.Client, so PhoneEmulator.run can be timed without a server
+class _NullSocket :
+
+    def on(self, event, handler) :
+        pass
+
+    def connect(self, *args, **kwargs) :
+        pass
+
+    def emit(self, *args, **kwargs) :
+        pass
+
+    def disconnect(self) :
+        pass
+
+def _number(i) :
+    return str(i).zfill(4)
+
+# The events of one complete outgoing call with talk_lines lines each way
+def _call_events(callee, talk_lines) :
+    events = [PhoneEvent(PhoneEventType.OFF_HOOK)]
+    events.extend(PhoneEvent(PhoneEventType.KEY_PRESS, key) for key in callee)
+    events.append(PhoneEvent(PhoneEventType.CALLEE_RINGING))
+    events.append(PhoneEvent(PhoneEventType.CALL_CONNECTED))
+    for i in range(talk_lines) :
+        events.append(PhoneEvent(PhoneEventType.OUTGOING_TALK, f'line {i}'))
+        events.append(PhoneEvent(PhoneEventType.INCOMING_TALK, f'reply {i}'))
+    events.append(PhoneEvent(PhoneEventType.ON_HOOK))
+    return events
+
+def _register(phone) :
+    phone._dispatch(PhoneEvent(PhoneEventType.SERVER_CONNECT))
+    phone._dispatch(PhoneEvent(PhoneEventType.REGISTERED, phone._phone_number))
+
+# Events per second through PhoneEmulator.run (queue, thread wakeups and dispatch), and through
+# _dispatch alone, with handler profiling off and on
+def dispatch(calls=2000, talk_lines=20) :
+    events = _call_events('0002', talk_lines)
+    total = calls * len(events)
+
+    phone = PhoneEmulator('0001', SERVER_URL)
+    phone._sio = _NullSocket()
+    phone.start()
+    phone._socket_connect_event()
+    phone._socket_registered_event('0001')
+    phone._events.join()
+    started = time.perf_counter()
+    for _ in range(calls) :
+        for event in events :
+            phone._put_event(event)
+    phone._events.join()
+    run_elapsed = time.perf_counter() - started
+    phone.shutdown()
+    phone.join()
+
+    bare = _BarePhone('0001', SERVER_URL)
+    _register(bare)
+    started = time.perf_counter()
+    for _ in range(calls) :
+        for event in events :
+            bare._dispatch(event)
+    dispatch_elapsed = time.perf_counter() - started
+
+    # the same again with every handler timed (see profiling.py)
+    profiled = _BarePhone('0001', SERVER_URL, profile=HandlerProfile())
+    _register(profiled)
+    started = time.perf_counter()
+    for _ in range(calls) :
+        for event in events :
+            profiled._dispatch(event)
+    profiled_elapsed = time.perf_counter() - started
+
+    return {
+        'events' : total,
+        'run_loop_events_per_second' : round(total / run_elapsed),
+        'dispatch_events_per_second' : round(total / dispatch_elapsed),
+        'profiled_dispatch_events_per_second' : round(total / profiled_elapsed)
+    }
+
+def _measure_memory(factory, count) :
+    gc.collect()
+    tracemalloc.start()
+    try :
+        before = tracemalloc.get_traced_memory()[0]
+        phones = [factory(_number(i)) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+        del phones
+    finally :
+        tracemalloc.stop()
+    return (after - before) / count
+
+def _in_call(phone, talk_lines) :
+    _register(phone)
+    # everything up to hanging up
+    for event in _call_events('9999', talk_lines)[:-1] :
+        phone._dispatch(event)
+    if isinstance(phone, AsyncPhoneEmulator) :
+        phone._outbox.clear()
+    return phone
+
+async def _measure_async_memory(count, talk_lines) :
+    idle = _measure_memory(lambda number : AsyncPhoneEmulator(number, SERVER_URL), count)
+    in_call = _measure_memory(lambda number : _in_call(AsyncPhoneEmulator(number, SERVER_URL), talk_lines), count)
+    return idle, in_call
+
+# An unstarted PhoneEmulator (no socket.io client yet), registered as if it had connected
+def _registered_emulator(number, timers) :
+    phone = PhoneEmulator(number, SERVER_URL, timers=timers)
+    _register(phone)
+    return phone
+
+# Bytes allocated per idle (registered-but-unconnected) phone, and per phone in a call with
+# talk_lines lines each way on its display.  The threaded PhoneEmulator is measured idle and
+# unstarted, its phones sharing one timer wheel as they do by default.
+def memory(count=5000, talk_lines=10) :
+    async_idle, async_in_call = asyncio.run(_measure_async_memory(count, talk_lines))
+    timers = ManualTimerWheel()
+    return {
+        'count' : count,
+        'state_machine_idle_bytes' : round(_measure_memory(lambda number : _BarePhone(number, SERVER_URL), count)),
+        'state_machine_in_call_bytes' : round(_measure_memory(
+            lambda number : _in_call(_BarePhone(number, SERVER_URL), talk_lines), count)),
+        'async_emulator_idle_bytes' : round(async_idle),
+        'async_emulator_in_call_bytes' : round(async_in_call),
+        'emulator_idle_bytes' : round(_measure_memory(lambda number : _registered_emulator(number, timers), count))
+    }
+
+def _serve_switch(ports) :
+    from switch_server import SwitchServer
+
+    async def serve() :
+        server = SwitchServer()
+        ports.put(await server.start('localhost', 0))
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+# Runs switch_server.py in its own process (so it doesn't compete with the phones for the event
+# loop), returning the process and its url
+def _start_switch_server() :
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_switch, args=(ports,), daemon=True)
+    process.start()
+    return process, f'http://localhost:{ports.get(timeout=30)}'
+
+async def _wait_for(phones, state, timeout) :
+    deadline = time.perf_counter() + timeout
+    while True :
+        pending = sum(1 for phone in phones if phone.snapshot().state != state)
+        if not pending :
+            return
+        if time.perf_counter() > deadline :
+            raise TimeoutError(f'{pending} phones did not reach {state.name}')
+        await asyncio.sleep(0.005)
+
+def _latency_ms(histogram) :
+    summary = histogram.summary()
+    return {key : round(summary[key] / 1e6, 3) if summary[key] is not None else None for key in ('p50', 'p99', 'max')}
+
+async def _registration(server_url, count, timeout, trunk_size=None) :
+    engine = PhoneEngine(server_url, max_concurrent_connects=count, trunk_size=trunk_size)
+    for i in range(1, count + 1) :
+        engine.add_phone(_number(i))
+    started = time.perf_counter()
+    await engine.start()
+    try :
+        await _wait_for(engine.phones.values(), PhoneState.ON_HOOK_IDLE, timeout)
+        elapsed = time.perf_counter() - started
+    finally :
+        await engine.shutdown()
+    return {
+        'count' : count,
+        'registration_seconds' : round(elapsed, 3),
+        'registrations_per_second' : round(count / elapsed, 1),
+        'connect_to_registered_ms' : _latency_ms(engine.latency_recorder['connect_to_registered'])
+    }
+
+# Time for count phones to connect and register with a local switch_server.py
+def registration(count=1000, timeout=120.0) :
+    process, server_url = _start_switch_server()
+    try :
+        return asyncio.run(_registration(server_url, count, timeout))
+    finally :
+        process.terminate()
+        process.join()
+
+# pairs * 2 phones on engine, callees answering whenever they ring
+def _add_call_pairs(engine, pairs) :
+    callers = [engine.add_phone(_number(i)) for i in range(1, pairs + 1)]
+    callees = [engine.add_phone(_number(i)) for i in range(pairs + 1, 2 * pairs + 1)]
+
+    def answer(snapshot, changed) :
+        if snapshot.state == PhoneState.INCOMING_CALL_RINGING :
+            engine.phones[snapshot.phone_number].off_hook()
+    for callee in callees :
+        callee.subscribe(answer, ('state',))
+    return callers, callees
+
+# Every caller calls its callee (saying talk_lines, if any, once connected) and hangs up.  Returns
+# the time taken to connect the calls.
+async def _call_round(engine, callers, callees, timeout, talk_lines=()) :
+    started = time.perf_counter()
+    for caller, callee in zip(callers, callees) :
+        caller.off_hook()
+        for key in callee.snapshot().phone_number :
+            caller.key_press(key)
+    await _wait_for(callers, PhoneState.CALL_CONNECTED, timeout)
+    setup_time = time.perf_counter() - started
+
+    for line in talk_lines :
+        for caller in callers :
+            caller.talk(line)
+    for caller in callers :
+        caller.on_hook()
+    await _wait_for(callees, PhoneState.CALL_ENDED, timeout)
+    for callee in callees :
+        callee.on_hook()
+    await _wait_for(engine.phones.values(), PhoneState.ON_HOOK_IDLE, timeout)
+    return setup_time
+
+async def _call_setups(server_url, pairs, rounds, timeout, trunk_size=None) :
+    engine = PhoneEngine(server_url, max_concurrent_connects=pairs * 2, trunk_size=trunk_size)
+    callers, callees = _add_call_pairs(engine, pairs)
+    await engine.start()
+    try :
+        await _wait_for(engine.phones.values(), PhoneState.ON_HOOK_IDLE, timeout)
+        setup_time = 0.0
+        for _ in range(rounds) :
+            setup_time += await _call_round(engine, callers, callees, timeout)
+    finally :
+        await engine.shutdown()
+
+    recorder = engine.latency_recorder
+    return {
+        'calls' : pairs * rounds,
+        'call_setups_per_second' : round(pairs * rounds / setup_time, 1),
+        'make_call_to_ringing_ms' : _latency_ms(recorder['make_call_to_ringing']),
+        'ringing_to_connected_ms' : _latency_ms(recorder['ringing_to_connected']),
+        'hang_up_to_call_ended_ms' : _latency_ms(recorder['hang_up_to_call_ended'])
+    }
+
+# End-to-end call setups per second against a local switch_server.py: pairs simultaneous calls
+# (dial, ring, answer, connect), rounds times over
+def call_setups(pairs=250, rounds=4, timeout=120.0) :
+    process, server_url = _start_switch_server()
+    try :
+        return asyncio.run(_call_setups(server_url, pairs, rounds, timeout))
+    finally :
+        process.terminate()
+        process.join()
+
+# Connections against call setup rates and latencies, with pairs * 2 phones each on their own
+# connection (trunk size 1) and then carried over trunks of each of trunk_sizes
+def trunking(pairs=250, rounds=2, trunk_sizes=(10, 100, 500), timeout=120.0) :
+    process, server_url = _start_switch_server()
+    results = {}
+    try :
+        for trunk_size in (None,) + tuple(trunk_sizes) :
+            registration = asyncio.run(_registration(server_url, pairs * 2, timeout, trunk_size))
+            setups = asyncio.run(_call_setups(server_url, pairs, rounds, timeout, trunk_size))
+            results[f'trunk_size_{trunk_size or 1}'] = {
+                'connections' : -(-pairs * 2 // (trunk_size or 1)),
+                'registration_seconds' : registration['registration_seconds'],
+                'call_setups_per_second' : setups['call_setups_per_second'],
+                'make_call_to_ringing_ms' : setups['make_call_to_ringing_ms'],
+                'ringing_to_connected_ms' : setups['ringing_to_connected_ms']
+            }
+    finally :
+        process.terminate()
+        process.join()
+    return results
+
+# Counts the bytes through a TCP proxy in front of port, in each direction
+async def _counting_proxy(port, counts) :
+    async def pipe(reader, writer, direction) :
+        try :
+            while True :
+                data = await reader.read(65536)
+                if not data :
+                    break
+                counts[direction] += len(data)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError :
+            pass
+        finally :
+            writer.close()
+
+    async def connected(client_reader, client_writer) :
+        server_reader, server_writer = await asyncio.open_connection('localhost', port)
+        await asyncio.gather(pipe(client_reader, server_writer, 'bytes_in'),
+            pipe(server_reader, client_writer, 'bytes_out'))
+
+    proxy = await asyncio.start_server(connected, 'localhost', 0)
+    return proxy.sockets[0].getsockname()[1]
+
+# Runs a switch_server.py with the given serializer (and TLS certificate, if any) behind a counting
+# proxy.  Sends the proxy's port down conn, then answers every message on it with the bytes and
+# messages seen so far and the CPU time used.
+def _serve_measured_switch(conn, serializer, certfile) :
+    from switch_server import SwitchServer, server_ssl_context
+
+    async def serve() :
+        server = SwitchServer(serializer=serializer)
+        port = await server.start('localhost', 0, server_ssl_context(certfile) if certfile is not None else None)
+        counts = {'bytes_in' : 0, 'bytes_out' : 0}
+        conn.send(await _counting_proxy(port, counts))
+        loop = asyncio.get_running_loop()
+        while True :
+            await loop.run_in_executor(None, conn.recv)
+            conn.send(dict(counts, messages=server.messages_received + server.messages_sent,
+                cpu_seconds=time.process_time()))
+    asyncio.run(serve())
+
+# A throwaway self-signed certificate (and key) for localhost, or None without the openssl command
+def _self_signed_certificate(directory) :
+    import shutil
+    import subprocess
+
+    openssl = shutil.which('openssl')
+    if openssl is None :
+        return None
+    path = os.path.join(directory, 'localhost.pem')
+    result = subprocess.run([openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=localhost', '-keyout', path, '-out', path], capture_output=True)
+    return path if result.returncode == 0 else None
+
+async def _measure_transport(server_url, stats, pairs, rounds, talk_lines, timeout, transports, serializer) :
+    engine = PhoneEngine(server_url, max_concurrent_connects=pairs * 2, transports=transports, serializer=serializer)
+    callers, callees = _add_call_pairs(engine, pairs)
+    await engine.start()
+    try :
+        await _wait_for(engine.phones.values(), PhoneState.ON_HOOK_IDLE, timeout)
+        before = stats()
+        cpu = time.process_time()
+        for _ in range(rounds) :
+            await _call_round(engine, callers, callees, timeout, talk_lines)
+        cpu = time.process_time() - cpu
+        after = stats()
+    finally :
+        await engine.shutdown()
+
+    calls = pairs * rounds
+    messages = after['messages'] - before['messages']
+    return {
+        'connect_to_registered_ms' : _latency_ms(engine.latency_recorder['connect_to_registered']),
+        'call_sent_bytes' : round((after['bytes_in'] - before['bytes_in']) / calls),
+        'call_received_bytes' : round((after['bytes_out'] - before['bytes_out']) / calls),
+        'call_messages' : round(messages / calls, 1),
+        'phone_message_cpu_us' : round(cpu / messages * 1e6, 1),
+        'switch_message_cpu_us' : round((after['cpu_seconds'] - before['cpu_seconds']) / messages * 1e6, 1)
+    }
+
+# Connect latency, bytes on the wire (both ways, per call) and CPU per message, phones' and
+# switch's, for pairs * 2 phones making rounds of calls (with talk_lines lines each) against a local
+# switch_server.py, for every combination of transport (long-polling then upgrading, the socketio
+# default, or straight to websocket), serializer (JSON text or msgpack) and TLS.  msgpack and TLS
+# are skipped if msgpack isn't installed or there's no openssl command to make a certificate.
+def transports(pairs=100, rounds=4, talk_lines=5, timeout=120.0) :
+    talk = [f'line {i}' for i in range(talk_lines)]
+    serializers = ['default']
+    try :
+        import msgpack
+        serializers.append('msgpack')
+    except ImportError :
+        pass
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory :
+        certfiles = {'plain' : None}
+        certfile = _self_signed_certificate(directory)
+        if certfile is not None :
+            certfiles['tls'] = certfile
+        for security, certfile in certfiles.items() :
+            for serializer in serializers :
+                conn, child_conn = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=_serve_measured_switch,
+                    args=(child_conn, serializer, certfile), daemon=True)
+                process.start()
+                try :
+                    if not conn.poll(30) :
+                        raise TimeoutError('switch_server.py did not start')
+                    server_url = f'{"https" if certfile else "http"}://localhost:{conn.recv()}'
+                    def stats() :
+                        conn.send(None)
+                        return conn.recv()
+                    for transport in ('polling', 'websocket') :
+                        name = f'{transport}_{"json" if serializer == "default" else serializer}_{security}'
+                        results[name] = asyncio.run(_measure_transport(server_url, stats, pairs, rounds, talk, timeout,
+                            ['websocket'] if transport == 'websocket' else None, serializer))
+                finally :
+                    process.terminate()
+                    process.join()
+    if 'msgpack' not in serializers :
+        results['msgpack_skipped'] = 'msgpack is not installed'
+    if 'tls' not in certfiles :
+        results['tls_skipped'] = 'no openssl command to make a certificate'
+    return results
+
+async def _talk_delivery(server_url, pairs, messages, talk_batch, timeout) :
+    engine = PhoneEngine(server_url, max_concurrent_connects=pairs * 2, talk_batch=talk_batch)
+    callers, callees = _add_call_pairs(engine, pairs)
+    await engine.start()
+    try :
+        await _wait_for(engine.phones.values(), PhoneState.ON_HOOK_IDLE, timeout)
+        for caller, callee in zip(callers, callees) :
+            caller.off_hook()
+            for key in callee.snapshot().phone_number :
+                caller.key_press(key)
+        await _wait_for(engine.phones.values(), PhoneState.CALL_CONNECTED, timeout)
+
+        message = 'x' * 32
+        expected = [callee.snapshot().transcript_lines + messages for callee in callees]
+        offered = [0] * pairs
+        started = time.perf_counter()
+        # keep each caller's talk buffer topped up (so nothing is dropped) until everything has
+        # been queued, then wait for the last message to reach its callee
+        while any(count < messages for count in offered) :
+            for i, caller in enumerate(callers) :
+                room = min(messages - offered[i], DEFAULT_CAPACITY - caller.talk_stats()['pending'])
+                if room > 0 :
+                    offered[i] += caller.talk_many(itertools.repeat(message, room))
+            await asyncio.sleep(0)
+        while any(callee.snapshot().transcript_lines < lines for callee, lines in zip(callees, expected)) :
+            if time.perf_counter() - started > timeout :
+                raise TimeoutError(f'Talk not delivered within {timeout}s')
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally :
+        await engine.shutdown()
+
+    stats = [caller.talk_stats() for caller in callers]
+    return {
+        'seconds' : round(elapsed, 3),
+        'emits' : sum(stat['batches'] for stat in stats),
+        'dropped' : sum(stat['dropped'] for stat in stats),
+        'messages_per_second' : round(pairs * messages / elapsed),
+        'call_messages_per_second' : round(messages / elapsed)
+    }
+
+# Talk messages per second delivered phone to phone through a local switch_server.py, with pairs
+# simultaneous calls each carrying messages messages, sent one per emit and then in batches of
+# each of talk_batches (see talk_buffer.py)
+def talk_throughput(pairs=10, messages=2000, talk_batches=(1, 10, 100), timeout=120.0) :
+    process, server_url = _start_switch_server()
+    try :
+        return {f'talk_batch_{talk_batch}' : asyncio.run(_talk_delivery(server_url, pairs, messages, talk_batch,
+            timeout)) for talk_batch in talk_batches}
+    finally :
+        process.terminate()
+        process.join()
+
+# The cost of PhoneGui.notify (paid on the emulator's thread) and of a redraw (on the Tk thread)
+# while a call's transcript grows.  Skipped without a display.
+def gui_notify(notifies=100000, renders=2000) :
+    try :
+        import tkinter as tk
+        from phone_gui import PhoneGui
+        root = tk.Tk()
+    except Exception as e :
+        return {'skipped' : f'no display: {e}'}
+
+    try :
+        root.withdraw()
+        phone = _in_call(_BarePhone('0001', SERVER_URL), 0)
+        gui = PhoneGui(phone, root)
+        started = time.perf_counter()
+        for _ in range(notifies) :
+            gui.notify()
+        notify_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i in range(renders) :
+            phone._dispatch(PhoneEvent(PhoneEventType.INCOMING_TALK, f'line {i}'))
+            gui._render()
+        render_elapsed = time.perf_counter() - started
+        gui.shutdown(close_phone=False)
+    finally :
+        try :
+            root.destroy()
+        except Exception :
+            pass
+    return {
+        'notify_us' : round(notify_elapsed / notifies * 1e6, 3),
+        'render_us' : round(render_elapsed / renders * 1e6, 1)
+    }
+
+# The cost of a dashboard tick (see dashboard.py) watching count phones, while one in every
+# changing_every of them gets a new line each tick.  Skipped without a display.
+def dashboard_tick(count=10000, rows=30, ticks=200, changing_every=100) :
+    try :
+        import tkinter as tk
+        from dashboard import PhoneDashboard
+        root = tk.Tk()
+    except Exception as e :
+        return {'skipped' : f'no display: {e}'}
+
+    try :
+        root.withdraw()
+        phones = [_in_call(_BarePhone(_number(i), SERVER_URL), 0) for i in range(count)]
+        dashboard = PhoneDashboard(phones, root, rows)
+        elapsed = 0.0
+        for tick in range(ticks) :
+            for phone in phones[tick % changing_every::changing_every] :
+                phone._dispatch(PhoneEvent(PhoneEventType.INCOMING_TALK, f'line {tick}'))
+            started = time.perf_counter()
+            # scrolling redraws every row, and then some of them have changed as well
+            dashboard.scroll_to(tick % changing_every)
+            dashboard._render()
+            elapsed += time.perf_counter() - started
+        dashboard.shutdown()
+    finally :
+        try :
+            root.destroy()
+        except Exception :
+            pass
+    return {'tick_ms' : round(elapsed / ticks * 1e3, 3)}
+
+# A trace of calls between count simulated phones, for when the corpus is empty
+def _record_simulated_trace(path, count=100, calls=500, seed=0) :
+    from simulation import SimulatedFleet
+
+    rng = random.Random(seed)
+    numbers = [_number(i) for i in range(1, count + 1)]
+    fleet = SimulatedFleet(numbers, trace_path=path)
+    for phone in fleet.phones.values() :
+        phone.auto_answer(rng.uniform(1.0, 5.0))
+    fleet.start()
+    for _ in range(calls) :
+        caller, callee = rng.sample(numbers, 2)
+        talk = [f'line {i}' for i in range(rng.randrange(10))]
+        fleet.phones[caller].place_call(rng.uniform(1.0, 3600.0), callee, rng.expovariate(1.0 / 180.0), talk)
+    fleet.run(3600.0)
+    fleet.shutdown()
+
+# Events per second replaying every trace in corpus through the state machine (see
+# event_trace.py).  With no traces there, one of simulated calls is recorded and replayed instead.
+def replay(corpus=TRACE_CORPUS) :
+    from event_trace import Trace, replay as replay_trace
+
+    paths = sorted(glob.glob(os.path.join(corpus, '*.trace')))
+    with tempfile.TemporaryDirectory() as directory :
+        if not paths :
+            paths = [os.path.join(directory, 'simulated.trace')]
+            _record_simulated_trace(paths[0])
+        traces = [Trace.load(path) for path in paths]
+
+    events = 0
+    elapsed = 0.0
+    divergences = 0
+    for trace in traces :
+        divergences += len(replay_trace(trace)['divergences'])
+        results = replay_trace(trace, verify=False)
+        events += results['events']
+        elapsed += results['replay_seconds']
+    return {
+        'traces' : len(traces),
+        'events' : events,
+        'divergences' : divergences,
+        'replay_events_per_second' : round(events / elapsed) if elapsed > 0 else None
+    }
+
+BENCHMARKS = {
+    'dispatch' : dispatch,
+    'replay' : replay,
+    'memory' : memory,
+    'registration' : registration,
+    'call_setups' : call_setups,
+    'trunking' : trunking,
+    'transports' : transports,
+    'talk_throughput' : talk_throughput,
+    'gui_notify' : gui_notify,
+    'dashboard_tick' : dashboard_tick
+}
+
+# Whether a bigger value of metric is better (True), worse (False), or not comparable (None)
+def _higher_is_better(metric) :
+    if metric.endswith('_per_second') :
+        return True
+    if metric.endswith(('_bytes', '_seconds', '_us', '_ms', 'p50', 'p99', 'max')) :
+        return False
+    return None
+
+def _flatten(results, prefix='') :
+    flat = {}
+    for key, value in results.items() :
+        if isinstance(value, dict) :
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) :
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+# Compares two sets of results (as saved by --save).  Returns a list of (metric, baseline, current,
+# change) for every metric that got worse by more than tolerance (a fraction).
+def compare(baseline, current, tolerance=0.1) :
+    regressions = []
+    baseline = _flatten(baseline.get('results', baseline))
+    current = _flatten(current.get('results', current))
+    for metric, old in baseline.items() :
+        new = current.get(metric)
+        higher_is_better = _higher_is_better(metric)
+        if new is None or higher_is_better is None or not old :
+            continue
+        change = (new - old) / old
+        if (change < -tolerance) if higher_is_better else (change > tolerance) :
+            regressions.append((metric, old, new, change))
+    return regressions
+
+def run(names) :
+    return {
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'results' : {name : BENCHMARKS[name]() for name in names}
+    }
+
+if __name__ == '__main__' :
+    import sys
+
+    parser = argparse.ArgumentParser(description='Benchmarks for the phone emulator.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+        help=f'Benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--save', metavar='PATH', help='Save the results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against results saved earlier, failing on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed regression before --compare fails (default 0.1)')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown :
+        parser.error(f'unknown benchmarks: {", ".join(unknown)}')
+
+    results = run(args.benchmarks or list(BENCHMARKS))
+    print(json.dumps(results, indent=2))
+    if args.save is not None :
+        with open(args.save, 'w', encoding='utf-8') as f :
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None :
+        with open(args.compare, encoding='utf-8') as f :
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for metric, old, new, change in regressions :
+            print(f'REGRESSION {metric}: {old} -> {new} ({change:+.1%})')
+        if regressions :
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%} against {args.compare}')
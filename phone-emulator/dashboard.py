@@ -0,0 +1,180 @@
+import tkinter as tk
+from collections import Counter
+
+# refresh the visible rows this often, however fast the phones are changing
+TICK_MS = 100
+DEFAULT_ROWS = 30
+# heading, width in characters
+COLUMNS = (('Number', 8), ('State', 24), ('Hook', 9), ('Sound', 24), ('Dialed', 8), ('Last line', 48))
+
+# What a dashboard row shows for a phone, one value per column
+def row_values(snapshot) :
+    return (snapshot.phone_number, snapshot.state.name, 'On hook' if snapshot.on_hook else 'Off hook',
+        snapshot.sound.value, snapshot.number_dialed, snapshot.last_line or '')
+
+# How many of snapshots are in each state, most common first
+def summary_text(snapshots) :
+    counts = Counter(snapshot.state.name for snapshot in snapshots)
+    total = sum(counts.values())
+    states = ', '.join(f'{count} {state}' for state, count in counts.most_common())
+    return f'{total} phones: {states}' if states else f'{total} phones'
+
+# A single window showing a whole fleet of phones (anything with a snapshot(), on any thread) as a
+# table, one row per phone.  Only the rows on screen have widgets, and those are reused as the
+# table scrolls; every TICK_MS they're brought up to date from the phones' snapshots, touching
+# only the cells whose phone has published a new snapshot since.  So the cost of a tick depends on
+# the number of rows shown, not the number of phones (apart from the summary line's count).
+class PhoneDashboard(tk.Frame) :
+    def __init__(self, phones, master=None, rows=DEFAULT_ROWS) :
+        super().__init__(master)
+
+        self._phones = list(phones)
+        self._index = {phone.snapshot().phone_number : i for i, phone in enumerate(self._phones)}
+        self._rows = rows
+        self._first = 0
+        self._after_id = None
+
+        self.summary_label = tk.Label(self, anchor='w')
+        self.find_entry = tk.Entry(self, width=10)
+        self.find_entry.bind('<Return>', self.find)
+        self.find_button = tk.Button(self, text='Find', command=self.find)
+
+        self.table_frame = tk.Frame(self)
+        for column, (heading, width) in enumerate(COLUMNS) :
+            tk.Label(self.table_frame, text=heading, width=width, anchor='w', font=('Arial', 10, 'bold')).grid(
+                row=0, column=column, sticky='w')
+        self._cells = [[tk.Label(self.table_frame, width=width, anchor='w', font=('Courier', 10))
+            for _, width in COLUMNS] for _ in range(rows)]
+        for row, cells in enumerate(self._cells) :
+            for column, cell in enumerate(cells) :
+                cell.grid(row=row + 1, column=column, sticky='w')
+        self.table_scroll = tk.Scrollbar(self, command=self._on_scroll)
+
+        # what each row is showing: the snapshot it was drawn from and the values in its cells
+        self._shown_snapshots = [None] * rows
+        self._shown_values = [(None,) * len(COLUMNS) for _ in range(rows)]
+
+        for widget in [self.table_frame] + [cell for cells in self._cells for cell in cells] :
+            widget.bind('<MouseWheel>', self._on_mouse_wheel)
+            # X11 reports the wheel as buttons 4 and 5
+            widget.bind('<Button-4>', lambda event : self.scroll_to(self._first - 3))
+            widget.bind('<Button-5>', lambda event : self.scroll_to(self._first + 3))
+
+        self.summary_label.grid(row=0, column=0, sticky='we')
+        self.find_entry.grid(row=0, column=1)
+        self.find_button.grid(row=0, column=2)
+        self.table_frame.grid(row=1, column=0, columnspan=3, sticky='nw')
+        self.table_scroll.grid(row=1, column=3, sticky='ns')
+
+        self._render()
+        self._after_id = self.after(TICK_MS, self._tick)
+
+    @property
+    def first_row(self) :
+        return self._first
+
+    # Scrolls so the phone at index first is the top row
+    def scroll_to(self, first) :
+        first = max(0, min(first, len(self._phones) - self._rows))
+        if first != self._first :
+            self._first = first
+            self._render()
+
+    # Scrolls to the phone number typed into the find box
+    def find(self, event=None) :
+        index = self._index.get(self.find_entry.get().strip())
+        if index is not None :
+            self.scroll_to(index)
+
+    def _on_scroll(self, action, amount, units=None) :
+        if action == 'moveto' :
+            self.scroll_to(round(float(amount) * len(self._phones)))
+        elif units == 'pages' :
+            self.scroll_to(self._first + int(amount) * self._rows)
+        else :
+            self.scroll_to(self._first + int(amount))
+
+    def _on_mouse_wheel(self, event) :
+        self.scroll_to(self._first - (3 if event.delta > 0 else -3))
+
+    def _tick(self) :
+        self._render()
+        self._after_id = self.after(TICK_MS, self._tick)
+
+    def _render(self) :
+        phones = self._phones
+        first = self._first
+        for row, cells in enumerate(self._cells) :
+            index = first + row
+            snapshot = phones[index].snapshot() if index < len(phones) else None
+            # snapshots are immutable and replaced as a whole, so an unchanged row is the same object
+            if snapshot is self._shown_snapshots[row] :
+                continue
+            self._shown_snapshots[row] = snapshot
+            values = row_values(snapshot) if snapshot is not None else ('',) * len(COLUMNS)
+            shown = self._shown_values[row]
+            for column, value in enumerate(values) :
+                if value != shown[column] :
+                    cells[column].config(text=value)
+            self._shown_values[row] = values
+
+        self.summary_label.config(text=summary_text(phone.snapshot() for phone in phones))
+        if phones :
+            self.table_scroll.set(first / len(phones), min(1.0, (first + self._rows) / len(phones)))
+        else :
+            self.table_scroll.set(0.0, 1.0)
+
+    def shutdown(self) :
+        if self._after_id is not None :
+            self.after_cancel(self._after_id)
+            self._after_id = None
+        self.master.destroy()
+
+def create_dashboard(phones, rows=DEFAULT_ROWS) :
+    tk_root = tk.Tk()
+    tk_root.title('Phones')
+    dashboard = PhoneDashboard(phones, tk_root, rows)
+    dashboard.pack(fill=tk.BOTH, expand=True)
+    tk_root.protocol('WM_DELETE_WINDOW', dashboard.shutdown)
+    tk_root.mainloop()
+
+if __name__ == '__main__' :
+    import argparse
+    import asyncio
+    import threading
+
+    from async_phone_emulator import PhoneEngine
+    from fleet import parse_number_range
+
+    parser = argparse.ArgumentParser(description='Run a fleet of phone emulators in this process and watch them in one window.')
+    parser.add_argument('numbers', metavar='RANGE', help='Phone numbers to run, e.g. 0001-4999')
+    parser.add_argument('server_url', default='http://localhost:5000', nargs='?')
+    parser.add_argument('--ssl_verify', action='store_true', help='Verify SSL certificates')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='Number of rows shown at once')
+    parser.add_argument('--max_concurrent_connects', type=int, default=100,
+        help='Maximum number of phones connecting at once')
+    parser.add_argument('--trunk_size', type=int,
+        help='Carry this many phones over each connection, one socket.io namespace per phone (needs switch_server.py)')
+    args = parser.parse_args()
+
+    # the phones run on an event loop of their own, and the dashboard only reads their snapshots
+    started = threading.Event()
+    engine_state = {}
+
+    async def run_engine() :
+        engine = PhoneEngine(args.server_url, args.ssl_verify, args.max_concurrent_connects, trunk_size=args.trunk_size)
+        for number in parse_number_range(args.numbers) :
+            engine.add_phone(number)
+        stop = asyncio.Event()
+        engine_state.update(engine=engine, loop=asyncio.get_running_loop(), stop=stop)
+        started.set()
+        await engine.run_until(stop)
+
+    engine_thread = threading.Thread(target=asyncio.run, args=(run_engine(),))
+    engine_thread.start()
+    started.wait()
+    try :
+        create_dashboard(engine_state['engine'].phones.values(), args.rows)
+    finally :
+        engine_state['loop'].call_soon_threadsafe(engine_state['stop'].set)
+        engine_thread.join()
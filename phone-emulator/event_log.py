@@ -0,0 +1,222 @@
+import heapq
+import json
+import struct
+import threading
+import time
+
+from phone_emulator import PhoneEventType, PhoneState
+
+MAGIC = b'PHEVLOG1'
+# records the ring holds before the writer has to catch up
+DEFAULT_CAPACITY = 1 << 16
+# how often the writer wakes up to flush, if the ring isn't filling faster than that
+FLUSH_INTERVAL = 0.1
+
+# Record flags
+HANDLED = 1     # the event had a handler in the state it arrived in
+
+# nanoseconds since the epoch (so that logs from different processes can be merged), phone number
+# (ASCII, NUL padded), state before, state after, event type, flags, payload size
+_RECORD = struct.Struct('<q8sBBBBI')
+RECORD_SIZE = _RECORD.size
+# the longest phone number a record has room for
+MAX_NUMBER_LENGTH = 8
+
+class EventLogException(Exception) :
+    pass
+
+# A rough size for an event's data: characters of text, bytes of binary, and the sum over lists
+def _payload_size(data) :
+    if data is None :
+        return 0
+    if isinstance(data, (str, bytes, bytearray)) :
+        return len(data)
+    if isinstance(data, (list, tuple)) :
+        return sum(_payload_size(item) for item in data)
+    return 0
+
+# One dispatched event, as read back from a log
+class EventRecord :
+    __slots__ = ('timestamp', 'phone_number', 'before', 'after', 'event', 'handled', 'payload_size')
+
+    def __init__(self, timestamp, phone_number, before, after, event, handled, payload_size) :
+        self.timestamp = timestamp
+        self.phone_number = phone_number
+        self.before = before
+        self.after = after
+        self.event = event
+        self.handled = handled
+        self.payload_size = payload_size
+
+    def __lt__(self, other) :
+        return self.timestamp < other.timestamp
+
+    def to_dict(self) :
+        return {
+            'timestamp' : self.timestamp,
+            'phone_number' : self.phone_number,
+            'before' : self.before.name,
+            'after' : self.after.name,
+            'event' : self.event.name,
+            'handled' : self.handled,
+            'payload_size' : self.payload_size
+        }
+
+    def __str__(self) :
+        seconds, nanoseconds = divmod(self.timestamp, 1000000000)
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds)) + f'.{nanoseconds // 1000:06d}'
+        outcome = f'{self.before.name} -> {self.after.name}' if self.handled else f'{self.before.name} (ignored)'
+        return f'{when} {self.phone_number} {self.event.name} {outcome} {self.payload_size}'
+
+# Logs a fixed-size record of every event dispatched by the phones it is given to (see
+# PhoneStateMachine._apply).  Records are packed into a preallocated ring under a lock held for
+# nothing more than that, and a background thread writes them out in batches, so the phones never
+# wait on the disk.  If the writer falls a whole ring behind, new records are dropped (and
+# counted) rather than holding a phone up.  One log can be shared by all of the phones in a process.
+class EventLog :
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, flush_interval=FLUSH_INTERVAL, clock=time.time_ns) :
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._clock = clock
+        self._capacity = capacity
+        self._flush_interval = flush_interval
+        self._ring = bytearray(capacity * RECORD_SIZE)
+        # records are written at _head, and the writer takes them from _tail; everything before
+        # _written has reached the file
+        self._head = 0
+        self._tail = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._closing = False
+        self.logged = 0
+        self.dropped = 0
+        self._numbers = {}
+        self._writer = threading.Thread(target=self._run, name='event-log', daemon=True)
+        self._writer.start()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *args) :
+        self.close()
+
+    @property
+    def capacity(self) :
+        return self._capacity
+
+    # Checks that phone_number fits in a record (phones are registered as they're created, so a
+    # number that doesn't fit fails there rather than in the middle of dispatching an event)
+    def register(self, phone_number) :
+        number = self._numbers.get(phone_number)
+        if number is None :
+            number = phone_number.encode('ascii')
+            if len(number) > MAX_NUMBER_LENGTH :
+                raise EventLogException(f'Phone number {phone_number} is too long for the event log '
+                    f'(at most {MAX_NUMBER_LENGTH} characters)')
+            self._numbers[phone_number] = number
+        return number
+
+    def record(self, phone_number, before, after, event, handled=True) :
+        number = self._numbers.get(phone_number)
+        if number is None :
+            number = self.register(phone_number)
+        size = _payload_size(event.data)
+        with self._lock :
+            head = self._head
+            if head - self._tail >= self._capacity :
+                self.dropped += 1
+                return
+            _RECORD.pack_into(self._ring, (head % self._capacity) * RECORD_SIZE, self._clock(), number, before,
+                after, event.type, HANDLED if handled else 0, size)
+            self._head = head + 1
+            self.logged += 1
+            # wake the writer early once the ring is half full
+            if head - self._tail == self._capacity // 2 :
+                self._wakeup.set()
+
+    def _run(self) :
+        while True :
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            closing = self._closing
+            self._write_pending()
+            if closing :
+                return
+
+    def _write_pending(self) :
+        with self._lock :
+            head = self._head
+            tail = self._tail
+            if head == tail :
+                self._flushed.notify_all()
+                return
+            start = (tail % self._capacity) * RECORD_SIZE
+            end = (head % self._capacity) * RECORD_SIZE
+            # copied out under the lock, and written once it's been let go
+            if head - tail < self._capacity and start < end :
+                chunk = bytes(self._ring[start:end])
+            else :
+                chunk = bytes(self._ring[start:]) + bytes(self._ring[:end])
+            self._tail = head
+        self._file.write(chunk)
+        with self._lock :
+            self._written = head
+            self._flushed.notify_all()
+
+    # Blocks until everything recorded so far is on its way to the file
+    def flush(self) :
+        with self._lock :
+            target = self._head
+            self._wakeup.set()
+            self._flushed.wait_for(lambda : self._written >= target or self._writer is None)
+        if self._file is not None :
+            self._file.flush()
+
+    def close(self) :
+        writer = self._writer
+        if writer is None :
+            return
+        self._closing = True
+        self._wakeup.set()
+        writer.join()
+        with self._lock :
+            self._writer = None
+            self._flushed.notify_all()
+        self._file.close()
+        self._file = None
+
+# Reads a log back, as a list of EventRecords in the order they were logged.  A log cut short by a
+# crash is read up to its last complete record.
+def load(path) :
+    with open(path, 'rb') as f :
+        data = f.read()
+    if not data.startswith(MAGIC) :
+        raise EventLogException(f'{path} is not a phone emulator event log')
+    end = len(MAGIC) + (len(data) - len(MAGIC)) // RECORD_SIZE * RECORD_SIZE
+    return [EventRecord(timestamp, number.rstrip(b'\0').decode('ascii'), PhoneState(before), PhoneState(after),
+        PhoneEventType(event), bool(flags & HANDLED), size)
+        for timestamp, number, before, after, event, flags, size in _RECORD.iter_unpack(data[len(MAGIC):end])]
+
+# The records of several logs (say, one per fleet worker) merged into a single timeline
+def merge(paths) :
+    return list(heapq.merge(*(load(path) for path in paths)))
+
+if __name__ == '__main__' :
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print phone emulator event logs, merged into one timeline.')
+    parser.add_argument('paths', nargs='+', metavar='PATH', help='Event logs, e.g. one per fleet worker')
+    parser.add_argument('--jsonl', action='store_true', help='Print one JSON object per line')
+    parser.add_argument('--phone', help='Only print this phone\'s events')
+    args = parser.parse_args()
+
+    try :
+        for record in merge(args.paths) :
+            if args.phone is not None and record.phone_number != args.phone :
+                continue
+            print(json.dumps(record.to_dict()) if args.jsonl else record)
+    except BrokenPipeError :
+        pass
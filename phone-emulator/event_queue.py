@@ -0,0 +1,51 @@
+from collections import deque
+import threading
+
+# A queue with a single consumer that takes everything pending in one go.  Producers pay one lock
+# acquisition per put, and the consumer wakes (and takes the lock) once per burst of events rather
+# than once per event.  task_done and join work like queue.Queue's, except that task_done can mark
+# a whole batch as done at once.
+class EventQueue :
+
+    def __init__(self) :
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._unfinished = 0
+
+    def __len__(self) :
+        return len(self._items)
+
+    def put(self, item) :
+        with self._lock :
+            self._items.append(item)
+            self._unfinished += 1
+            self._not_empty.notify()
+
+    # Blocks until there is at least one item, then returns all of them in order
+    def get_batch(self, timeout=None) :
+        with self._lock :
+            if not self._items and not self._not_empty.wait_for(lambda : self._items, timeout) :
+                return []
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def get(self) :
+        with self._lock :
+            self._not_empty.wait_for(lambda : self._items)
+            return self._items.popleft()
+
+    def task_done(self, count=1) :
+        with self._lock :
+            unfinished = self._unfinished - count
+            if unfinished < 0 :
+                raise ValueError('task_done() called too many times')
+            self._unfinished = unfinished
+            if unfinished == 0 :
+                self._all_done.notify_all()
+
+    def join(self) :
+        with self._lock :
+            self._all_done.wait_for(lambda : self._unfinished == 0)
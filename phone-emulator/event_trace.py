@@ -0,0 +1,323 @@
+import json
+import random
+import struct
+import threading
+import time
+
+from phone_emulator import PhoneEvent, PhoneEventType, PhoneState, PhoneStateMachine
+from reconnect import ReconnectPolicy
+
+MAGIC = b'PHTRACE1'
+# buffered records are written out once there are this many bytes of them
+FLUSH_BYTES = 1 << 16
+
+# Record kinds
+PHONE = 0       # a phone joins the trace; the payload is its number, and phones are numbered in order
+EVENT = 1       # an event reached the state machine (code is the PhoneEventType)
+TRANSITION = 2  # the event's handler ran (code is the new PhoneState)
+
+# Payload encodings
+_NONE = 0
+_STR = 1
+_JSON = 2
+_BYTES = 3
+
+# kind, phone, code, payload encoding, nanoseconds since the trace started.  A payload follows as
+# a 4 byte length and the bytes, unless the encoding is _NONE.
+_HEADER = struct.Struct('<BHBBq')
+_LENGTH = struct.Struct('<I')
+
+class TraceException(Exception) :
+    pass
+
+def _encode(data) :
+    if data is None :
+        return _NONE, b''
+    if isinstance(data, str) :
+        return _STR, data.encode('utf-8')
+    if isinstance(data, (bytes, bytearray)) :
+        # media frames
+        return _BYTES, bytes(data)
+    return _JSON, json.dumps(data).encode('utf-8')
+
+def _decode(encoding, payload) :
+    if encoding == _STR :
+        return payload.decode('utf-8')
+    if encoding == _JSON :
+        return json.loads(payload)
+    if encoding == _BYTES :
+        return payload
+    return None
+
+# One phone's view of a TraceWriter, as handed to PhoneStateMachine
+class PhoneTrace :
+    __slots__ = ('_writer', '_phone')
+
+    def __init__(self, writer, phone) :
+        self._writer = writer
+        self._phone = phone
+
+    def event(self, event) :
+        self._writer._record(EVENT, self._phone, event.type, event.data)
+
+    def transition(self, state) :
+        self._writer._record(TRANSITION, self._phone, state, None)
+
+# Records every event that reaches the state machine of each phone it is given to (socket events,
+# user actions and timeouts alike, in the order they were dispatched) along with the state each
+# handler left the phone in.  Records are buffered and written in binary, so tracing a whole
+# fleet stays cheap; one writer can be shared by all of the phones in a process.
+class TraceWriter :
+
+    def __init__(self, path, clock=time.perf_counter_ns) :
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._clock = clock
+        self._started = clock()
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._phones = 0
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *args) :
+        self.close()
+
+    # Adds a phone to the trace, returning the PhoneTrace to record it with
+    def phone(self, phone_number) :
+        with self._lock :
+            phone = self._phones
+            self._phones += 1
+        self._record(PHONE, phone, 0, phone_number)
+        return PhoneTrace(self, phone)
+
+    def _record(self, kind, phone, code, data) :
+        encoding, payload = _encode(data)
+        with self._lock :
+            buffer = self._buffer
+            buffer += _HEADER.pack(kind, phone, code, encoding, self._clock() - self._started)
+            if encoding != _NONE :
+                buffer += _LENGTH.pack(len(payload))
+                buffer += payload
+            if len(buffer) >= FLUSH_BYTES :
+                self._flush()
+
+    def _flush(self) :
+        if self._buffer and self._file is not None :
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def flush(self) :
+        with self._lock :
+            self._flush()
+            if self._file is not None :
+                self._file.flush()
+
+    def close(self) :
+        with self._lock :
+            if self._file is not None :
+                self._flush()
+                self._file.close()
+                self._file = None
+
+# A trace read back from disk.  records is a list of (timestamp, phone, kind, code, data) tuples in
+# the order they were written, with phone an index into phones.  A trace cut short by a crash is
+# read up to its last complete record, and marked truncated.
+class Trace :
+
+    def __init__(self, phones, records, truncated=False) :
+        self.phones = phones
+        self.records = records
+        self.truncated = truncated
+
+    @classmethod
+    def load(cls, path) :
+        with open(path, 'rb') as f :
+            data = f.read()
+        if not data.startswith(MAGIC) :
+            raise TraceException(f'{path} is not a phone emulator trace')
+
+        phones = []
+        records = []
+        offset = len(MAGIC)
+        end = len(data)
+        while offset < end :
+            if offset + _HEADER.size > end :
+                return cls(phones, records, True)
+            kind, phone, code, encoding, timestamp = _HEADER.unpack_from(data, offset)
+            offset += _HEADER.size
+            payload = b''
+            if encoding != _NONE :
+                if offset + _LENGTH.size > end :
+                    return cls(phones, records, True)
+                length, = _LENGTH.unpack_from(data, offset)
+                offset += _LENGTH.size
+                if offset + length > end :
+                    return cls(phones, records, True)
+                payload = data[offset:offset + length]
+                offset += length
+            value = _decode(encoding, payload)
+            if kind == PHONE :
+                phones.append(value)
+            records.append((timestamp, phone, kind, code, value))
+        return cls(phones, records)
+
+    @property
+    def duration(self) :
+        return self.records[-1][0] / 1e9 if self.records else 0.0
+
+    def events(self) :
+        return [(phone, PhoneEvent(PhoneEventType(code), data)) for _, phone, kind, code, data in self.records
+            if kind == EVENT]
+
+    # The states each phone's handlers returned, in order
+    def transitions(self) :
+        transitions = [[] for _ in self.phones]
+        for _, phone, kind, code, _ in self.records :
+            if kind == TRANSITION :
+                transitions[phone].append(PhoneState(code))
+        return transitions
+
+# Timer handles for replayed phones: a timeout that fired while tracing is in the trace as an event
+class _NullTimer :
+    __slots__ = ()
+
+    def cancel(self) :
+        pass
+
+class _NullTimers :
+    _timer = _NullTimer()
+
+    def schedule(self, delay, callback) :
+        return self._timer
+
+    def reschedule(self, timer, delay) :
+        return timer
+
+# The reconnect policy's token bucket on replay: when a phone was let through is in the trace too
+class _NullLimiter :
+    __slots__ = ()
+
+    def reserve(self) :
+        return 0.0
+
+# A policy that never gives up, so a replayed phone goes on treating connection errors as a server
+# that's still down, as a phone with the default policy does (a trace of a phone whose policy gave
+# up on the server will diverge there)
+def _replay_reconnect_policy() :
+    return ReconnectPolicy(limiter=_NullLimiter(), rng=random.Random(0))
+
+# Collects each replayed phone's transitions, to compare against the trace's
+class _TransitionLog :
+
+    def __init__(self) :
+        self.transitions = []
+
+    def phone(self, phone_number) :
+        log = _PhoneTransitions()
+        self.transitions.append(log.states)
+        return log
+
+class _PhoneTransitions :
+    __slots__ = ('states',)
+
+    def __init__(self) :
+        self.states = []
+
+    def event(self, event) :
+        pass
+
+    def transition(self, state) :
+        self.states.append(state)
+
+# The state machine with nothing attached: events the handlers queue for themselves (timeouts,
+# reconnection attempts, the shutdown after a connection error) are already in the trace, as are
+# the outcomes of reconnecting, and emits are only counted
+class _ReplayPhone(PhoneStateMachine) :
+    __slots__ = ('emitted',)
+
+    def __init__(self, phone_number, trace=None, reconnect_policy=None) :
+        super().__init__(phone_number, '', _NullTimers(), trace=trace, reconnect_policy=reconnect_policy)
+        self.emitted = 0
+
+    def _put_event(self, event) :
+        pass
+
+    def _reconnect(self) :
+        pass
+
+    def _emit(self, event, *args) :
+        self.emitted += 1
+
+# Feeds a trace's events back through fresh state machines as fast as they will go.  With verify,
+# the replayed transitions are also checked against the recorded ones, and every phone that
+# diverged is described in 'divergences'.
+def replay(trace, verify=True) :
+    log = _TransitionLog() if verify else None
+    reconnect_policy = _replay_reconnect_policy()
+    phones = [_ReplayPhone(number, log, reconnect_policy) for number in trace.phones]
+    events = [(phones[phone], event) for phone, event in trace.events()]
+
+    started = time.perf_counter()
+    for phone, event in events :
+        phone._dispatch(event)
+    elapsed = time.perf_counter() - started
+
+    results = {
+        'phones' : len(phones),
+        'events' : len(events),
+        'emitted' : sum(phone.emitted for phone in phones),
+        'recorded_seconds' : round(trace.duration, 6),
+        'replay_seconds' : round(elapsed, 6),
+        'events_per_second' : round(len(events) / elapsed) if elapsed > 0 else None
+    }
+    if verify :
+        results['divergences'] = _divergences(trace, log.transitions)
+    return results
+
+def _divergences(trace, replayed) :
+    divergences = []
+    for number, expected, actual in zip(trace.phones, trace.transitions(), replayed) :
+        if expected == actual :
+            continue
+        for i, (want, got) in enumerate(zip(expected, actual)) :
+            if want != got :
+                divergences.append(f'{number}: transition {i} went to {got.name} on replay, but {want.name} when traced')
+                break
+        else :
+            divergences.append(f'{number}: {len(expected)} transitions traced, but {len(actual)} on replay')
+    return divergences
+
+def dump(trace) :
+    for timestamp, phone, kind, code, data in trace.records :
+        number = trace.phones[phone] if phone < len(trace.phones) else phone
+        if kind == PHONE :
+            line = f'phone {data}'
+        elif kind == EVENT :
+            line = PhoneEventType(code).name + (f' {data!r}' if data is not None else '')
+        else :
+            line = f'-> {PhoneState(code).name}'
+        print(f'{timestamp / 1e9:12.6f} {number} {line}')
+
+if __name__ == '__main__' :
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Inspect or replay phone emulator traces (recorded with --trace).')
+    parser.add_argument('command', choices=('replay', 'dump'))
+    parser.add_argument('traces', nargs='+', metavar='TRACE')
+    args = parser.parse_args()
+
+    diverged = False
+    for path in args.traces :
+        trace = Trace.load(path)
+        if trace.truncated :
+            print(f'{path}: truncated, using the records before the cut', file=sys.stderr)
+        if args.command == 'dump' :
+            dump(trace)
+        else :
+            results = replay(trace)
+            diverged |= bool(results['divergences'])
+            print(json.dumps({path : results}, indent=2))
+    sys.exit(1 if diverged else 0)
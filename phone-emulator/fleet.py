@@ -0,0 +1,197 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+
+from async_phone_emulator import PhoneEngine
+from latency import LatencyRecorder
+from media import MediaStats
+from profiling import SAMPLE, HandlerProfile, ProfileWindow, enable_handler_profile
+from reconnect import DEFAULT_RATE, ReconnectPolicy, ReconnectStats, TokenBucket
+
+class FleetException(Exception) :
+    pass
+
+# Turns a spec like '0001-0100,0200,0300-0310' into a list of four digit phone numbers
+def parse_number_range(spec) :
+    numbers = []
+    for part in spec.split(',') :
+        part = part.strip()
+        if not part :
+            continue
+        first, sep, last = part.partition('-')
+        if not first.isnumeric() or (sep and not last.isnumeric()) :
+            raise FleetException(f'Invalid phone number range: {part}')
+        if not sep :
+            last = first
+        width = max(len(first), len(last), 4)
+        start, end = int(first), int(last)
+        if end < start :
+            raise FleetException(f'Invalid phone number range: {part}')
+        numbers.extend(str(n).zfill(width) for n in range(start, end + 1))
+    return numbers
+
+# Splits numbers into count contiguous chunks of (nearly) equal size
+def shard(numbers, count) :
+    count = max(1, min(count, len(numbers)))
+    size, extra = divmod(len(numbers), count)
+    shards = []
+    start = 0
+    for i in range(count) :
+        end = start + size + (1 if i < extra else 0)
+        shards.append(numbers[start:end])
+        start = end
+    return shards
+
+def _worker(numbers, server_url, ssl_verify, max_concurrent_connects, stop_event, results, trace_path,
+        max_reconnects_per_second, trunk_size, transports, serializer, media, profile, profile_window, event_log_path,
+        status_board_name) :
+    # the parent process owns Ctrl-C, and tells the workers to stop through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # before the phones are created, as they pick the profile up then
+    handler_profile = enable_handler_profile() if profile else None
+    latency_recorder = LatencyRecorder()
+    media_stats = MediaStats() if media else None
+    reconnect_policy = ReconnectPolicy(limiter=TokenBucket(max_reconnects_per_second, max(1, int(max_reconnects_per_second))))
+    trace = None
+    if trace_path is not None :
+        from event_trace import TraceWriter
+        trace = TraceWriter(trace_path)
+    event_log = None
+    if event_log_path is not None :
+        from event_log import EventLog
+        event_log = EventLog(event_log_path)
+    status_board = None
+    if status_board_name is not None :
+        from status_board import StatusBoard
+        status_board = StatusBoard.attach(status_board_name)
+    try :
+        asyncio.run(_run_worker(numbers, server_url, ssl_verify, max_concurrent_connects, stop_event, latency_recorder,
+            trace, reconnect_policy, trunk_size, transports, serializer, media_stats, profile_window, event_log,
+            status_board))
+    finally :
+        if status_board is not None :
+            status_board.close()
+        if trace is not None :
+            trace.close()
+        if event_log is not None :
+            event_log.close()
+        results.put((latency_recorder.to_dict(), reconnect_policy.stats.to_dict(),
+            media_stats.to_dict() if media_stats is not None else None,
+            handler_profile.to_dict() if handler_profile is not None else None))
+
+async def _run_worker(numbers, server_url, ssl_verify, max_concurrent_connects, stop_event, latency_recorder, trace,
+        reconnect_policy, trunk_size, transports, serializer, media_stats, profile_window, event_log, status_board) :
+    engine = PhoneEngine(server_url, ssl_verify, max_concurrent_connects, latency_recorder, trace, reconnect_policy,
+        trunk_size, transports, serializer, media_stats, event_log=event_log)
+    for number in numbers :
+        phone = engine.add_phone(number)
+        if status_board is not None :
+            status_board.publish(phone)
+    window = None
+    if profile_window is not None :
+        # started and stopped on the loop, where every one of this worker's phones runs
+        path, mode, seconds = profile_window
+        window = ProfileWindow(path, mode)
+        window.start()
+        asyncio.get_running_loop().call_later(seconds, window.stop)
+    await engine.start()
+    try :
+        await asyncio.get_running_loop().run_in_executor(None, stop_event.wait)
+    finally :
+        await engine.shutdown()
+        if window is not None :
+            window.stop()
+
+# Writes the recorder as Prometheus text if path ends in .prom, and as JSON otherwise
+def write_latency_report(latency_recorder, path) :
+    report = latency_recorder.to_prometheus() if path.endswith('.prom') else latency_recorder.to_json()
+    with open(path, 'w', encoding='utf-8') as f :
+        f.write(report)
+
+# Runs every phone in numbers, spread over one worker process (and event loop) per core,
+# until interrupted with Ctrl-C or SIGTERM.  Returns the call setup latencies of the whole fleet
+# as a LatencyRecorder.  With trace_path, each worker traces its phones to trace_path.<worker>.
+# max_reconnects_per_second limits each worker's reconnection attempts after the server goes away,
+# and trunk_size puts that many phones on each connection (see trunk.py).  transports and
+# serializer are as for PhoneEmulator.  With media, connected calls carry audio frames (see
+# media.py), and the fleet's jitter, loss and delay are printed at the end.  With profile_path, the
+# workers profile their phones' handlers (see profiling.py), and the fleet's totals are written
+# there (as JSON) and the busiest printed; with profile_window as well, each worker also profiles
+# its first profile_window seconds as a whole in profile_mode, to profile_path.window.<worker>.
+# With event_log_path, each worker logs its phones' events to event_log_path.<worker> (see
+# event_log.py, which merges them back into one timeline).  With status_board_name, the fleet
+# keeps a StatusBoard of that name in shared memory while it runs, for status_board.py to watch.
+def run_fleet(numbers, server_url, ssl_verify=False, workers=None, max_concurrent_connects=100, trace_path=None,
+        max_reconnects_per_second=DEFAULT_RATE, trunk_size=None, transports=None, serializer='default', media=False,
+        profile_path=None, profile_window=None, profile_mode=SAMPLE, event_log_path=None,
+        status_board_name=None) :
+    if not numbers :
+        raise FleetException('No phone numbers to run')
+
+    status_board = None
+    if status_board_name is not None :
+        from status_board import StatusBoard
+        status_board = StatusBoard.create(numbers, status_board_name)
+    stop_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = []
+    for i, numbers_shard in enumerate(shard(numbers, workers or os.cpu_count() or 1)) :
+        window = None
+        if profile_path is not None and profile_window is not None :
+            window = (f'{profile_path}.window.{i}', profile_mode, profile_window)
+        process = multiprocessing.Process(target=_worker, args=(numbers_shard, server_url, ssl_verify,
+            max_concurrent_connects, stop_event, results, f'{trace_path}.{i}' if trace_path is not None else None,
+            max_reconnects_per_second, trunk_size, transports, serializer, media, profile_path is not None, window,
+            f'{event_log_path}.{i}' if event_log_path is not None else None, status_board_name))
+        process.start()
+        processes.append(process)
+    print(f'Started {len(numbers)} phones across {len(processes)} worker processes.  Press Ctrl-C to stop.')
+    if status_board is not None :
+        print(f'Watch them with: python status_board.py {status_board.name}')
+
+    def stop(signum, frame) :
+        stop_event.set()
+    signal.signal(signal.SIGTERM, stop)
+
+    # collect each worker's histograms before joining, so a full queue can't hold a worker up
+    latency_recorder = LatencyRecorder()
+    reconnect_stats = ReconnectStats()
+    media_stats = MediaStats()
+    handler_profile = HandlerProfile()
+    received = 0
+    while received < len(processes) :
+        try :
+            latency, reconnects, media_totals, handler_totals = results.get(timeout=1.0)
+            latency_recorder.merge(LatencyRecorder.from_dict(latency))
+            reconnect_stats.merge(ReconnectStats.from_dict(reconnects))
+            if media_totals is not None :
+                media_stats.merge(MediaStats.from_dict(media_totals))
+            if handler_totals is not None :
+                handler_profile.merge(HandlerProfile.from_dict(handler_totals))
+            received += 1
+        except queue.Empty :
+            # a worker died without reporting
+            if not any(process.is_alive() for process in processes) :
+                break
+        except KeyboardInterrupt :
+            stop_event.set()
+    for process in processes :
+        process.join()
+    if status_board is not None :
+        status_board.close()
+    print('Fleet stopped.')
+    summary = reconnect_stats.summary()
+    if summary['disconnects'] :
+        print(f'{summary["disconnects"]} disconnects, {summary["reconnects"]} reconnects in {summary["attempts"]} attempts; '
+            f'{summary["storms"]} reconnect storms lasting up to {summary["max_storm_seconds"] or 0:.1f}s')
+    if media :
+        summary = media_stats.summary()
+        print(f'{summary["frames_received"]} of {summary["frames_sent"]} media frames received over {summary["calls"]} '
+            f'call legs, {summary["frames_lost"]} lost; delay p50 {summary["delay_ms"]["p50"]}ms, '
+            f'p99 {summary["delay_ms"]["p99"]}ms; jitter p99 {summary["jitter_ms"]["p99"]}ms')
+    if profile_path is not None :
+        handler_profile.write(profile_path)
+        print(handler_profile.report())
+    return latency_recorder
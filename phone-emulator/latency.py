@@ -0,0 +1,266 @@
+import json
+import threading
+import time
+
+from phone_emulator import PhoneState
+
+# Each power of two is split into this many linear sub-buckets (at least 1 << SUB_BUCKET_BITS - 1),
+# which keeps every recorded value within 1/64 (about 1.6%) of its true value
+SUB_BUCKET_BITS = 7
+MAX_PENDING_HANG_UPS = 10000
+
+CONNECT_TO_REGISTERED = 'connect_to_registered'
+MAKE_CALL_TO_RINGING = 'make_call_to_ringing'
+RINGING_TO_CONNECTED = 'ringing_to_connected'
+HANG_UP_TO_CALL_ENDED = 'hang_up_to_call_ended'
+PHASES = (CONNECT_TO_REGISTERED, MAKE_CALL_TO_RINGING, RINGING_TO_CONNECTED, HANG_UP_TO_CALL_ENDED)
+
+# An HDR-style histogram of non-negative integer values (nanoseconds, here).  Buckets are
+# log-linear: values below 1 << SUB_BUCKET_BITS get a bucket each, and every power of two above
+# that is split into the same number of equal sub-buckets, so the relative error is bounded and
+# the bucket count only grows with the log of the largest value.  Recording is O(1).
+class Histogram :
+    __slots__ = ('_counts', '_count', '_total', '_min', '_max')
+
+    _sub_buckets = 1 << SUB_BUCKET_BITS
+    _half = _sub_buckets >> 1
+
+    def __init__(self) :
+        self._counts = []
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    @classmethod
+    def _index(cls, value) :
+        if value < cls._sub_buckets :
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return cls._sub_buckets + (shift - 1) * cls._half + (value >> shift) - cls._half
+
+    # The range of values (inclusive) that land in bucket index
+    @classmethod
+    def bucket_range(cls, index) :
+        if index < cls._sub_buckets :
+            return index, index
+        shift, offset = divmod(index - cls._sub_buckets, cls._half)
+        shift += 1
+        mantissa = offset + cls._half
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value, count=1) :
+        value = max(0, int(value))
+        index = self._index(value)
+        counts = self._counts
+        if index >= len(counts) :
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += count
+        self._count += count
+        self._total += value * count
+        if self._min is None or value < self._min :
+            self._min = value
+        if self._max is None or value > self._max :
+            self._max = value
+
+    def __len__(self) :
+        return self._count
+
+    @property
+    def count(self) :
+        return self._count
+
+    @property
+    def min(self) :
+        return self._min
+
+    @property
+    def max(self) :
+        return self._max
+
+    @property
+    def mean(self) :
+        return self._total / self._count if self._count else None
+
+    # The value at or below which percent of the recorded values fall, reported as the top of its
+    # bucket (clamped to the largest value seen)
+    def percentile(self, percent) :
+        if not self._count :
+            return None
+        target = max(1, -(-self._count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self._counts) :
+            seen += count
+            if seen >= target :
+                return min(self.bucket_range(index)[1], self._max)
+        return self._max
+
+    # (upper bound, count) for every non-empty bucket, in order
+    def buckets(self) :
+        return [(self.bucket_range(index)[1], count) for index, count in enumerate(self._counts) if count]
+
+    def merge(self, other) :
+        if other._count == 0 :
+            return
+        counts = self._counts
+        if len(other._counts) > len(counts) :
+            counts.extend([0] * (len(other._counts) - len(counts)))
+        for index, count in enumerate(other._counts) :
+            counts[index] += count
+        self._count += other._count
+        self._total += other._total
+        self._min = other._min if self._min is None else min(self._min, other._min)
+        self._max = other._max if self._max is None else max(self._max, other._max)
+
+    def summary(self) :
+        return {
+            'count' : self._count,
+            'min' : self._min,
+            'mean' : self.mean,
+            'p50' : self.percentile(50),
+            'p90' : self.percentile(90),
+            'p99' : self.percentile(99),
+            'p999' : self.percentile(99.9),
+            'max' : self._max
+        }
+
+    def to_dict(self) :
+        return {
+            'total' : self._total,
+            'min' : self._min,
+            'max' : self._max,
+            'buckets' : {str(index) : count for index, count in enumerate(self._counts) if count}
+        }
+
+    @classmethod
+    def from_dict(cls, values) :
+        histogram = cls()
+        buckets = {int(index) : count for index, count in values['buckets'].items()}
+        if buckets :
+            histogram._counts = [0] * (max(buckets) + 1)
+            for index, count in buckets.items() :
+                histogram._counts[index] = count
+        histogram._count = sum(buckets.values())
+        histogram._total = values['total']
+        histogram._min = values['min']
+        histogram._max = values['max']
+        return histogram
+
+# What each state transition means for the phases: the phase it completes (if any), and whether
+# it starts the phone's next phase
+_DISPATCH_PHASES = {
+    (PhoneState.DISCONNECTED, PhoneState.UNREGISTERED) : (None, True),
+    (PhoneState.UNREGISTERED, PhoneState.ON_HOOK_IDLE) : (CONNECT_TO_REGISTERED, False),
+    (PhoneState.UNREGISTERED, PhoneState.OFF_HOOK_DIALING) : (CONNECT_TO_REGISTERED, False),
+    (PhoneState.OFF_HOOK_DIALING, PhoneState.INIT_OUTGOING_CALL) : (None, True),
+    (PhoneState.INIT_OUTGOING_CALL, PhoneState.OUTGOING_CALL_RINGING) : (MAKE_CALL_TO_RINGING, True),
+    (PhoneState.OUTGOING_CALL_RINGING, PhoneState.CALL_CONNECTED) : (RINGING_TO_CONNECTED, False)
+}
+
+# Collects per-phase latency histograms for the phones in one process.  Phones report each
+# transition from _dispatch; a phone's current phase start is kept on the phone itself, except for
+# hang_up -> call_ended, which spans two phones and is matched up here by (caller, partner).
+# Timestamps come from clock, which returns integer nanoseconds.
+class LatencyRecorder :
+
+    def __init__(self, clock=time.perf_counter_ns) :
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histograms = {phase : Histogram() for phase in PHASES}
+        self._hang_ups = {}
+
+    @property
+    def histograms(self) :
+        return self._histograms
+
+    def __getitem__(self, phase) :
+        return self._histograms[phase]
+
+    # Called for every transition.  Returns the phone's new phase start (mark).
+    def transition(self, phone_number, partner, old_state, new_state, mark) :
+        if old_state == new_state :
+            return mark
+        if old_state == PhoneState.CALL_CONNECTED :
+            if new_state == PhoneState.ON_HOOK_IDLE :
+                self._hang_up(phone_number, partner)
+            elif new_state == PhoneState.CALL_ENDED :
+                self._call_ended(phone_number, partner)
+            return None
+
+        action = _DISPATCH_PHASES.get((old_state, new_state))
+        if action is None :
+            return None
+        phase, starts = action
+        now = self._clock()
+        if phase is not None and mark is not None :
+            self.record(phase, now - mark)
+        return now if starts else None
+
+    def record(self, phase, nanoseconds) :
+        with self._lock :
+            self._histograms[phase].record(nanoseconds)
+
+    def _hang_up(self, phone_number, partner) :
+        now = self._clock()
+        with self._lock :
+            hang_ups = self._hang_ups
+            # the partner may live in another process, so don't let unmatched hang ups pile up
+            if len(hang_ups) >= MAX_PENDING_HANG_UPS :
+                del hang_ups[next(iter(hang_ups))]
+            hang_ups[(phone_number, partner)] = now
+
+    def _call_ended(self, phone_number, partner) :
+        now = self._clock()
+        with self._lock :
+            started = self._hang_ups.pop((partner, phone_number), None)
+            if started is not None :
+                self._histograms[HANG_UP_TO_CALL_ENDED].record(now - started)
+
+    def merge(self, other) :
+        with self._lock :
+            for phase, histogram in other._histograms.items() :
+                self._histograms[phase].merge(histogram)
+
+    def summary(self) :
+        with self._lock :
+            return {phase : histogram.summary() for phase, histogram in self._histograms.items()}
+
+    # The full histograms, for shipping between processes (see from_dict and merge)
+    def to_dict(self) :
+        with self._lock :
+            return {phase : histogram.to_dict() for phase, histogram in self._histograms.items()}
+
+    @classmethod
+    def from_dict(cls, values) :
+        recorder = cls()
+        for phase, histogram in values.items() :
+            recorder._histograms[phase] = Histogram.from_dict(histogram)
+        return recorder
+
+    def to_json(self) :
+        return json.dumps({'summary' : self.summary(), 'histograms' : self.to_dict()}, indent=2)
+
+    # Prometheus text exposition format, one histogram per phase with cumulative buckets in seconds
+    def to_prometheus(self, name='phone_emulator_latency_seconds') :
+        lines = [f'# HELP {name} Call setup latency by phase.', f'# TYPE {name} histogram']
+        with self._lock :
+            for phase, histogram in self._histograms.items() :
+                cumulative = 0
+                for upper, count in histogram.buckets() :
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{phase="{phase}",le="{upper / 1e9:.9g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{phase="{phase}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{phase="{phase}"}} {histogram._total / 1e9:.9g}')
+                lines.append(f'{name}_count{{phase="{phase}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+_default_recorder = None
+_default_recorder_lock = threading.Lock()
+
+# The recorder shared by every phone in this process
+def default_latency_recorder() :
+    global _default_recorder
+    with _default_recorder_lock :
+        if _default_recorder is None :
+            _default_recorder = LatencyRecorder()
+        return _default_recorder
@@ -0,0 +1,284 @@
+import json
+import random
+
+from phone_emulator import PhoneState
+
+class LoadProfileException(Exception) :
+    pass
+
+# Builds a function returning samples from spec, which is either a number (a constant) or a dict
+# like {"distribution": "exponential", "mean": 180}
+def make_distribution(spec, rng) :
+    if isinstance(spec, (int, float)) :
+        return lambda : spec
+    if not isinstance(spec, dict) or 'distribution' not in spec :
+        raise LoadProfileException(f'Invalid distribution: {spec!r}')
+    kind = spec['distribution']
+    try :
+        if kind == 'constant' :
+            value = spec['value']
+            return lambda : value
+        elif kind == 'uniform' :
+            low, high = spec['low'], spec['high']
+            return lambda : rng.uniform(low, high)
+        elif kind == 'exponential' :
+            rate = 1.0 / spec['mean']
+            return lambda : rng.expovariate(rate)
+        elif kind == 'lognormal' :
+            mu, sigma = spec['mu'], spec['sigma']
+            return lambda : rng.lognormvariate(mu, sigma)
+        elif kind == 'normal' :
+            mean, stddev = spec['mean'], spec['stddev']
+            return lambda : max(0.0, rng.gauss(mean, stddev))
+    except KeyError as e :
+        raise LoadProfileException(f'Distribution {kind!r} is missing {e.args[0]!r}')
+    raise LoadProfileException(f'Unknown distribution: {kind!r}')
+
+# A declarative description of the traffic to generate.  Every field can be given in a JSON
+# profile; rates are per phone.
+class LoadProfile :
+    FIELDS = ('duration', 'calls_per_second', 'callee_selection', 'callees', 'answer_probability',
+        'answer_delay', 'hold_time', 'talk_rate', 'talk_message', 'dial_interval', 'hang_up_delay', 'seed')
+
+    def __init__(self, duration=3600.0, calls_per_second=1.0 / 3600.0, callee_selection='uniform', callees=None,
+            answer_probability=0.9, answer_delay=3.0, hold_time=180.0, talk_rate=0.0, talk_message='talk',
+            dial_interval=0.2, hang_up_delay=1.0, seed=None) :
+        if callee_selection not in ('uniform', 'list') :
+            raise LoadProfileException(f'Unknown callee_selection: {callee_selection!r}')
+        if callee_selection == 'list' and not callees :
+            raise LoadProfileException('callee_selection "list" needs callees')
+        self.duration = duration
+        self.calls_per_second = calls_per_second
+        self.callee_selection = callee_selection
+        self.callees = list(callees) if callees else None
+        self.answer_probability = answer_probability
+        self.answer_delay = answer_delay
+        self.hold_time = hold_time
+        self.talk_rate = talk_rate
+        self.talk_message = talk_message
+        self.dial_interval = dial_interval
+        self.hang_up_delay = hang_up_delay
+        self.seed = seed
+
+    @classmethod
+    def from_dict(cls, values) :
+        unknown = set(values) - set(cls.FIELDS)
+        if unknown :
+            raise LoadProfileException(f'Unknown profile fields: {", ".join(sorted(unknown))}')
+        return cls(**values)
+
+    @classmethod
+    def load(cls, path) :
+        with open(path, encoding='utf-8') as f :
+            return cls.from_dict(json.load(f))
+
+class LoadStats :
+    FIELDS = ('attempted', 'skipped', 'ringing', 'connected', 'busy', 'not_available', 'answered', 'declined',
+        'talk_sent', 'completed')
+    __slots__ = FIELDS + ('ringing_total', 'ringing_max', 'connect_total', 'connect_max')
+
+    def __init__(self) :
+        for name in self.__slots__ :
+            setattr(self, name, 0)
+
+    def as_dict(self) :
+        stats = {name : getattr(self, name) for name in self.FIELDS}
+        stats['mean_time_to_ringing'] = self.ringing_total / self.ringing if self.ringing else None
+        stats['max_time_to_ringing'] = self.ringing_max if self.ringing else None
+        stats['mean_time_to_connected'] = self.connect_total / self.connected if self.connected else None
+        stats['max_time_to_connected'] = self.connect_max if self.connected else None
+        return stats
+
+class _Driver :
+    __slots__ = ('phone', 'number', 'call_id', 'originated', 'dialed_at')
+
+    def __init__(self, phone, number) :
+        self.phone = phone
+        self.number = number
+        self.call_id = 0
+        self.originated = False
+        self.dialed_at = None
+
+# Drives a fleet through the public emulator API (off_hook, key_press, talk, on_hook and
+# snapshot subscriptions) according to a LoadProfile.  Calls arrive at each phone as a Poisson
+# process.  call_later(delay, callback, *args) and clock() come from whatever runs the phones:
+# an asyncio loop (loop.call_later, loop.time) or a Simulation (call_later, clock).
+class LoadGenerator :
+
+    def __init__(self, phones, profile, call_later, clock) :
+        self._profile = profile
+        self._call_later = call_later
+        self._clock = clock
+        self._rng = random.Random(profile.seed)
+        self._answer_delay = make_distribution(profile.answer_delay, self._rng)
+        self._hold_time = make_distribution(profile.hold_time, self._rng)
+        self._drivers = {number : _Driver(phone, number) for number, phone in phones.items()}
+        self._numbers = list(self._drivers)
+        self._started_at = None
+        self._stopped = False
+        self.stats = LoadStats()
+
+    def start(self) :
+        self._started_at = self._clock()
+        for driver in self._drivers.values() :
+            driver.phone.subscribe(lambda snapshot, changed, driver=driver : self._on_state(driver, snapshot), ('state',))
+            self._schedule_next_call(driver)
+
+    def stop(self) :
+        self._stopped = True
+
+    @property
+    def finished(self) :
+        return self._stopped or (self._started_at is not None and
+            self._clock() - self._started_at >= self._profile.duration)
+
+    def _schedule_next_call(self, driver) :
+        rate = self._profile.calls_per_second
+        if rate > 0 :
+            self._call_later(self._rng.expovariate(rate), self._place_call, driver)
+
+    def _pick_callee(self, driver) :
+        candidates = self._profile.callees if self._profile.callee_selection == 'list' else self._numbers
+        callee = self._rng.choice(candidates)
+        if callee == driver.number and len(candidates) > 1 :
+            while callee == driver.number :
+                callee = self._rng.choice(candidates)
+        return callee
+
+    def _place_call(self, driver) :
+        if self.finished :
+            return
+        self._schedule_next_call(driver)
+        if driver.phone.snapshot().state != PhoneState.ON_HOOK_IDLE :
+            # the user is already on the phone
+            self.stats.skipped += 1
+            return
+
+        self.stats.attempted += 1
+        driver.originated = True
+        driver.dialed_at = None
+        phone = driver.phone
+        phone.off_hook()
+        interval = self._profile.dial_interval
+        for i, key in enumerate(self._pick_callee(driver)) :
+            self._call_later(interval * (i + 1), phone.key_press, key)
+
+    def _on_state(self, driver, snapshot) :
+        state = snapshot.state
+        stats = self.stats
+        if state == PhoneState.INIT_OUTGOING_CALL :
+            driver.dialed_at = self._clock()
+        elif state == PhoneState.OUTGOING_CALL_RINGING :
+            stats.ringing += 1
+            if driver.dialed_at is not None :
+                elapsed = self._clock() - driver.dialed_at
+                stats.ringing_total += elapsed
+                stats.ringing_max = max(stats.ringing_max, elapsed)
+        elif state == PhoneState.INCOMING_CALL_RINGING :
+            driver.originated = False
+            if self._rng.random() < self._profile.answer_probability :
+                stats.answered += 1
+                self._call_later(self._answer_delay(), self._answer, driver, driver.call_id)
+            else :
+                stats.declined += 1
+        elif state == PhoneState.CALL_CONNECTED :
+            driver.call_id += 1
+            if driver.originated :
+                stats.connected += 1
+                if driver.dialed_at is not None :
+                    elapsed = self._clock() - driver.dialed_at
+                    stats.connect_total += elapsed
+                    stats.connect_max = max(stats.connect_max, elapsed)
+                self._call_later(self._hold_time(), self._hang_up, driver, driver.call_id)
+            if self._profile.talk_rate > 0 :
+                self._schedule_talk(driver, driver.call_id)
+        elif state == PhoneState.CALL_BUSY :
+            stats.busy += 1
+            self._call_later(self._profile.hang_up_delay, self._hang_up, driver, driver.call_id)
+        elif state == PhoneState.CALL_NOT_AVAILABLE :
+            stats.not_available += 1
+            self._call_later(self._profile.hang_up_delay, self._hang_up, driver, driver.call_id)
+        elif state == PhoneState.CALL_ENDED :
+            self._call_later(self._profile.hang_up_delay, self._hang_up, driver, driver.call_id)
+
+    def _answer(self, driver, call_id) :
+        if not self._stopped and driver.call_id == call_id and driver.phone.snapshot().state == PhoneState.INCOMING_CALL_RINGING :
+            driver.phone.off_hook()
+
+    def _hang_up(self, driver, call_id) :
+        if self._stopped or driver.call_id != call_id :
+            return
+        state = driver.phone.snapshot().state
+        if state in (PhoneState.CALL_CONNECTED, PhoneState.CALL_ENDED, PhoneState.CALL_BUSY,
+                PhoneState.CALL_NOT_AVAILABLE) :
+            if state == PhoneState.CALL_CONNECTED or (state == PhoneState.CALL_ENDED and driver.originated) :
+                self.stats.completed += 1
+            driver.phone.on_hook()
+            driver.call_id += 1
+
+    def _schedule_talk(self, driver, call_id) :
+        self._call_later(self._rng.expovariate(self._profile.talk_rate), self._talk, driver, call_id)
+
+    def _talk(self, driver, call_id) :
+        if self._stopped or driver.call_id != call_id or driver.phone.snapshot().state != PhoneState.CALL_CONNECTED :
+            return
+        driver.phone.talk(self._profile.talk_message)
+        self.stats.talk_sent += 1
+        self._schedule_talk(driver, call_id)
+
+def run_simulated(numbers, profile, latency=0.005) :
+    from simulation import SimulatedFleet
+
+    fleet = SimulatedFleet(numbers, latency)
+    fleet.start()
+    fleet.run(1.0)
+    generator = LoadGenerator(fleet.phones, profile, fleet.simulation.call_later, fleet.simulation.clock)
+    generator.start()
+    fleet.run(fleet.simulation.now + profile.duration)
+    generator.stop()
+    fleet.shutdown()
+    return generator.stats, fleet.latency_recorder
+
+async def run_live(numbers, profile, server_url, ssl_verify=False, max_concurrent_connects=100) :
+    import asyncio
+    from async_phone_emulator import PhoneEngine
+
+    loop = asyncio.get_running_loop()
+    engine = PhoneEngine(server_url, ssl_verify, max_concurrent_connects)
+    for number in numbers :
+        engine.add_phone(number)
+    await engine.start()
+    generator = LoadGenerator(engine.phones, profile, loop.call_later, loop.time)
+    generator.start()
+    try :
+        await asyncio.sleep(profile.duration)
+    finally :
+        generator.stop()
+        await engine.shutdown()
+    return generator.stats, engine.latency_recorder
+
+if __name__ == '__main__' :
+    import argparse
+    import asyncio
+    from fleet import parse_number_range
+
+    parser = argparse.ArgumentParser(description='Drive a fleet of emulated phones from a load profile.')
+    parser.add_argument('profile', help='JSON load profile')
+    parser.add_argument('server_url', default='http://localhost:5000', nargs='?')
+    parser.add_argument('--fleet', metavar='RANGE', default='0001-0100', help='Phone numbers to drive, e.g. 0001-4999')
+    parser.add_argument('--simulate', action='store_true', help='Run in simulated time against an in-process switch')
+    parser.add_argument('--ssl_verify', action='store_true', help='Verify SSL certificates')
+    parser.add_argument('--latency_report', metavar='PATH',
+        help='Also write the call setup latency histograms here (Prometheus text if PATH ends in .prom, else JSON)')
+    args = parser.parse_args()
+
+    profile = LoadProfile.load(args.profile)
+    numbers = parse_number_range(args.fleet)
+    if args.simulate :
+        stats, latency_recorder = run_simulated(numbers, profile)
+    else :
+        stats, latency_recorder = asyncio.run(run_live(numbers, profile, args.server_url, args.ssl_verify))
+    print(json.dumps({'calls' : stats.as_dict(), 'latency' : latency_recorder.summary()}, indent=2))
+    if args.latency_report is not None :
+        from fleet import write_latency_report
+        write_latency_report(latency_recorder, args.latency_report)
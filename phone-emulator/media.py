@@ -0,0 +1,178 @@
+import struct
+import threading
+import time
+
+from latency import Histogram
+
+# 20 ms of 8 kHz, 8-bit audio (G.711) per frame
+FRAME_SECONDS = 0.02
+PAYLOAD_BYTES = 160
+# A frame's buffer is reused RING_FRAMES frames (320 ms) later, so it has to be on the wire by then
+RING_FRAMES = 16
+# How far back (in frames) a late frame can still be told apart from a duplicate
+REORDER_WINDOW = 64
+
+# sequence number, send time (integer nanoseconds on the sender's clock)
+_HEADER = struct.Struct('<Iq')
+_WINDOW_MASK = (1 << REORDER_WINDOW) - 1
+
+# One phone's side of one call's audio: the frames it sends, and what it makes of the frames it
+# receives.  Frames are built in place in a ring of preallocated buffers, and read without
+# copying.  A phone sending them keeps one timer for the whole call and publishes no snapshots
+# for them, but each frame it receives is still a new bytes object from the transport and a new
+# INCOMING_MEDIA event, both gone once it has been handled.  Jitter is the RFC 3550 interarrival
+# jitter, and delay is one-way (so the two phones' clocks have to agree: both default to
+# time.time_ns).
+class MediaStream :
+    __slots__ = ('frame_seconds', '_clock', '_ring', '_sequence', 'received', 'duplicates', 'reordered', '_first',
+        '_highest', '_window', '_transit', '_jitter', 'delay', 'jitter')
+
+    def __init__(self, clock=time.time_ns, frame_seconds=FRAME_SECONDS, payload_bytes=PAYLOAD_BYTES,
+            ring_frames=RING_FRAMES) :
+        self.frame_seconds = frame_seconds
+        self._clock = clock
+        self._ring = [bytearray(_HEADER.size + payload_bytes) for _ in range(ring_frames)]
+        self._sequence = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self._first = None
+        self._highest = None
+        self._window = 0
+        self._transit = None
+        self._jitter = 0.0
+        # nanoseconds, per frame received
+        self.delay = Histogram()
+        self.jitter = Histogram()
+
+    @property
+    def sent(self) :
+        return self._sequence
+
+    # The frames missing so far (those that might still turn up late included)
+    @property
+    def lost(self) :
+        if self._highest is None :
+            return 0
+        return max(0, self._highest - self._first + 1 - self.received)
+
+    # The next frame to send, stamped with its sequence number and the time.  The buffer belongs
+    # to the stream, and is overwritten RING_FRAMES frames later.
+    def next_frame(self) :
+        sequence = self._sequence
+        frame = self._ring[sequence % len(self._ring)]
+        _HEADER.pack_into(frame, 0, sequence & 0xffffffff, self._clock())
+        self._sequence = sequence + 1
+        return frame
+
+    def receive(self, frame) :
+        now = self._clock()
+        sequence, sent_at = _HEADER.unpack_from(frame)
+        highest = self._highest
+        if highest is None :
+            self._first = self._highest = sequence
+            self._window = 1
+        elif sequence > highest :
+            self._window = ((self._window << (sequence - highest)) | 1) & _WINDOW_MASK
+            self._highest = sequence
+        else :
+            behind = highest - sequence
+            if behind < REORDER_WINDOW :
+                if self._window >> behind & 1 :
+                    self.duplicates += 1
+                    return
+                self._window |= 1 << behind
+            if sequence < self._first :
+                self._first = sequence
+            self.reordered += 1
+        self.received += 1
+
+        transit = now - sent_at
+        self.delay.record(max(0, transit))
+        if self._transit is not None :
+            self._jitter += (abs(transit - self._transit) - self._jitter) / 16.0
+        self._transit = transit
+        self.jitter.record(int(self._jitter))
+
+def _summary_ms(histogram) :
+    summary = histogram.summary()
+    return {key : round(summary[key] / 1e6, 3) if summary[key] is not None else None for key in ('p50', 'p99', 'max')}
+
+# Media totals for the phones in one process.  Phones start a MediaStream (on this clock) for each
+# connected call and add it here when the call ends.
+class MediaStats :
+
+    def __init__(self, clock=time.time_ns) :
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.delay = Histogram()
+        self.jitter = Histogram()
+
+    def stream(self) :
+        return MediaStream(self.clock)
+
+    def add(self, stream) :
+        with self._lock :
+            self.calls += 1
+            self.sent += stream.sent
+            self.received += stream.received
+            self.lost += stream.lost
+            self.duplicates += stream.duplicates
+            self.reordered += stream.reordered
+            self.delay.merge(stream.delay)
+            self.jitter.merge(stream.jitter)
+
+    def merge(self, other) :
+        with self._lock :
+            self.calls += other.calls
+            self.sent += other.sent
+            self.received += other.received
+            self.lost += other.lost
+            self.duplicates += other.duplicates
+            self.reordered += other.reordered
+            self.delay.merge(other.delay)
+            self.jitter.merge(other.jitter)
+
+    def summary(self) :
+        with self._lock :
+            expected = self.received + self.lost
+            return {
+                'calls' : self.calls,
+                'frames_sent' : self.sent,
+                'frames_received' : self.received,
+                'frames_lost' : self.lost,
+                'loss' : round(self.lost / expected, 6) if expected else None,
+                'duplicates' : self.duplicates,
+                'reordered' : self.reordered,
+                'delay_ms' : _summary_ms(self.delay),
+                'jitter_ms' : _summary_ms(self.jitter)
+            }
+
+    # For shipping between processes (see from_dict and merge)
+    def to_dict(self) :
+        with self._lock :
+            return {
+                'calls' : self.calls,
+                'sent' : self.sent,
+                'received' : self.received,
+                'lost' : self.lost,
+                'duplicates' : self.duplicates,
+                'reordered' : self.reordered,
+                'delay' : self.delay.to_dict(),
+                'jitter' : self.jitter.to_dict()
+            }
+
+    @classmethod
+    def from_dict(cls, values) :
+        stats = cls()
+        for name in ('calls', 'sent', 'received', 'lost', 'duplicates', 'reordered') :
+            setattr(stats, name, values[name])
+        stats.delay = Histogram.from_dict(values['delay'])
+        stats.jitter = Histogram.from_dict(values['jitter'])
+        return stats
@@ -1,7 +1,19 @@
-from threading import Thread, Timer
-from queue import Queue
-from enum import Enum
-import socketio
+import time
+# for --headless's start-to-registered report, so taken before anything slow is imported
+_PROCESS_STARTED = time.perf_counter()
+
+from threading import Thread
+from enum import Enum, IntEnum
+
+from event_queue import EventQueue
+from profiling import default_handler_profile
+from talk_buffer import DEFAULT_CAPACITY, DROP, TalkBuffer
+from timer_wheel import default_timer_wheel
+from transcript import Transcript
+
+CALL_TIMEOUT = 15.0
+# talk_many queues messages this many at a time
+TALK_CHUNK = 64
 
 class PhoneException(Exception) :
     pass
@@ -17,196 +29,379 @@ class PhoneSounds(Enum) :
     FAST_BUSY = 'Playing fast busy signal'
     CALL = 'Audio connection'
 
-class PhoneEmulator(Thread) :
-
-    def __init__(self, phone_number, server_url, ssl_verify=False) :
-        super().__init__()
-        self._sio = socketio.Client(ssl_verify=ssl_verify)
+# An immutable picture of a phone, published as a whole after every transition so other threads
+# can read a consistent view without locking.  version goes up by one for each new snapshot.
+class PhoneSnapshot :
+    FIELDS = ('phone_number', 'state', 'on_hook', 'sound', 'number_dialed', 'header',
+        'transcript_generation', 'transcript_lines', 'last_line')
+    __slots__ = ('version', 'timestamp') + FIELDS
+
+    def __init__(self, version, timestamp, phone_number, state, on_hook, sound, number_dialed, header,
+            transcript_generation, transcript_lines, last_line) :
+        setattr_ = object.__setattr__
+        setattr_(self, 'version', version)
+        setattr_(self, 'timestamp', timestamp)
+        setattr_(self, 'phone_number', phone_number)
+        setattr_(self, 'state', state)
+        setattr_(self, 'on_hook', on_hook)
+        setattr_(self, 'sound', sound)
+        setattr_(self, 'number_dialed', number_dialed)
+        setattr_(self, 'header', header)
+        setattr_(self, 'transcript_generation', transcript_generation)
+        setattr_(self, 'transcript_lines', transcript_lines)
+        setattr_(self, 'last_line', last_line)
+
+    def __setattr__(self, name, value) :
+        raise AttributeError('PhoneSnapshot is immutable')
+
+    def __delattr__(self, name) :
+        raise AttributeError('PhoneSnapshot is immutable')
+
+    def __repr__(self) :
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in ('version',) + self.FIELDS)
+        return f'PhoneSnapshot({fields})'
+
+    # The names of the fields that differ from other (everything, if other is None)
+    def changed_fields(self, other) :
+        if other is None :
+            return frozenset(self.FIELDS)
+        return frozenset(name for name in self.FIELDS if getattr(self, name) != getattr(other, name))
+
+class PhoneState(IntEnum) :
+    DISCONNECTED = 0
+    UNREGISTERED = 1
+    REGISTRATION_FAILED = 2
+    ON_HOOK_IDLE = 3
+    OFF_HOOK_DIALING = 4
+    INIT_OUTGOING_CALL = 5
+    CALL_BUSY = 6
+    CALL_NOT_AVAILABLE = 7
+    OUTGOING_CALL_RINGING = 8
+    CALL_CONNECTED = 9
+    CALL_ENDED = 10
+    INCOMING_CALL_RINGING = 11
+    INCOMING_CALL_FINALIZE = 12
+    INIT_CALL_BLOCKING = 13
+
+class PhoneEventType(IntEnum) :
+    SERVER_CONNECT = 0
+    SERVER_CONNECT_ERROR = 1
+    SERVER_DISCONNECT = 2
+    REGISTERED = 3
+    REGISTRATION_FAILED = 4
+    CALL_REQUEST = 5
+    CALLEE_RINGING = 6
+    CALLEE_BUSY = 7
+    CALLEE_NOT_AVAILABLE = 8
+    CALL_TIMEOUT = 9
+    CALL_CONNECTED = 10
+    CALL_CANCELLED = 11
+    CALL_ENDED = 12
+    INCOMING_TALK = 13
+    KEY_PRESS = 14
+    ON_HOOK = 15
+    OFF_HOOK = 16
+    OUTGOING_TALK = 17
+    SHUTDOWN = 18
+    RECONNECT = 19
+    MEDIA_TICK = 20
+    INCOMING_MEDIA = 21
+
+class PhoneEvent :
+    __slots__ = ('type', 'data')
+
+    def __init__(self, type, data=None) :
+        self.type = type
+        self.data = data
+
+    def __repr__(self) :
+        return f'PhoneEvent({self.type.name}, {self.data!r})'
+
+# carries no data, so one will do for every media timer
+_MEDIA_TICK = PhoneEvent(PhoneEventType.MEDIA_TICK)
+# Their handlers never change anything a snapshot shows, so they don't publish one
+_MEDIA_EVENTS = (PhoneEventType.MEDIA_TICK, PhoneEventType.INCOMING_MEDIA)
+
+# The handlers shared by every emulator flavour (the transition table is _TRANSITIONS, below).
+# Subclasses supply the socket (self._sio), the event queue (_put_event) and outgoing messages
+# (_emit), then feed queued events through _dispatch.  Timers come from a shared timer wheel
+# (see timer_wheel.py).
+class PhoneStateMachine :
+    __slots__ = ('_sio', '_timers', '_clock', '_phone_number', '_server_url', '_on_hook', '_sound', '_number_dialed',
+        '_emit_hangup', '_transcript', '_call_timer', '_state', '_guis', '_subscribers', '_snapshot', '_latency_recorder',
+        '_latency_mark', '_trace', '_reconnect_policy', '_reconnect_attempt', '_reconnect_timer', '_media',
+        '_media_stream', '_media_timer', '_media_due', '_talk', '_talk_batch', '_profile', '_event_log')
+
+    # the names the handlers (and tests) use for each state
+    _disconnected = PhoneState.DISCONNECTED
+    _unregistered = PhoneState.UNREGISTERED
+    _registration_failed = PhoneState.REGISTRATION_FAILED
+    _on_hook_idle = PhoneState.ON_HOOK_IDLE
+    _off_hook_dialing = PhoneState.OFF_HOOK_DIALING
+    _init_outgoing_call = PhoneState.INIT_OUTGOING_CALL
+    _call_busy = PhoneState.CALL_BUSY
+    _call_not_available = PhoneState.CALL_NOT_AVAILABLE
+    _outgoing_call_ringing = PhoneState.OUTGOING_CALL_RINGING
+    _call_connected = PhoneState.CALL_CONNECTED
+    _call_ended = PhoneState.CALL_ENDED
+    _incoming_call_ringing = PhoneState.INCOMING_CALL_RINGING
+    _incoming_call_finalize = PhoneState.INCOMING_CALL_FINALIZE
+    _init_call_blocking = PhoneState.INIT_CALL_BLOCKING
+
+    def __init__(self, phone_number, server_url, timers=None, transcript=None, clock=time.monotonic,
+            latency_recorder=None, trace=None, reconnect_policy=None, media=None, talk_capacity=DEFAULT_CAPACITY,
+            talk_policy=DROP, talk_batch=1, profile=None, event_log=None) :
+        self._sio = None
+        self._timers = timers
+        self._clock = clock
         self._phone_number = phone_number
         self._server_url = server_url
         self._on_hook = True
         self._sound = PhoneSounds.SILENT
         self._number_dialed = ''
         self._emit_hangup = False
-        self._call_dialogue = 'Not connected to server'
+        self._transcript = transcript if transcript is not None else Transcript()
+        self._transcript.reset('Not connected to server')
         self._call_timer = None
-        self._events = Queue()
-
-        self._sio.on('connect', self._socket_connect_event)
-        self._sio.on('connect_error', self._socket_connect_error_event)
-        self._sio.on('disconnect', self._socket_disconnect_event)
-        self._sio.on('registered', self._socket_registered_event)
-        self._sio.on('call_request', self._socket_call_request_event)
-        self._sio.on('callee_ringing', self._socket_callee_ringing_event)
-        self._sio.on('call_not_possible', self._socket_call_not_possible_event)
-        #self._sio.on('callee_busy', self._socket_callee_busy_event)
-        #self._sio.on('callee_not_available', self._socket_callee_not_available_event)
-        #self._sio.on('call_timeout', self._socket_call_timeout_event)
-        self._sio.on('call_cancelled', self._socket_call_cancelled_event)
-        self._sio.on('call_connected', self._socket_call_connected_event)
-        self._sio.on('call_ended', self._socket_call_ended_event)
-        self._sio.on('talk', self._socket_talk_event)
-
-        self._disconnected = {
-            'server_connect' : self._server_connect_event,
-            'server_connect_error' : self._server_connect_error_event,
-            'on_hook' : self._disconnected_on_hook_event,
-            'off_hook' : self._disconnected_off_hook_event
-        }
-
-        self._unregistered = {
-            'registered' : self._phone_registered_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._registration_failed = {
-            'on_hook' : self._disconnected_on_hook_event,
-            'off_hook' : self._disconnected_off_hook_event
-        }
-
-        self._on_hook_idle = {
-            'off_hook' : self._off_hook_event,
-            'call_request' : self._incoming_call_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._off_hook_dialing = {
-            'on_hook' : self._on_hook_event,
-            'key_press' : self._dialing_key_press_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._init_outgoing_call = {
-            'on_hook' : self._on_hook_event,
-            'callee_busy' : self._call_busy_event,
-            'callee_not_available' : self._call_not_available_event,
-            'callee_ringing' : self._outgoing_call_ringing_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'call_connected' : self._call_connected_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._call_busy = {
-            'on_hook' : self._on_hook_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._call_not_available = {
-            'on_hook' : self._on_hook_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._outgoing_call_ringing = {
-            'on_hook' : self._on_hook_event,
-            'call_connected' : self._call_connected_event,
-            'call_timeout' : self._call_not_available_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'callee_not_available' : self._call_not_available_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._call_connected = {
-            'on_hook' : self._on_hook_event,
-            'outgoing_talk' : self._outgoing_talk_event,
-            'incoming_talk' : self._incoming_talk_event,
-            'call_ended' : self._call_ended_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._call_ended = {
-            'on_hook' : self._on_hook_event,
-            'call_request' : self._invalid_incoming_call_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._incoming_call_ringing = {
-            'call_request' : self._invalid_incoming_call_event,
-            'call_timeout' : self._incoming_call_timeout_event,
-            'off_hook' : self._incoming_call_accept_event,
-            'call_cancelled' : self._incoming_call_cancelled_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._incoming_call_finalize = {
-            'call_request' : self._invalid_incoming_call_event,
-            'call_connected' : self._call_connected_event,
-            'call_cancelled' : self._incoming_call_cancelled_while_offhook_event,
-            'server_disconnect' : self._server_disconnect_event
-        }
-
-        self._init_call_blocking = {}
-
-        self._state = self._disconnected
-        self._guis = []
 
-    def run(self) :
-        try :
-            self._sio.connect(self._server_url, auth={"phoneNumber" : self._phone_number})
-        except socketio.client.exceptions.ConnectionError :
-            # this gets handled in the event loop
-            pass
-
-        while True :
-            event = self._events.get()
-            
-            # print(event)
-            if event[0] == 'shutdown' :
-                if self._emit_hangup :
-                    self._sio.emit('hang_up')
-                break
-            else :
-                handler = self._state.get(event[0])
-                if handler != None :
-                    self._state = handler(event)
-            self._events.task_done()
-        
-        self._sio.disconnect()
+        self._state = PhoneState.DISCONNECTED
+        self._guis = []
+        self._subscribers = []
+        self._snapshot = None
+        # see latency.py
+        self._latency_recorder = latency_recorder
+        self._latency_mark = None
+        # see event_trace.py
+        self._trace = trace.phone(phone_number) if trace is not None else None
+        # see event_log.py
+        if event_log is not None :
+            event_log.register(phone_number)
+        self._event_log = event_log
+        # see reconnect.py.  Without a policy, a phone that loses the server stays disconnected.
+        self._reconnect_policy = reconnect_policy
+        self._reconnect_attempt = 0
+        self._reconnect_timer = None
+        # see media.py.  Without MediaStats, calls carry nothing but talk.
+        self._media = media
+        self._media_stream = None
+        self._media_timer = None
+        self._media_due = None
+        # see talk_buffer.py.  With talk_batch > 1, queued talk goes out up to talk_batch messages at
+        # a time in 'talk_batch' events, which only switch_server.py understands.
+        self._talk = TalkBuffer(talk_capacity, talk_policy)
+        self._talk_batch = talk_batch
+        # see profiling.py.  Off (None) unless it has been turned on for the whole process.
+        self._profile = profile if profile is not None else default_handler_profile()
+        self._publish_snapshot()
+
+    # The display text, rebuilt from the transcript on demand
+    @property
+    def _call_dialogue(self) :
+        return self._transcript.text()
+
+    def _register_socket_events(self) :
+        # with profiling on, every callback is timed (see profiling.py)
+        on = self._sio.on if self._profile is None else self._on_profiled
+        on('connect', self._socket_connect_event)
+        on('connect_error', self._socket_connect_error_event)
+        on('disconnect', self._socket_disconnect_event)
+        on('registered', self._socket_registered_event)
+        on('call_request', self._socket_call_request_event)
+        on('callee_ringing', self._socket_callee_ringing_event)
+        on('call_not_possible', self._socket_call_not_possible_event)
+        #on('callee_busy', self._socket_callee_busy_event)
+        #on('callee_not_available', self._socket_callee_not_available_event)
+        #on('call_timeout', self._socket_call_timeout_event)
+        on('call_cancelled', self._socket_call_cancelled_event)
+        on('call_connected', self._socket_call_connected_event)
+        on('call_ended', self._socket_call_ended_event)
+        on('talk', self._socket_talk_event)
+        on('talk_batch', self._socket_talk_batch_event)
+        on('media', self._socket_media_event)
+
+    def _on_profiled(self, name, callback) :
+        self._sio.on(name, self._profile.wrap_socket_callback(self, name, callback))
+
+    def _put_event(self, event) :
+        raise NotImplementedError
+
+    def _emit(self, event, *args) :
+        raise NotImplementedError
+
+    # Starts connecting to the server again, without waiting for the outcome: a successful
+    # connection arrives as a connect event, and a failed one as a connect_error
+    def _reconnect(self) :
+        raise NotImplementedError
+
+    def _start_timer(self, delay, callback) :
+        return self._timers.schedule(delay, callback)
+
+    # For the driver to call as the phone shuts down, to stop anything still scheduled
+    def _shutting_down(self) :
+        self._cancel_reconnect()
+        self._leave_call()
+
+    def _dispatch(self, event) :
+        if self._apply(event) and event.type not in _MEDIA_EVENTS :
+            self._publish_snapshot()
+
+    # Dispatches a batch of queued events.  Subscribers still see every transition, but the GUIs
+    # are only notified once, after the whole batch.
+    def _dispatch_batch(self, events) :
+        applied = False
+        changed = False
+        for event in _coalesce_events(events) :
+            if self._apply(event) and event.type not in _MEDIA_EVENTS :
+                applied = True
+                if self._subscribers :
+                    changed |= self._publish_snapshot(notify_guis=False)
+        if applied and (self._publish_snapshot(notify_guis=False) or changed) :
+            self._notify_guis()
+
+    # Runs the handler for event, if there is one in the current state.  Returns whether there was.
+    def _apply(self, event) :
+        trace = self._trace
+        if trace is not None :
+            trace.event(event)
+        handler = _TRANSITIONS[self._state][event.type]
+        if handler is None :
+            if event.type == PhoneEventType.OUTGOING_TALK :
+                # queued before the call ended (or before there was one)
+                self._talk.drop(len(event.data) if isinstance(event.data, list) else 1)
+            if self._event_log is not None :
+                self._event_log.record(self._phone_number, self._state, self._state, event, False)
+            return False
+        old_state = self._state
+        if self._profile is None :
+            self._state = handler(self, event)
+        else :
+            self._state = self._profile.call(handler, self, event, old_state)
+        if trace is not None :
+            trace.transition(self._state)
+        if self._latency_recorder is not None :
+            self._latency_mark = self._latency_recorder.transition(self._phone_number, self._number_dialed,
+                old_state, self._state, self._latency_mark)
+        if self._event_log is not None :
+            self._event_log.record(self._phone_number, old_state, self._state, event)
+        return True
+
+    # Returns whether anything changed
+    def _publish_snapshot(self, notify_guis=True) :
+        transcript = self._transcript
+        previous = self._snapshot
+        snapshot = PhoneSnapshot(previous.version + 1 if previous is not None else 0, self._clock(),
+            self._phone_number, self._state, self._on_hook, self._sound,
+            self._number_dialed, transcript.header, transcript.generation, transcript.line_count,
+            transcript.last_line)
+        changed = snapshot.changed_fields(previous)
+        if not changed :
+            return False
+        self._snapshot = snapshot
+        if notify_guis :
+            self._notify_guis()
+        for listener, fields in self._subscribers :
+            if fields is None or not changed.isdisjoint(fields) :
+                listener(snapshot, changed)
+        return True
 
     def _server_connect_event(self, event) :
-        self._call_dialogue = None
-        self._notify_guis()
+        self._transcript.reset()
         return self._unregistered
     
     def _server_connect_error_event(self, event) :
-        error = event[1]
+        error = event.data
         if isinstance(error, dict) and 'message' in error :
             error = error['message']
+        elif self._reconnect_attempt and self._schedule_reconnect() :
+            # the server is still unreachable (a refusal from the server itself comes as a dict,
+            # and is final)
+            return self._state
+        if self._reconnect_attempt :
+            self._reconnect_policy.stats.give_up(self._phone_number)
+            self._reconnect_attempt = 0
         self._sound = PhoneSounds.SILENT
-        self._call_dialogue = f'An error occurred ({error}).  Please contact your systems administrator for assistance.'
-        self._notify_guis()
-        self._events.put(('shutdown',))
+        self._transcript.reset(f'An error occurred ({error}).  Please contact your systems administrator for assistance.')
+        self._put_event(PhoneEvent(PhoneEventType.SHUTDOWN))
         return self._registration_failed
 
     def _server_disconnect_event(self, event) :
         self._sound = PhoneSounds.SILENT
-        self._call_dialogue = 'Not connected to server'
+        self._transcript.reset('Not connected to server')
         if self._call_timer is not None :
-            if self._call_timer.is_alive() :
-                self._call_timer.cancel()
+            self._call_timer.cancel()
             self._call_timer = None
+        self._leave_call()
+        self._schedule_reconnect()
         
-        self._notify_guis()
         return self._disconnected
 
+    # Schedules the next reconnection attempt, as the policy sees fit.  Returns False once the
+    # policy gives up.
+    def _schedule_reconnect(self) :
+        policy = self._reconnect_policy
+        if policy is None :
+            return False
+        if self._reconnect_timer is not None :
+            # already scheduled (socketio can report one failure more than once)
+            return True
+        attempt = self._reconnect_attempt
+        if attempt == 0 :
+            policy.stats.disconnected(self._phone_number)
+        else :
+            policy.stats.failed()
+        delay = policy.delay(attempt)
+        if delay is None :
+            policy.stats.give_up(self._phone_number)
+            self._reconnect_attempt = 0
+            return False
+        self._reconnect_attempt = attempt + 1
+        self._reconnect_timer = self._start_timer(delay, self._reconnect_timeout)
+        return True
+
+    def _reconnect_timeout(self) :
+        self._put_event(PhoneEvent(PhoneEventType.RECONNECT))
+
+    # the same, once the phone holds a token from the policy's limiter
+    def _reconnect_token_timeout(self) :
+        self._put_event(PhoneEvent(PhoneEventType.RECONNECT, True))
+
+    def _reconnect_event(self, event) :
+        self._reconnect_timer = None
+        policy = self._reconnect_policy
+        if policy is None :
+            return self._state
+        if not event.data :
+            wait = policy.limiter.reserve()
+            if wait > 0 :
+                # the process is reconnecting as fast as it's allowed to
+                self._reconnect_timer = self._start_timer(wait, self._reconnect_token_timeout)
+                return self._state
+        policy.stats.attempt()
+        self._transcript.reset(f'Reconnecting to server (attempt {self._reconnect_attempt})')
+        self._reconnect()
+        return self._state
+
+    def _cancel_reconnect(self) :
+        if self._reconnect_timer is not None :
+            self._reconnect_timer.cancel()
+            self._reconnect_timer = None
+
     def _disconnected_on_hook_event(self, event) :
         self._on_hook = True
-        self._notify_guis()
         return self._state
 
     def _disconnected_off_hook_event(self, event) :
         self._on_hook = False
-        self._notify_guis()
         return self._state
 
     def _phone_registered_event(self, event) :
-        self._phone_number = event[1]
+        self._phone_number = event.data
         self._number_dialed = ''
-        self._call_dialogue = None
+        self._transcript.reset()
         self._emit_hangup = False
+        if self._reconnect_attempt :
+            self._reconnect_policy.stats.reconnected(self._phone_number)
+            self._reconnect_attempt = 0
         
         ret = self._state
         if self._on_hook :
@@ -215,129 +410,168 @@ class PhoneEmulator(Thread) :
         else :
             self._sound = PhoneSounds.DIAL_TONE
             ret = self._off_hook_dialing
-        self._notify_guis()
         return ret
 
     def _off_hook_event(self, event) :
         self._on_hook = False
         self._sound = PhoneSounds.DIAL_TONE
         self._number_dialed = ''
-        self._call_dialogue = None
-        self._notify_guis()
+        self._transcript.reset()
         return self._off_hook_dialing
 
     def _on_hook_event(self, event) :
         self._on_hook = True
         self._sound = PhoneSounds.SILENT
-        self._call_dialogue = None
+        self._transcript.reset()
+        self._leave_call()
 
         if self._emit_hangup :
             # need to emit a 'hang_up' event
-            self._sio.emit('hang_up')
+            self._emit('hang_up')
             self._emit_hangup = False
 
-        self._notify_guis()
         return self._on_hook_idle
 
     def _dialing_key_press_event(self, event) :
-        self._number_dialed += event[1]
-        ret = self._state
-
-        if len(self._number_dialed) >= 4 :
-            number_dialed = self._number_dialed[-4:]
-            if number_dialed.isnumeric() :
-                # attempt to initiate a call
-                self._number_dialed = number_dialed
-                self._sio.emit('make_call', self._number_dialed)
+        # consecutive key presses can arrive together (see _coalesce_events).  Once a key starts
+        # a call, the rest are dropped, just as they would be one at a time.
+        for key in event.data :
+            self._number_dialed += key
+
+            if len(self._number_dialed) >= 4 :
+                number_dialed = self._number_dialed[-4:]
+                if number_dialed.isnumeric() :
+                    # attempt to initiate a call
+                    self._number_dialed = number_dialed
+                    self._emit('make_call', self._number_dialed)
+                    self._sound = PhoneSounds.SILENT
+                    self._emit_hangup = True
+                    return self._init_outgoing_call
+            elif len(self._number_dialed) >= 3 and self._number_dialed[-3:] == '#70' :
+                # attempt to initiate call blocking
+                # self._emit_hangup = True
+                self._emit('call_blocking_check_auth')
                 self._sound = PhoneSounds.SILENT
-                self._emit_hangup = True
-                ret = self._init_outgoing_call
-        elif len(self._number_dialed) >= 3 and self._number_dialed[-3:] == '#70' :
-            # attempt to initiate call blocking
-            # self._emit_hangup = True
-            self._sio.emit('call_blocking_check_auth')
-            self._sound = PhoneSounds.SILENT
-            ret = self._init_call_blocking
+                return self._init_call_blocking
 
-        self._notify_guis()
-        return ret
+        return self._state
 
     def _outgoing_call_ringing_event(self, event) :
         self._sound = PhoneSounds.RINGING
-        self._notify_guis()
         return self._outgoing_call_ringing
 
     def _call_busy_event(self, event) :
         self._sound = PhoneSounds.BUSY
         self._emit_hangup = False
-        self._notify_guis()
         return self._call_busy
 
     def _call_not_available_event(self, event) :
         self._sound = PhoneSounds.FAST_BUSY
         self._emit_hangup = False
-        self._notify_guis()
         return self._call_not_available
 
     def _call_connected_event(self, event) :
-        self._call_dialogue = f'Connected to {self._number_dialed}'
+        self._transcript.reset(f'Connected to {self._number_dialed}')
         self._sound = PhoneSounds.CALL
         if self._state == self._outgoing_call_ringing :
-            self._sio.emit('call_accepted')
-        self._notify_guis()
+            self._emit('call_accepted')
+        if self._media is not None and self._media_stream is None :
+            self._media_stream = self._media.stream()
+            self._media_due = self._clock()
+            self._send_media_frame()
         return self._call_connected
 
-    def _outgoing_talk_event(self, event) :
-        talk = event[1]
-        self._sio.emit('talk', talk)
-        if self._call_dialogue :
-            self._call_dialogue += f'\n{self._phone_number} : {talk}'
+    def _send_media_frame(self) :
+        stream = self._media_stream
+        self._emit('media', stream.next_frame())
+        # keep to the frame rate, but don't try to make up for frames the phone fell behind on
+        now = self._clock()
+        self._media_due = max(self._media_due + stream.frame_seconds, now)
+        if self._media_timer is None :
+            self._media_timer = self._start_timer(self._media_due - now, self._media_timeout)
         else :
-            self._call_dialogue = f'{self._phone_number} : {talk}'
-        
-        self._notify_guis()
+            # one timer for the whole call, rather than one per frame
+            self._timers.reschedule(self._media_timer, self._media_due - now)
+
+    def _media_timeout(self) :
+        self._put_event(_MEDIA_TICK)
+
+    def _media_tick_event(self, event) :
+        if self._media_stream is not None :
+            self._send_media_frame()
         return self._state
 
-    def _incoming_talk_event(self, event) :
-        talk = event[1]
-        if self._call_dialogue :
-            self._call_dialogue += f'\n{self._number_dialed} : {talk}'
+    def _incoming_media_event(self, event) :
+        if self._media_stream is not None :
+            self._media_stream.receive(event.data)
+        return self._state
+
+    # Stops what only makes sense during a call.  Talk still on the way is dropped.
+    def _leave_call(self) :
+        self._stop_media()
+        self._talk.discard()
+
+    def _stop_media(self) :
+        if self._media_timer is not None :
+            self._media_timer.cancel()
+            self._media_timer = None
+        if self._media_stream is not None :
+            self._media.add(self._media_stream)
+            self._media_stream = None
+
+    # event.data is a message, or a list of them (see talk_many and _coalesce_events)
+    def _outgoing_talk_event(self, event) :
+        messages = event.data if isinstance(event.data, list) else [event.data]
+        batch = self._talk_batch
+        if batch > 1 and len(messages) > 1 :
+            for i in range(0, len(messages), batch) :
+                chunk = messages[i:i + batch]
+                if len(chunk) > 1 :
+                    self._emit('talk_batch', chunk)
+                else :
+                    self._emit('talk', chunk[0])
+                self._talk.sent_batch(len(chunk))
         else :
-            self._call_dialogue = f'{self._number_dialed} : {talk}'
+            for talk in messages :
+                self._emit('talk', talk)
+                self._talk.sent_batch(1)
+        phone_number = self._phone_number
+        self._transcript.extend(f'{phone_number} : {talk}' for talk in messages)
+        return self._state
 
-        self._notify_guis()
+    def _incoming_talk_event(self, event) :
+        messages = event.data if isinstance(event.data, list) else [event.data]
+        number_dialed = self._number_dialed
+        self._transcript.extend(f'{number_dialed} : {talk}' for talk in messages)
         return self._state
 
     def _call_ended_event(self, event) :
+        self._leave_call()
         self._sound = PhoneSounds.SILENT
-        self._call_dialogue = self._call_dialogue[18:]
+        # drop the 'Connected to ####' header, but leave the conversation up
+        self._transcript.set_header(None)
         self._emit_hangup = False
-        self._notify_guis()
         return self._call_ended
 
     def _incoming_call_event(self, event) :
         self._sound = PhoneSounds.RINGING
-        self._number_dialed = event[1]
-        self._sio.emit('call_acknowledged', event[1])
-        self._notify_guis()
-        self._call_timer = Timer(15.0, self._incoming_call_timeout)
-        self._call_timer.start()
-        self._notify_guis()
+        self._number_dialed = event.data
+        self._emit('call_acknowledged', event.data)
+        self._call_timer = self._start_timer(CALL_TIMEOUT, self._incoming_call_timeout)
         return self._incoming_call_ringing
 
     def _incoming_call_timeout(self) :
-        self._events.put(('call_timeout',))
+        self._put_event(PhoneEvent(PhoneEventType.CALL_TIMEOUT))
 
     def _invalid_incoming_call_event(self, event) :
-        self._sio.emit('call_refused', (event[1], 'busy'))
+        self._emit('call_refused', (event.data, 'busy'))
         return self._state
 
     def _incoming_call_timeout_event(self, event) :
         self._sound = PhoneSounds.SILENT
-        self._sio.emit('call_refused', (self._number_dialed, 'timeout'))
+        self._emit('call_refused', (self._number_dialed, 'timeout'))
         self._number_dialed = ''
         self._call_timer = None
-        self._notify_guis()
         return self._on_hook_idle
 
     def _incoming_call_accept_event(self, event) :
@@ -346,8 +580,7 @@ class PhoneEmulator(Thread) :
         self._on_hook = False
         self._emit_hangup = True
         self._sound = PhoneSounds.CALL
-        self._sio.emit('call_accepted')
-        self._notify_guis()
+        self._emit('call_accepted')
         return self._incoming_call_finalize
 
     def _incoming_call_cancelled_event(self, event) :
@@ -355,81 +588,133 @@ class PhoneEmulator(Thread) :
         self._call_timer = None
         self._sound = PhoneSounds.SILENT
         self._emit_hangup = False
-        self._notify_guis()
         return self._on_hook_idle
 
     def _incoming_call_cancelled_while_offhook_event(self, event) :
         self._sound = PhoneSounds.FAST_BUSY
         self._emit_hangup = False
-        self._notify_guis()
         return self._call_not_available
 
     # socket events begin here
     def _socket_connect_event(self) :
-        self._events.put(('server_connect',))
+        self._put_event(PhoneEvent(PhoneEventType.SERVER_CONNECT))
 
     def _socket_connect_error_event(self, data) :
-        self._events.put(('server_connect_error', data))
+        self._put_event(PhoneEvent(PhoneEventType.SERVER_CONNECT_ERROR, data))
 
     def _socket_disconnect_event(self) :
-        self._events.put(('server_disconnect',))
+        self._put_event(PhoneEvent(PhoneEventType.SERVER_DISCONNECT))
 
     def _socket_registered_event(self, phone_number) :
-        self._events.put(('registered', phone_number))
+        self._put_event(PhoneEvent(PhoneEventType.REGISTERED, phone_number))
 
     def _socket_register_failed_event(self, reason) :
-        self._events.put(('registration_failed', reason))
+        self._put_event(PhoneEvent(PhoneEventType.REGISTRATION_FAILED, reason))
 
     def _socket_call_request_event(self, caller_number) :
-        self._events.put(('call_request', caller_number))
+        self._put_event(PhoneEvent(PhoneEventType.CALL_REQUEST, caller_number))
 
     def _socket_callee_ringing_event(self) :
-        self._events.put(('callee_ringing',))
+        self._put_event(PhoneEvent(PhoneEventType.CALLEE_RINGING))
 
     def _socket_call_not_possible_event(self, reason) :
         if reason == 'busy' :
-            self._events.put(('callee_busy',))
+            self._put_event(PhoneEvent(PhoneEventType.CALLEE_BUSY))
         elif reason == 'timeout' :
-            self._events.put(('call_timeout',))
+            self._put_event(PhoneEvent(PhoneEventType.CALL_TIMEOUT))
         else :
-            self._events.put(('callee_not_available',))
+            self._put_event(PhoneEvent(PhoneEventType.CALLEE_NOT_AVAILABLE))
 
     #def _socket_callee_busy_event(self) :
-    #    self._events.put(('callee_busy',))
+    #    self._put_event(PhoneEvent(PhoneEventType.CALLEE_BUSY))
 
     #def _socket_callee_not_available_event(self) :
-    #    self._events.put(('callee_not_available',))
+    #    self._put_event(PhoneEvent(PhoneEventType.CALLEE_NOT_AVAILABLE))
 
     def _socket_call_connected_event(self) :
-        self._events.put(('call_connected',))
+        self._put_event(PhoneEvent(PhoneEventType.CALL_CONNECTED))
 
     def _socket_call_timeout_event(self) :
-        self._events.put(('call_timeout',))
+        self._put_event(PhoneEvent(PhoneEventType.CALL_TIMEOUT))
 
     def _socket_talk_event(self, msg) :
-        self._events.put(('incoming_talk', msg))
+        self._put_event(PhoneEvent(PhoneEventType.INCOMING_TALK, msg))
+
+    def _socket_talk_batch_event(self, messages) :
+        self._put_event(PhoneEvent(PhoneEventType.INCOMING_TALK, messages))
+
+    def _socket_media_event(self, frame) :
+        self._put_event(PhoneEvent(PhoneEventType.INCOMING_MEDIA, frame))
 
     def _socket_call_ended_event(self) :
-        self._events.put(('call_ended',))
+        self._put_event(PhoneEvent(PhoneEventType.CALL_ENDED))
 
     def _socket_call_cancelled_event(self) :
-        self._events.put(('call_cancelled',))
+        self._put_event(PhoneEvent(PhoneEventType.CALL_CANCELLED))
 
     # External/GUI methods start here
     def key_press(self, key) :
-        self._events.put(('key_press', key))
+        self._put_event(PhoneEvent(PhoneEventType.KEY_PRESS, key))
 
     def on_hook(self) :
-        self._events.put(('on_hook',))
+        self._put_event(PhoneEvent(PhoneEventType.ON_HOOK))
 
     def off_hook(self) :
-        self._events.put(('off_hook',))
+        self._put_event(PhoneEvent(PhoneEventType.OFF_HOOK))
 
     def shutdown(self) :
-        self._events.put(('shutdown',))
-
-    def talk(self, msg) :
-        self._events.put(('outgoing_talk', msg))
+        self._put_event(PhoneEvent(PhoneEventType.SHUTDOWN))
+
+    # Says msg on the current call.  Returns whether it was queued: talk beyond the talk buffer's
+    # capacity (once timeout runs out, under BLOCK) is dropped, and so is talk that reaches the state
+    # machine outside a connected call (counted in talk_stats()).
+    def talk(self, msg, timeout=None) :
+        return self.talk_many((msg,), timeout) == 1
+
+    # Says each of messages (any iterable, consumed as it goes) in turn.  Returns how many were queued.
+    def talk_many(self, messages, timeout=None) :
+        queued = 0
+        chunk = []
+        for msg in messages :
+            chunk.append(msg)
+            if len(chunk) == TALK_CHUNK :
+                queued += self._queue_talk(chunk, timeout)
+                chunk = []
+        if chunk :
+            queued += self._queue_talk(chunk, timeout)
+        return queued
+
+    def _queue_talk(self, messages, timeout) :
+        accepted = self._talk.reserve(len(messages), timeout)
+        if accepted :
+            self._put_event(PhoneEvent(PhoneEventType.OUTGOING_TALK, messages[0] if accepted == 1 else messages[:accepted]))
+        return accepted
+
+    # queued, dropped and sent talk (see TalkBuffer).  Safe to call from any thread.
+    def talk_stats(self) :
+        return self._talk.stats()
+
+    # The latest published PhoneSnapshot.  Safe to call from any thread.
+    def snapshot(self) :
+        return self._snapshot
+
+    # The transcript's header and its lines since cursor, read together (see
+    # Transcript.read_with_header), for a display that keeps up with it a few lines at a time.
+    # Safe to call from any thread.
+    def read_transcript(self, cursor=None) :
+        return self._transcript.read_with_header(cursor)
+
+    # How many lines the transcript keeps
+    def transcript_max_lines(self) :
+        return self._transcript.max_lines
+
+    # listener(snapshot, changed_fields) is called on the emulator's thread after each transition
+    # that changed any of fields (any field at all, if fields is None)
+    def subscribe(self, listener, fields=None) :
+        self._subscribers.append((listener, frozenset(fields) if fields is not None else None))
+
+    def unsubscribe(self, listener) :
+        self._subscribers = [entry for entry in self._subscribers if entry[0] != listener]
 
     def register_gui(self, gui) :
         self._guis.append(gui)
@@ -441,20 +726,422 @@ class PhoneEmulator(Thread) :
             pass # Do I care about this?
 
     def _notify_guis(self) :
+        if self._profile is not None :
+            started = self._profile.clock()
         for gui in self._guis :
             gui.notify()
+        if self._profile is not None :
+            self._profile.record(self._state.name, '-', '_notify_guis', self._profile.clock() - started)
+
+# Merges runs of consecutive key presses into a single event carrying all of the keys, and runs
+# of outgoing talk into a single event carrying a list of all of the messages (so they can be
+# batched)
+def _coalesce_events(events) :
+    coalesced = []
+    keys = None
+    talk = None
+    for event in events :
+        if event.type == PhoneEventType.KEY_PRESS :
+            if keys is None :
+                keys = []
+            keys.append(event.data)
+            continue
+        if keys is not None :
+            coalesced.append(PhoneEvent(PhoneEventType.KEY_PRESS, ''.join(keys)))
+            keys = None
+        if event.type == PhoneEventType.OUTGOING_TALK :
+            if talk is None :
+                talk = []
+            talk.append(event)
+            continue
+        if talk is not None :
+            coalesced.append(_merge_talk(talk))
+            talk = None
+        coalesced.append(event)
+    if keys is not None :
+        coalesced.append(PhoneEvent(PhoneEventType.KEY_PRESS, ''.join(keys)))
+    if talk is not None :
+        coalesced.append(_merge_talk(talk))
+    return coalesced
+
+def _merge_talk(events) :
+    if len(events) == 1 :
+        return events[0]
+    messages = []
+    for event in events :
+        if isinstance(event.data, list) :
+            messages.extend(event.data)
+        else :
+            messages.append(event.data)
+    return PhoneEvent(PhoneEventType.OUTGOING_TALK, messages)
+
+# The transition table: _TRANSITIONS[state][event type] is the handler to run, or None if the
+# event is ignored in that state.  Built once for the class rather than per phone.
+def _build_transition_table(spec) :
+    table = []
+    for state in PhoneState :
+        row = [None] * len(PhoneEventType)
+        for event_type, handler in spec.get(state, {}).items() :
+            row[event_type] = handler
+        table.append(tuple(row))
+    return tuple(table)
+
+_TRANSITIONS = _build_transition_table({
+    PhoneState.DISCONNECTED : {
+        PhoneEventType.SERVER_CONNECT : PhoneStateMachine._server_connect_event,
+        PhoneEventType.SERVER_CONNECT_ERROR : PhoneStateMachine._server_connect_error_event,
+        PhoneEventType.RECONNECT : PhoneStateMachine._reconnect_event,
+        PhoneEventType.ON_HOOK : PhoneStateMachine._disconnected_on_hook_event,
+        PhoneEventType.OFF_HOOK : PhoneStateMachine._disconnected_off_hook_event
+    },
+
+    PhoneState.UNREGISTERED : {
+        PhoneEventType.REGISTERED : PhoneStateMachine._phone_registered_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.REGISTRATION_FAILED : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._disconnected_on_hook_event,
+        PhoneEventType.OFF_HOOK : PhoneStateMachine._disconnected_off_hook_event
+    },
+
+    PhoneState.ON_HOOK_IDLE : {
+        PhoneEventType.OFF_HOOK : PhoneStateMachine._off_hook_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._incoming_call_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.OFF_HOOK_DIALING : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.KEY_PRESS : PhoneStateMachine._dialing_key_press_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.INIT_OUTGOING_CALL : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.CALLEE_BUSY : PhoneStateMachine._call_busy_event,
+        PhoneEventType.CALLEE_NOT_AVAILABLE : PhoneStateMachine._call_not_available_event,
+        PhoneEventType.CALLEE_RINGING : PhoneStateMachine._outgoing_call_ringing_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.CALL_CONNECTED : PhoneStateMachine._call_connected_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.CALL_BUSY : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.CALL_NOT_AVAILABLE : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.OUTGOING_CALL_RINGING : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.CALL_CONNECTED : PhoneStateMachine._call_connected_event,
+        PhoneEventType.CALL_TIMEOUT : PhoneStateMachine._call_not_available_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.CALLEE_NOT_AVAILABLE : PhoneStateMachine._call_not_available_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.CALL_CONNECTED : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.OUTGOING_TALK : PhoneStateMachine._outgoing_talk_event,
+        PhoneEventType.INCOMING_TALK : PhoneStateMachine._incoming_talk_event,
+        PhoneEventType.MEDIA_TICK : PhoneStateMachine._media_tick_event,
+        PhoneEventType.INCOMING_MEDIA : PhoneStateMachine._incoming_media_event,
+        PhoneEventType.CALL_ENDED : PhoneStateMachine._call_ended_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.CALL_ENDED : {
+        PhoneEventType.ON_HOOK : PhoneStateMachine._on_hook_event,
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.INCOMING_CALL_RINGING : {
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.CALL_TIMEOUT : PhoneStateMachine._incoming_call_timeout_event,
+        PhoneEventType.OFF_HOOK : PhoneStateMachine._incoming_call_accept_event,
+        PhoneEventType.CALL_CANCELLED : PhoneStateMachine._incoming_call_cancelled_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.INCOMING_CALL_FINALIZE : {
+        PhoneEventType.CALL_REQUEST : PhoneStateMachine._invalid_incoming_call_event,
+        PhoneEventType.CALL_CONNECTED : PhoneStateMachine._call_connected_event,
+        PhoneEventType.CALL_CANCELLED : PhoneStateMachine._incoming_call_cancelled_while_offhook_event,
+        PhoneEventType.SERVER_DISCONNECT : PhoneStateMachine._server_disconnect_event
+    },
+
+    PhoneState.INIT_CALL_BLOCKING : {}
+})
+
+# socketio (and the transports it pulls in: requests, websocket-client and aiohttp) takes a few
+# hundred milliseconds to import, so it is only imported, and the client created, once the
+# emulator's thread starts connecting.
+#
+# transports and serializer are handed to socketio: transports=['websocket'] connects straight
+# over a websocket instead of starting on long-polling and upgrading, and serializer='msgpack'
+# sends binary msgpack packets instead of JSON text (the server has to use the same serializer).
+#
+# Instead of start()ing the thread, an emulator can be driven one step at a time from the calling
+# thread with step() and process_pending(), on a ManualTimerWheel (see timer_wheel.py) so that
+# timers only fire when the caller advances it too.
+class PhoneEmulator(PhoneStateMachine, Thread) :
+
+    def __init__(self, phone_number, server_url, ssl_verify=False, timers=None, transcript=None, latency_recorder=None,
+            trace=None, reconnect_policy=None, transports=None, serializer='default', media=None,
+            talk_capacity=DEFAULT_CAPACITY, talk_policy=DROP, talk_batch=1, clock=time.monotonic, profile=None,
+            event_log=None) :
+        Thread.__init__(self)
+        if reconnect_policy is None :
+            from reconnect import default_reconnect_policy
+            reconnect_policy = default_reconnect_policy()
+        if latency_recorder is None :
+            from latency import default_latency_recorder
+            latency_recorder = default_latency_recorder()
+        # an empty wheel is falsy (len() is its pending timers), so test for None
+        if timers is None :
+            timers = default_timer_wheel()
+        PhoneStateMachine.__init__(self, phone_number, server_url, timers, transcript, clock=clock,
+            latency_recorder=latency_recorder, trace=trace, reconnect_policy=reconnect_policy, media=media,
+            talk_capacity=talk_capacity, talk_policy=talk_policy, talk_batch=talk_batch, profile=profile,
+            event_log=event_log)
+        self._ssl_verify = ssl_verify
+        self._transports = transports
+        self._serializer = serializer
+        self._events = EventQueue()
+        self._opened = False
+        self._stopped = False
+
+    def run(self) :
+        self._open()
+        # handle everything that has piled up since the last wakeup together
+        while self._handle_batch(self._events.get_batch()) :
+            pass
+        self._sio.disconnect()
+
+    # Handles whatever has been queued so far without blocking, and returns how many events that
+    # was.  The first step connects, as start() would.  After a shutdown, it does nothing.
+    def step(self) :
+        if self._stopped :
+            return 0
+        if not self._opened :
+            self._open()
+        events = self._events.get_batch(0)
+        if events and not self._handle_batch(events) :
+            self._sio.disconnect()
+        return len(events)
+
+    # Steps until nothing is left queued, events queued by the handlers themselves included.
+    # Returns how many events were handled.
+    def process_pending(self) :
+        handled = 0
+        while True :
+            count = self.step()
+            if not count :
+                return handled
+            handled += count
+
+    def _open(self) :
+        self._opened = True
+        if self._sio is None :
+            import socketio
+            # reconnecting is left to the reconnect policy
+            self._sio = socketio.Client(ssl_verify=self._ssl_verify, reconnection=False, serializer=self._serializer)
+            self._register_socket_events()
+        self._connect()
+
+    # Dispatches one wakeup's worth of events.  Returns False once the phone has shut down.
+    def _handle_batch(self, events) :
+        for i, event in enumerate(events) :
+            if event.type == PhoneEventType.SHUTDOWN :
+                self._dispatch_batch(events[:i])
+                self._shutting_down()
+                if self._emit_hangup :
+                    self._sio.emit('hang_up')
+                self._events.task_done(i)
+                self._stopped = True
+                return False
+        self._dispatch_batch(events)
+        self._events.task_done(len(events))
+        return True
+
+    def _connect(self) :
+        import socketio
+
+        try :
+            self._sio.connect(self._server_url, auth={"phoneNumber" : self._phone_number}, transports=self._transports)
+        except socketio.exceptions.ConnectionError :
+            # this gets handled in the event loop
+            pass
+
+    def _put_event(self, event) :
+        self._events.put(event)
+
+    def _emit(self, event, *args) :
+        self._sio.emit(event, *args)
+
+    # connecting blocks, so it gets a thread of its own rather than holding up the event loop
+    def _reconnect(self) :
+        Thread(target=self._connect, daemon=True).start()
+
+# Runs phone with no GUI until it shuts down, Ctrl-C or SIGTERM.  Prints how long after the
+# process started the phone registered (or why it couldn't), and returns an exit status.
+def run_headless(phone) :
+    import signal
+
+    registered = []
+    def report(snapshot, changed) :
+        if snapshot.state == PhoneState.ON_HOOK_IDLE and not registered :
+            registered.append(True)
+            print(f'{snapshot.phone_number} registered {time.perf_counter() - _PROCESS_STARTED:.3f}s after start', flush=True)
+        elif snapshot.state == PhoneState.REGISTRATION_FAILED :
+            print(f'{snapshot.phone_number} failed to register: {snapshot.header}', flush=True)
+    phone.subscribe(report, ('state',))
+    signal.signal(signal.SIGTERM, lambda signum, frame : phone.shutdown())
+
+    phone.start()
+    try :
+        while phone.is_alive() :
+            phone.join(0.5)
+    except KeyboardInterrupt :
+        phone.shutdown()
+        phone.join()
+    return 0 if registered else 1
 
 if __name__ == '__main__' :
     import argparse
-    from phone_gui import create_gui
+
+    from profiling import CPROFILE, SAMPLE, WINDOW_MODES, ProfileWindow, enable_handler_profile
+
+    DEFAULT_SERVER_URL = 'http://localhost:5000'
 
     parser = argparse.ArgumentParser(description='Run a phone emulator for the model phone system.')
-    parser.add_argument('phone_number', help='Four digit phone number')
-    parser.add_argument('server_url', default='http://localhost:5000', nargs='?')
+    parser.add_argument('phone_number', nargs='?', help='Four digit phone number (omit when using --fleet)')
+    parser.add_argument('server_url', default=DEFAULT_SERVER_URL, nargs='?')
     parser.add_argument('--ssl_verify', action='store_true', help='Verify SSL certificates')
+    parser.add_argument('--headless', action='store_true',
+        help='Run without the GUI (tkinter is never imported) and report how long the phone took to register')
+    parser.add_argument('--fleet', metavar='RANGE', help='Run a headless fleet of phones instead, e.g. 0001-4999')
+    parser.add_argument('--workers', type=int, help='Number of fleet worker processes (default: one per core)')
+    parser.add_argument('--max_concurrent_connects', type=int, default=100,
+        help='Maximum number of phones connecting at once in each fleet worker')
+    parser.add_argument('--latency_report', metavar='PATH',
+        help='Write the call setup latency histograms here on exit (Prometheus text if PATH ends in .prom, else JSON)')
+    parser.add_argument('--trunk_size', type=int,
+        help='Carry this many fleet phones over each connection, one socket.io namespace per phone (needs switch_server.py)')
+    parser.add_argument('--max_reconnects_per_second', type=float, default=50.0,
+        help='Limit on each fleet worker\'s reconnection attempts after losing the server')
+    parser.add_argument('--websocket_only', action='store_true',
+        help='Connect straight over a websocket, skipping HTTP long-polling and the upgrade')
+    parser.add_argument('--msgpack', action='store_true',
+        help='Send binary msgpack packets instead of JSON text (needs msgpack, and a server run with --msgpack)')
+    parser.add_argument('--media', action='store_true',
+        help='Send and receive 20 ms audio frames while connected, and report jitter, loss and delay')
+    parser.add_argument('--trace', metavar='PATH',
+        help='Record every event and transition to a binary trace for event_trace.py (a fleet writes PATH.<worker>)')
+    parser.add_argument('--event_log', metavar='PATH',
+        help='Log every event dispatched, with the states before and after, for event_log.py (a fleet writes PATH.<worker>)')
+    parser.add_argument('--status_board', metavar='NAME',
+        help='Keep the fleet\'s states and counters in shared memory under NAME, for status_board.py to watch')
+    parser.add_argument('--profile', metavar='PATH',
+        help='Time every handler and socket callback, and write the totals here as JSON on exit (see profiling.py)')
+    parser.add_argument('--profile_window', type=float, metavar='SECONDS',
+        help='With --profile, also profile the first SECONDS as a whole, to PATH.window (a fleet writes PATH.window.<worker>)')
+    parser.add_argument('--profile_mode', choices=WINDOW_MODES, default=SAMPLE,
+        help='How --profile_window profiles: sampled stacks of every thread, or cProfile (fleets only)')
     args = parser.parse_args()
-    
-    phone = PhoneEmulator(args.phone_number, args.server_url, args.ssl_verify)
-    phone.start()
-
-    create_gui(phone)
\ No newline at end of file
+    if args.profile_window is not None and args.profile is None :
+        parser.error('--profile_window needs --profile')
+    if args.status_board is not None and args.fleet is None :
+        parser.error('--status_board needs --fleet')
+    if args.profile_mode == CPROFILE and args.profile_window is not None and args.fleet is None :
+        parser.error('--profile_mode cprofile only sees one thread, so it needs --fleet')
+    transports = ['websocket'] if args.websocket_only else None
+    serializer = 'msgpack' if args.msgpack else 'default'
+
+    if args.fleet is not None :
+        from fleet import parse_number_range, run_fleet, write_latency_report
+
+        # with --fleet, a single positional argument is the server url
+        if args.phone_number is not None :
+            if args.server_url != DEFAULT_SERVER_URL :
+                parser.error('phone_number cannot be combined with --fleet')
+            args.server_url = args.phone_number
+        latency_recorder = run_fleet(parse_number_range(args.fleet), args.server_url, args.ssl_verify, args.workers,
+            args.max_concurrent_connects, args.trace, args.max_reconnects_per_second, args.trunk_size, transports,
+            serializer, args.media, args.profile, args.profile_window, args.profile_mode, args.event_log,
+            args.status_board)
+        if args.latency_report is not None :
+            write_latency_report(latency_recorder, args.latency_report)
+    else :
+        if args.phone_number is None :
+            parser.error('a phone_number (or --fleet) is required')
+        trace = None
+        if args.trace is not None :
+            from event_trace import TraceWriter
+            trace = TraceWriter(args.trace)
+        media = None
+        if args.media :
+            from media import MediaStats
+            media = MediaStats()
+        event_log = None
+        if args.event_log is not None :
+            from event_log import EventLog
+            event_log = EventLog(args.event_log)
+        handler_profile = None
+        window = None
+        if args.profile is not None :
+            handler_profile = enable_handler_profile()
+            if args.profile_window is not None :
+                import threading
+                window = ProfileWindow(args.profile + '.window', args.profile_mode)
+                window.start()
+                stop_window = threading.Timer(args.profile_window, window.stop)
+                stop_window.daemon = True
+                stop_window.start()
+        # the phone records into it by default, so report what it recorded at exit
+        from latency import default_latency_recorder
+        latency_recorder = default_latency_recorder()
+        phone = PhoneEmulator(args.phone_number, args.server_url, args.ssl_verify, latency_recorder=latency_recorder,
+            trace=trace, transports=transports, serializer=serializer, media=media, event_log=event_log)
+        try :
+            if args.headless :
+                import sys
+                sys.exit(run_headless(phone))
+
+            from phone_gui import create_gui
+
+            phone.start()
+            create_gui(phone)
+        finally :
+            if phone.is_alive() and any(output is not None for output in (trace, media, handler_profile, event_log)) :
+                phone.shutdown()
+                phone.join()
+            if trace is not None :
+                trace.close()
+            if event_log is not None :
+                event_log.close()
+            if media is not None :
+                print(f'Media: {media.summary()}')
+            if window is not None :
+                window.stop()
+            if handler_profile is not None :
+                handler_profile.write(args.profile)
+                print(handler_profile.report())
+            for phase, summary in latency_recorder.summary().items() :
+                if summary['count'] :
+                    print(f'{phase}: p50 {summary["p50"] / 1e6:.1f}ms, max {summary["max"] / 1e6:.1f}ms '
+                        f'({summary["count"]} samples)')
+            if args.latency_report is not None :
+                from fleet import write_latency_report
+                write_latency_report(latency_recorder, args.latency_report)
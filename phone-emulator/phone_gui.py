@@ -1,12 +1,64 @@
 import tkinter as tk
 import tkinter.messagebox
+from queue import SimpleQueue, Empty
+
+# redraw at most this often, no matter how fast the phone is changing
+FRAME_INTERVAL_MS = 33
+
+# The first line of the display
+def status_text(snapshot) :
+    if snapshot.on_hook :
+        return f'{snapshot.phone_number}: On hook ({snapshot.sound.value})'
+    return f'{snapshot.phone_number}: Off hook ({snapshot.sound.value}).  Dialing {snapshot.number_dialed}'
+
+# Empties queue, and returns whether there was anything in it
+def drain(queue) :
+    drained = False
+    try :
+        while True :
+            queue.get_nowait()
+            drained = True
+    except Empty :
+        pass
+    return drained
+
+# The part of a phone's transcript on the display, kept up to date a few lines at a time.  The
+# header and lines always come from one read of the transcript (see
+# PhoneStateMachine.read_transcript), so they never mix two points in time.
+class TranscriptView :
+    __slots__ = ('header', 'shown_lines', '_max_lines', '_cursor')
+
+    def __init__(self, max_lines) :
+        self.header = None
+        self.shown_lines = 0
+        self._max_lines = max_lines
+        self._cursor = None
+
+    # Reads what is new in phone's transcript.  Returns None if nothing is, or (restart, lines,
+    # excess): the display has to start over from self.header if restart, then append lines, then
+    # drop excess lines from the top to stay within the transcript's own bound.
+    def update(self, phone) :
+        header, reset, lines, self._cursor = phone.read_transcript(self._cursor)
+        if not reset and header != self.header :
+            # start over, with the lines that go with the new header
+            header, reset, lines, self._cursor = phone.read_transcript()
+        if not reset and not lines :
+            return None
+        if reset :
+            self.header = header
+            self.shown_lines = 0
+        self.shown_lines += len(lines)
+        excess = max(0, self.shown_lines - self._max_lines)
+        self.shown_lines -= excess
+        return reset, lines, excess
 
 class PhoneGui(tk.Frame) :
     def __init__(self, phone, master=None) :
         super().__init__(master)
 
-        phone.register_gui(self)
         self.phone = phone
+        self._changes = SimpleQueue()
+        self._after_id = None
 
         # display_frame is just for the text box and scroll bar
         self.display_frame = tk.Frame(self)
@@ -31,7 +83,14 @@ class PhoneGui(tk.Frame) :
         self.button_0 = tk.Button(self, text='0', padx=40, pady=20, command=lambda : self.phone.key_press('0'))
         self.button_pound = tk.Button(self, text='#', padx=40, pady=20, command=lambda : self.phone.key_press('#'))
         self.button_on_off_hook = tk.Button(self)
-        self.notify()
+
+        # what's currently on screen, so each frame only touches what changed
+        self._shown_on_hook = None
+        self._shown_status = None
+        self._transcript = TranscriptView(phone.transcript_max_lines())
+        self._render()
+        phone.register_gui(self)
+        self._after_id = self.after(FRAME_INTERVAL_MS, self._poll)
 
         self.display_text.pack(side=tk.LEFT, fill=tk.Y)
         self.display_scroll.pack(side=tk.RIGHT, fill=tk.Y)
@@ -65,28 +124,60 @@ class PhoneGui(tk.Frame) :
             self.talk_entry.delete(0, tk.END)
             self.phone.talk(msg)
 
-    # The underlying phone emulator has updated, so poll it for data
+    # The underlying phone emulator has updated.  This is called from the emulator's thread, so
+    # just note it and let _poll pick it up on the Tk thread.
     def notify(self) :
-        phone_number = self.phone._phone_number
-        if self.phone._on_hook :
-            self.button_on_off_hook['text'] = 'Lift receiver'
-            self.button_on_off_hook['command'] = self.off_hook
-            phone_str = f'{phone_number}: On hook ({self.phone._sound.value})'
-        else :
-            self.button_on_off_hook['text'] = 'Return receiver'
-            self.button_on_off_hook['command'] = self.on_hook
-            phone_str = f'{phone_number}: Off hook ({self.phone._sound.value}).  Dialing {self.phone._number_dialed}'
-
-        if self.phone._call_dialogue is not None :
-            phone_str += '\n' + self.phone._call_dialogue
+        self._changes.put(None)
+
+    def _poll(self) :
+        # a burst of notifications only costs one redraw
+        if drain(self._changes) :
+            self._render()
+        self._after_id = self.after(FRAME_INTERVAL_MS, self._poll)
+
+    def _render(self) :
+        snapshot = self.phone.snapshot()
+        on_hook = snapshot.on_hook
+        if on_hook != self._shown_on_hook :
+            if on_hook :
+                self.button_on_off_hook.config(text='Lift receiver', command=self.off_hook)
+            else :
+                self.button_on_off_hook.config(text='Return receiver', command=self.on_hook)
+            self._shown_on_hook = on_hook
+
+        status = status_text(snapshot)
+        update = self._transcript.update(self.phone)
+        if status == self._shown_status and update is None :
+            return
 
         self.display_text.config(state='normal')
-        self.display_text.delete('1.0', tk.END)
-        self.display_text.insert(tk.END, phone_str)
-        self.display_text.see(tk.END)
+        if status != self._shown_status :
+            self.display_text.delete('1.0', '1.end')
+            self.display_text.insert('1.0', status)
+            self._shown_status = status
+
+        if update is not None :
+            restart, lines, excess = update
+            header = self._transcript.header
+            if restart :
+                # start the transcript over from the line after the status
+                self.display_text.delete('1.end', tk.END)
+                if header is not None :
+                    self.display_text.insert(tk.END, '\n' + header)
+            if lines :
+                self.display_text.insert(tk.END, '\n' + '\n'.join(lines))
+                # keep the widget as bounded as the transcript itself
+                if excess :
+                    first = 2 if header is None else 3
+                    self.display_text.delete(f'{first}.0', f'{first + excess}.0')
+                self.display_text.see(tk.END)
         self.display_text.config(state='disabled')
 
     def shutdown(self, close_phone=True) :
+        self.phone.unregister_gui(self)
+        if self._after_id is not None :
+            self.after_cancel(self._after_id)
+            self._after_id = None
         if close_phone :
             self.phone.shutdown()
         self.master.destroy()
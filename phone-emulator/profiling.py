@@ -0,0 +1,226 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Set to anything but '' or '0' to profile the handlers of every phone in the process, with a
+# report printed to stderr at exit (see default_handler_profile)
+ENV_VAR = 'PHONE_EMULATOR_PROFILE'
+
+SAMPLE = 'sample'
+CPROFILE = 'cprofile'
+WINDOW_MODES = (SAMPLE, CPROFILE)
+
+# How often the sampling profiler looks at every thread's stack
+DEFAULT_SAMPLE_INTERVAL = 0.001
+
+# Call counts, and cumulative and peak time, for each (state, event, handler) a phone ran: the
+# handlers in the state machine's transition table, keyed by the state they ran in and the
+# event type, socket callbacks (event 'socket <name>'), and GUI notifications (event '-').
+# Times are integer nanoseconds.  One profile can be shared by any number of phones and threads.
+class HandlerProfile :
+
+    def __init__(self, clock=time.perf_counter_ns) :
+        self.clock = clock
+        self._lock = threading.Lock()
+        # (state, event, handler) -> [count, total, peak]
+        self._stats = {}
+
+    def __len__(self) :
+        return len(self._stats)
+
+    # Runs handler(phone, event), which phone is running in state, and times it
+    def call(self, handler, phone, event, state) :
+        started = self.clock()
+        try :
+            return handler(phone, event)
+        finally :
+            self.record(state.name, event.type.name, handler.__name__, self.clock() - started)
+
+    # Wraps a phone's socket callback so that each call is timed (under the state the phone was in)
+    def wrap_socket_callback(self, phone, name, callback) :
+        event = f'socket {name}'
+        handler = callback.__name__
+        def timed(*args) :
+            started = self.clock()
+            try :
+                return callback(*args)
+            finally :
+                self.record(phone._state.name, event, handler, self.clock() - started)
+        return timed
+
+    def record(self, state, event, handler, elapsed) :
+        key = (state, event, handler)
+        with self._lock :
+            stats = self._stats.get(key)
+            if stats is None :
+                self._stats[key] = [1, elapsed, elapsed]
+            else :
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2] :
+                    stats[2] = elapsed
+
+    def merge(self, other) :
+        with other._lock :
+            items = [(key, list(stats)) for key, stats in other._stats.items()]
+        with self._lock :
+            for key, (count, total, peak) in items :
+                stats = self._stats.get(key)
+                if stats is None :
+                    self._stats[key] = [count, total, peak]
+                else :
+                    stats[0] += count
+                    stats[1] += total
+                    stats[2] = max(stats[2], peak)
+
+    # One dict per (state, event, handler), most total time first
+    def rows(self) :
+        with self._lock :
+            items = sorted(self._stats.items(), key=lambda item : item[1][1], reverse=True)
+        return [{
+            'state' : state,
+            'event' : event,
+            'handler' : handler,
+            'count' : count,
+            'total_ms' : round(total / 1e6, 3),
+            'mean_us' : round(total / count / 1e3, 3),
+            'peak_us' : round(peak / 1e3, 3)
+        } for (state, event, handler), (count, total, peak) in items]
+
+    # The top rows as a text table
+    def report(self, top=20) :
+        lines = [f'{"total ms":>10} {"count":>9} {"mean us":>9} {"peak us":>10}  state / event / handler']
+        for row in self.rows()[:top] :
+            lines.append(f'{row["total_ms"]:>10.1f} {row["count"]:>9} {row["mean_us"]:>9.1f} {row["peak_us"]:>10.1f}  '
+                f'{row["state"]} / {row["event"]} / {row["handler"]}')
+        return '\n'.join(lines)
+
+    def write(self, path) :
+        with open(path, 'w', encoding='utf-8') as f :
+            json.dump({'handlers' : self.rows()}, f, indent=2)
+
+    # For shipping between processes (see from_dict and merge)
+    def to_dict(self) :
+        with self._lock :
+            return {'stats' : [[*key, *stats] for key, stats in self._stats.items()]}
+
+    @classmethod
+    def from_dict(cls, values) :
+        profile = cls()
+        for state, event, handler, count, total, peak in values['stats'] :
+            profile._stats[(state, event, handler)] = [count, total, peak]
+        return profile
+
+_default_profile = None
+_default_profile_checked = False
+_default_profile_lock = threading.Lock()
+
+def _print_default_report() :
+    if _default_profile is not None and len(_default_profile) :
+        print(_default_profile.report(), file=sys.stderr)
+
+# The profile every phone created in this process records into, or None (the default) if
+# profiling is off: then a phone pays one branch per event for it.  Setting ENV_VAR turns it on
+# for the whole process, as does enable_handler_profile (for phones created afterwards).
+def default_handler_profile() :
+    global _default_profile, _default_profile_checked
+    with _default_profile_lock :
+        if not _default_profile_checked :
+            _default_profile_checked = True
+            if os.environ.get(ENV_VAR, '') not in ('', '0') :
+                _default_profile = HandlerProfile()
+                atexit.register(_print_default_report)
+        return _default_profile
+
+def enable_handler_profile() :
+    global _default_profile, _default_profile_checked
+    with _default_profile_lock :
+        _default_profile_checked = True
+        if _default_profile is None :
+            _default_profile = HandlerProfile()
+        return _default_profile
+
+# Samples every other thread's stack every interval seconds, and counts the stacks it saw in the
+# collapsed ('outer;inner;innermost count') format that flamegraph.pl and speedscope read.
+class SamplingProfiler :
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL) :
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) :
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) :
+        self._stop.set()
+        if self._thread is not None :
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) :
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval) :
+            for ident, frame in sys._current_frames().items() :
+                if ident == me :
+                    continue
+                stack = []
+                while frame is not None :
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) :
+        return [f'{stack} {count}' for stack, count in self._stacks.most_common()]
+
+    def write(self, path) :
+        with open(path, 'w', encoding='utf-8') as f :
+            f.write('\n'.join(self.collapsed()) + '\n')
+
+# A stretch of whole-program profiling, written to path when it stops: sampled stacks of every
+# thread (SAMPLE; path gets collapsed stacks), or cProfile (CPROFILE; path gets pstats).
+# cProfile only sees the thread the window was started on, and has to be stopped on it too, so
+# it's for an event loop hosting the phones, not for threaded PhoneEmulators.
+class ProfileWindow :
+
+    def __init__(self, path, mode=SAMPLE, interval=DEFAULT_SAMPLE_INTERVAL) :
+        if mode not in WINDOW_MODES :
+            raise ValueError(f'Invalid profile window mode: {mode}')
+        self.path = path
+        self.mode = mode
+        self._interval = interval
+        self._profiler = None
+
+    @property
+    def running(self) :
+        return self._profiler is not None
+
+    def start(self) :
+        if self.mode == CPROFILE :
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else :
+            self._profiler = SamplingProfiler(self._interval)
+            self._profiler.start()
+
+    def stop(self) :
+        profiler = self._profiler
+        if profiler is None :
+            return
+        self._profiler = None
+        if self.mode == CPROFILE :
+            profiler.disable()
+            profiler.dump_stats(self.path)
+        else :
+            profiler.stop()
+            profiler.write(self.path)
@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+
+DEFAULT_INITIAL_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+# connection attempts per second (and burst) allowed by the process's token bucket
+DEFAULT_RATE = 50.0
+DEFAULT_BURST = 50
+
+# Spaces out events to rate per second on average, allowing bursts of up to burst at once.
+# Rather than blocking, reserve() hands out the time to wait, so the same bucket works for
+# threads, event loops and simulations (it is the generic cell rate algorithm).  Tokens are
+# handed out in the order they are asked for, so ask when the event is due, not ahead of time.
+class TokenBucket :
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, clock=time.monotonic) :
+        if rate <= 0 or burst < 1 :
+            raise ValueError('TokenBucket needs a positive rate and a burst of at least 1')
+        self._interval = 1.0 / rate
+        self._tolerance = (burst - 1) * self._interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # the theoretical time the next token is due
+        self._next = float('-inf')
+
+    # Takes the next token.  Returns how long to wait before using it (0 if it's available now).
+    def reserve(self) :
+        with self._lock :
+            now = self._clock()
+            start = max(now, self._next - self._tolerance)
+            self._next = max(self._next, start) + self._interval
+            return start - now
+
+# Counts reconnection attempts, and times reconnect storms: a storm starts when a phone loses the
+# server while none is in progress, and ends once every phone that dropped out has registered
+# again (or given up).  Timestamps come from clock, in integer nanoseconds.
+class ReconnectStats :
+    COUNTERS = ('disconnects', 'attempts', 'failures', 'reconnects', 'gave_up')
+
+    def __init__(self, clock=time.perf_counter_ns) :
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._down = set()
+        self._storm_started = None
+        self.peak_down = 0
+        self.storm_durations = []
+        for name in self.COUNTERS :
+            setattr(self, name, 0)
+
+    @property
+    def in_storm(self) :
+        return self._storm_started is not None
+
+    def disconnected(self, phone_number) :
+        with self._lock :
+            self.disconnects += 1
+            if self._storm_started is None :
+                self._storm_started = self._clock()
+            self._down.add(phone_number)
+            self.peak_down = max(self.peak_down, len(self._down))
+
+    def attempt(self) :
+        with self._lock :
+            self.attempts += 1
+
+    def failed(self) :
+        with self._lock :
+            self.failures += 1
+
+    def reconnected(self, phone_number) :
+        with self._lock :
+            self.reconnects += 1
+            self._back(phone_number)
+
+    def give_up(self, phone_number) :
+        with self._lock :
+            self.gave_up += 1
+            self._back(phone_number)
+
+    def _back(self, phone_number) :
+        self._down.discard(phone_number)
+        if not self._down and self._storm_started is not None :
+            self.storm_durations.append((self._clock() - self._storm_started) / 1e9)
+            self._storm_started = None
+
+    def merge(self, other) :
+        with self._lock :
+            for name in self.COUNTERS :
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+            self.peak_down = max(self.peak_down, other.peak_down)
+            self.storm_durations.extend(other.storm_durations)
+
+    def summary(self) :
+        with self._lock :
+            durations = self.storm_durations
+            summary = {name : getattr(self, name) for name in self.COUNTERS}
+            summary.update({
+                'storms' : len(durations),
+                'in_storm' : self._storm_started is not None,
+                'phones_down' : len(self._down),
+                'peak_phones_down' : self.peak_down,
+                'mean_storm_seconds' : sum(durations) / len(durations) if durations else None,
+                'max_storm_seconds' : max(durations) if durations else None
+            })
+            return summary
+
+    # For shipping between processes (see from_dict and merge).  Storms still in progress are left out.
+    def to_dict(self) :
+        with self._lock :
+            values = {name : getattr(self, name) for name in self.COUNTERS}
+            values['peak_down'] = self.peak_down
+            values['storm_durations'] = list(self.storm_durations)
+            return values
+
+    @classmethod
+    def from_dict(cls, values) :
+        stats = cls()
+        for name in cls.COUNTERS :
+            setattr(stats, name, values[name])
+        stats.peak_down = values['peak_down']
+        stats.storm_durations = list(values['storm_durations'])
+        return stats
+
+# When to try reconnecting after the server goes away: exponential backoff with full jitter
+# (a uniformly random delay up to initial_delay * multiplier ** attempt, capped at max_delay), so
+# phones that dropped together spread themselves out, and on top of that limiter, a token bucket
+# shared by every phone in the process that each attempt needs a token from, so a whole fleet
+# can't hit the server's auth middleware at once.  Phones share a policy; it holds no per-phone
+# state.
+class ReconnectPolicy :
+
+    def __init__(self, initial_delay=DEFAULT_INITIAL_DELAY, max_delay=DEFAULT_MAX_DELAY, multiplier=2.0,
+            max_attempts=None, limiter=None, stats=None, rng=None) :
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_attempts = max_attempts
+        self.limiter = limiter if limiter is not None else TokenBucket()
+        self.stats = stats if stats is not None else ReconnectStats()
+        self._rng = rng if rng is not None else random.Random()
+
+    # Seconds to wait before attempt (counting from 0), or None to give up
+    def delay(self, attempt) :
+        if self.max_attempts is not None and attempt >= self.max_attempts :
+            return None
+        # (the cap keeps the power from overflowing after a long outage)
+        ceiling = min(self.max_delay, self.initial_delay * self.multiplier ** min(attempt, 64))
+        return self._rng.uniform(0.0, ceiling)
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+# The policy (and so the token bucket and stats) shared by every phone in this process
+def default_reconnect_policy() :
+    global _default_policy
+    with _default_policy_lock :
+        if _default_policy is None :
+            _default_policy = ReconnectPolicy()
+        return _default_policy
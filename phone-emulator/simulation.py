@@ -0,0 +1,308 @@
+import heapq
+import itertools
+import random
+
+from latency import LatencyRecorder
+from phone_emulator import PhoneEvent, PhoneEventType, PhoneStateMachine, PhoneState
+from reconnect import DEFAULT_RATE, ReconnectPolicy, ReconnectStats, TokenBucket
+from switch import Switch
+
+DEFAULT_LATENCY = 0.005
+
+# Returned by Simulation.call_later/schedule
+class SimulationHandle :
+    __slots__ = ('_entry', '_callback')
+
+    def __init__(self, entry) :
+        self._entry = entry
+        # the entry loses it on cancel, but reschedule needs it back
+        self._callback = entry[2]
+
+    def cancel(self) :
+        self._entry[2] = None
+
+    def cancelled(self) :
+        return self._entry[2] is None
+
+    def is_alive(self) :
+        return self._entry[2] is not None
+
+# A deterministic discrete-event driver.  Callbacks run in time order (ties in the order they
+# were scheduled), and the clock jumps straight from one event to the next, so simulated hours
+# pass in however long the callbacks themselves take.  It doubles as the timer scheduler and the
+# clock for SimulatedPhones.
+class Simulation :
+
+    def __init__(self, start=0.0) :
+        self._now = start
+        self._queue = []
+        self._sequence = itertools.count()
+        self.events_processed = 0
+
+    @property
+    def now(self) :
+        return self._now
+
+    # usable anywhere a clock function is expected
+    def clock(self) :
+        return self._now
+
+    # the same, in integer nanoseconds (for a LatencyRecorder)
+    def clock_ns(self) :
+        return int(self._now * 1e9)
+
+    def call_at(self, when, callback, *args) :
+        return SimulationHandle(self._push(when, callback, args))
+
+    def call_later(self, delay, callback, *args) :
+        return self.call_at(self._now + delay, callback, *args)
+
+    def call_soon(self, callback, *args) :
+        return self.call_at(self._now, callback, *args)
+
+    # the timer scheduler interface the emulators use
+    def schedule(self, delay, callback) :
+        return self.call_later(delay, callback)
+
+    # Runs handle's callback again delay seconds from now (moving it, if it is still pending)
+    def reschedule(self, handle, delay) :
+        handle.cancel()
+        handle._entry = self._push(self._now + delay, handle._callback, handle._entry[3])
+        return handle
+
+    def _push(self, when, callback, args) :
+        entry = [max(when, self._now), next(self._sequence), callback, args]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    # Runs events until the queue is empty, or the next event is after until
+    def run(self, until=None) :
+        queue = self._queue
+        processed = 0
+        while queue :
+            if until is not None and queue[0][0] > until :
+                break
+            when, _, callback, args = heapq.heappop(queue)
+            if callback is None :
+                continue
+            self._now = when
+            callback(*args)
+            processed += 1
+        if until is not None and until > self._now :
+            self._now = until
+        self.events_processed += processed
+        return processed
+
+# Stands in for a socketio.Client, carrying events between a SimulatedPhone and an in-process
+# Switch with a fixed one-way latency in simulated time
+class SimulatedSocket :
+
+    def __init__(self, simulation, switch, latency=DEFAULT_LATENCY) :
+        self._simulation = simulation
+        self._switch = switch
+        self._latency = latency
+        self._handlers = {}
+        self._number = None
+        self.connected = False
+
+    def on(self, event, handler) :
+        self._handlers[event] = handler
+
+    def connect(self, phone_number) :
+        self._number = phone_number
+        self._simulation.call_later(self._latency, self._server_connect)
+
+    def disconnect(self) :
+        if self.connected :
+            self.connected = False
+            self._simulation.call_later(self._latency, self._switch.disconnect, self._number)
+
+    # The server closing the connection
+    def drop(self) :
+        if self.connected :
+            self.connected = False
+            self._switch.disconnect(self._number, self)
+            handler = self._handlers.get('disconnect')
+            if handler is not None :
+                self._simulation.call_later(self._latency, handler)
+
+    # same argument convention as socketio: a tuple is sent as several arguments
+    def emit(self, event, data=None) :
+        if not self.connected :
+            return
+        if data is None :
+            args = ()
+        elif isinstance(data, tuple) :
+            args = data
+        else :
+            args = (data,)
+        self._simulation.call_later(self._latency, self._switch.handle, self._number, event, *args)
+
+    # called by the switch
+    def send(self, event, *args) :
+        self._simulation.call_later(self._latency, self._deliver, event, args)
+
+    def _server_connect(self) :
+        if not self._switch.accepting :
+            # as engineio reports it
+            self._deliver('connect_error', ('Connection refused by the server',))
+            return
+        error = self._switch.connect(self._number, self)
+        if error is not None :
+            self._deliver('connect_error', ({'message' : error},))
+        else :
+            self.connected = True
+            self._deliver('connect', ())
+
+    def _deliver(self, event, args) :
+        if not self.connected and event != 'connect_error' :
+            return
+        handler = self._handlers.get(event)
+        if handler is not None :
+            handler(*args)
+
+# An emulator that lives entirely inside a Simulation: events are processed as simulation
+# callbacks, timers and timestamps use simulated time, and the socket is a SimulatedSocket.
+class SimulatedPhone(PhoneStateMachine) :
+    __slots__ = ('_simulation', '_running')
+
+    def __init__(self, phone_number, simulation, switch, latency=DEFAULT_LATENCY, latency_recorder=None, trace=None,
+            reconnect_policy=None, media=None) :
+        super().__init__(phone_number, None, simulation, clock=simulation.clock, latency_recorder=latency_recorder,
+            trace=trace, reconnect_policy=reconnect_policy, media=media)
+        self._simulation = simulation
+        self._sio = SimulatedSocket(simulation, switch, latency)
+        self._running = False
+        self._register_socket_events()
+
+    def start(self) :
+        self._running = True
+        self._sio.connect(self._phone_number)
+
+    def _put_event(self, event) :
+        self._simulation.call_soon(self._process, event)
+
+    def _process(self, event) :
+        if not self._running :
+            return
+        if event.type == PhoneEventType.SHUTDOWN :
+            self._shutting_down()
+            if self._emit_hangup :
+                self._emit('hang_up')
+            self._running = False
+            self._sio.disconnect()
+        else :
+            self._dispatch(event)
+
+    def _emit(self, event, *args) :
+        self._sio.emit(event, *args)
+
+    def _reconnect(self) :
+        self._sio.connect(self._phone_number)
+
+    # Answer incoming calls after delay seconds, and hang up once the other side has
+    def auto_answer(self, delay=1.0) :
+        def on_change(snapshot, changed) :
+            if snapshot.state == PhoneState.INCOMING_CALL_RINGING :
+                self._simulation.call_later(delay, self.off_hook)
+            elif snapshot.state in (PhoneState.CALL_ENDED, PhoneState.CALL_NOT_AVAILABLE, PhoneState.CALL_BUSY) :
+                self.on_hook()
+        self.subscribe(on_change, ('state',))
+
+    # Scripts a complete outgoing call: lift the receiver at `at`, dial, say each of talk,
+    # and hang up hold seconds after dialing
+    def place_call(self, at, number, hold, talk=()) :
+        simulation = self._simulation
+        simulation.call_at(at, self.off_hook)
+        for i, key in enumerate(number) :
+            simulation.call_at(at + 0.5 * (i + 1), self.key_press, key)
+        dialed = at + 0.5 * len(number)
+        for i, msg in enumerate(talk) :
+            simulation.call_at(dialed + hold * (i + 1) / (len(talk) + 1), self.talk, msg)
+        simulation.call_at(dialed + hold, self.on_hook)
+
+# A simulation, a switch and a set of phones wired together, with call setup latencies recorded
+# in simulated time (and, with trace_path, traced in simulated time as well; see event_trace.py).
+# The phones share a reconnect policy whose backoff, token bucket and storm timings also run on
+# the simulated clock.  With media, connected calls carry audio frames, totalled in self.media.
+class SimulatedFleet :
+
+    def __init__(self, numbers, latency=DEFAULT_LATENCY, start=0.0, trace_path=None,
+            max_reconnects_per_second=DEFAULT_RATE, seed=0, media=False) :
+        self.simulation = Simulation(start)
+        self.switch = Switch(numbers, clock=self.simulation.clock)
+        self.latency_recorder = LatencyRecorder(self.simulation.clock_ns)
+        self.reconnect_policy = ReconnectPolicy(
+            limiter=TokenBucket(max_reconnects_per_second, max(1, int(max_reconnects_per_second)), self.simulation.clock),
+            stats=ReconnectStats(self.simulation.clock_ns), rng=random.Random(seed))
+        self.trace = None
+        if trace_path is not None :
+            from event_trace import TraceWriter
+            self.trace = TraceWriter(trace_path, self.simulation.clock_ns)
+        self.media = None
+        if media :
+            from media import MediaStats
+            self.media = MediaStats(self.simulation.clock_ns)
+        self.phones = {number : SimulatedPhone(number, self.simulation, self.switch, latency, self.latency_recorder,
+            self.trace, self.reconnect_policy, self.media) for number in numbers}
+
+    def start(self) :
+        for phone in self.phones.values() :
+            phone.start()
+
+    def shutdown(self) :
+        for phone in self.phones.values() :
+            phone.shutdown()
+        self.simulation.run()
+        if self.trace is not None :
+            self.trace.close()
+
+    def run(self, until=None) :
+        return self.simulation.run(until)
+
+    # Drops every phone's connection and refuses new ones for downtime seconds, as if the server
+    # had been restarted
+    def restart_server(self, downtime) :
+        self.switch.accepting = False
+        for phone in self.phones.values() :
+            phone._sio.drop()
+        self.simulation.call_later(downtime, self._server_up)
+
+    def _server_up(self) :
+        self.switch.accepting = True
+
+if __name__ == '__main__' :
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Simulate a day of calls between emulated phones in virtual time.')
+    parser.add_argument('--phones', type=int, default=1000, help='Number of phones')
+    parser.add_argument('--hours', type=float, default=24.0, help='Simulated hours to run')
+    parser.add_argument('--calls_per_phone', type=float, default=4.0, help='Calls each phone places per simulated day')
+    parser.add_argument('--hold', type=float, default=180.0, help='Average call length in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    numbers = [str(n).zfill(4) for n in range(1, args.phones + 1)]
+    fleet = SimulatedFleet(numbers)
+    for phone in fleet.phones.values() :
+        phone.auto_answer(rng.uniform(1.0, 5.0))
+    fleet.start()
+
+    duration = args.hours * 3600.0
+    calls = int(args.phones * args.calls_per_phone * args.hours / 24.0)
+    for _ in range(calls) :
+        caller, callee = rng.sample(numbers, 2)
+        fleet.phones[caller].place_call(rng.uniform(1.0, duration), callee, rng.expovariate(1.0 / args.hold))
+
+    started = time.perf_counter()
+    fleet.run(duration)
+    fleet.shutdown()
+    elapsed = time.perf_counter() - started
+
+    records = fleet.switch.call_records
+    minutes = sum(record.duration for record in records) / 60.0
+    print(f'Simulated {args.hours:g} hours with {args.phones} phones in {elapsed:.2f}s '
+        f'({fleet.simulation.events_processed} events)')
+    print(f'{calls} calls attempted, {len(records)} connected, {minutes:.0f} billable minutes')
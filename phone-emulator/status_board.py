@@ -0,0 +1,274 @@
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from phone_emulator import PhoneSounds, PhoneState
+
+MAGIC = b'PHSTAT01'
+# how often the reader summarizes the board
+REFRESH_INTERVAL = 0.1
+# how long a phone can sit in one of the TRANSIENT_STATES before it counts as stuck
+STUCK_AFTER = 30.0
+
+# States a phone should pass through, rather than stay in
+TRANSIENT_STATES = (PhoneState.UNREGISTERED, PhoneState.INIT_OUTGOING_CALL, PhoneState.OUTGOING_CALL_RINGING,
+    PhoneState.INCOMING_CALL_RINGING, PhoneState.INCOMING_CALL_FINALIZE, PhoneState.INIT_CALL_BLOCKING)
+
+SOUNDS = tuple(PhoneSounds)
+_SOUND_CODES = {sound : i for i, sound in enumerate(SOUNDS)}
+
+# magic, number of the first slot, number of slots, width of the phone numbers
+_HEADER = struct.Struct('<8sIII4x')
+HEADER_SIZE = _HEADER.size
+# state, sound (an index into SOUNDS), on hook, active (0 for numbers no phone was published
+# under), transitions, when the state last changed (seconds since the epoch), calls connected,
+# disconnects from the server
+_SLOT = struct.Struct('<BBBBIdII')
+SLOT_SIZE = _SLOT.size
+
+class StatusBoardException(Exception) :
+    pass
+
+# Each phone's state, sound and counters in a fixed layout in shared memory, one slot per number
+# from the lowest to the highest it was created for, so a whole multi-process fleet can be watched
+# from any process without asking the phones anything (see summarize).  The process that creates
+# the board owns it, and removes it on close; each worker attaches to it by name and publishes its
+# own phones.  A slot has one writer, the thread its phone runs on, and a reader sees every field as
+# of some recent write (a slot's counters might be a transition apart, but its state never tears).
+class StatusBoard :
+
+    def __init__(self, memory, owner, clock=time.time) :
+        self._memory = memory
+        self._owner = owner
+        self._clock = clock
+        magic, self._base, self._count, self._width = _HEADER.unpack_from(memory.buf)
+        if magic != MAGIC :
+            memory.close()
+            raise StatusBoardException(f'{memory.name} is not a phone status board')
+
+    # A new, empty board for numbers (with a name the OS picks, if none is given)
+    @classmethod
+    def create(cls, numbers, name=None, clock=time.time) :
+        if not numbers :
+            raise StatusBoardException('No phone numbers for the status board')
+        values = [int(number) for number in numbers]
+        base = min(values)
+        count = max(values) - base + 1
+        memory = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + count * SLOT_SIZE)
+        _HEADER.pack_into(memory.buf, 0, MAGIC, base, count, max(len(number) for number in numbers))
+        return cls(memory, True, clock)
+
+    # An existing board.  A process with its own resource tracker (anything but a worker started by
+    # the owner) has to attach with track=False, or the tracker removes the board when it exits.
+    @classmethod
+    def attach(cls, name, track=True, clock=time.time) :
+        try :
+            memory = shared_memory.SharedMemory(name)
+        except FileNotFoundError :
+            raise StatusBoardException(f'No status board named {name}')
+        if not track :
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return cls(memory, False, clock)
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *args) :
+        self.close()
+
+    def __len__(self) :
+        return self._count
+
+    @property
+    def name(self) :
+        return self._memory.name
+
+    @property
+    def clock(self) :
+        return self._clock
+
+    # The slot holding number
+    def slot(self, number) :
+        index = int(number) - self._base
+        if not 0 <= index < self._count :
+            raise StatusBoardException(f'{number} is not on the status board')
+        return index
+
+    # The number in slot
+    def number(self, slot) :
+        return str(self._base + slot).zfill(self._width)
+
+    # Keeps phone's slot up to date from its snapshots, from now on
+    def publish(self, phone) :
+        snapshot = phone.snapshot()
+        writer = _SlotWriter(self._memory.buf, HEADER_SIZE + self.slot(snapshot.phone_number) * SLOT_SIZE, self._clock)
+        writer(snapshot, None)
+        phone.subscribe(writer, ('state', 'sound', 'on_hook'))
+        return writer
+
+    # The slot of number, as a dict
+    def read(self, number) :
+        state, sound, on_hook, active, transitions, changed_at, calls, disconnects = _SLOT.unpack_from(
+            self._memory.buf, HEADER_SIZE + self.slot(number) * SLOT_SIZE)
+        if not active :
+            return None
+        return {
+            'state' : PhoneState(state),
+            'sound' : SOUNDS[sound],
+            'on_hook' : bool(on_hook),
+            'transitions' : transitions,
+            'changed_at' : changed_at,
+            'calls' : calls,
+            'disconnects' : disconnects
+        }
+
+    # Every slot as an iterator of tuples, unpacked straight from the shared memory
+    def slots(self) :
+        return _SLOT.iter_unpack(self._memory.buf[HEADER_SIZE:HEADER_SIZE + self._count * SLOT_SIZE])
+
+    # Every slot as a numpy structured array over the shared memory itself (no copy).  Needs numpy.
+    # Views have to be dropped before the board is closed.
+    def array(self) :
+        import numpy
+        return numpy.ndarray((self._count,), dtype=_numpy_dtype(), buffer=self._memory.buf, offset=HEADER_SIZE)
+
+    # Only once the phones publishing to the board have stopped
+    def close(self) :
+        if self._memory is None :
+            return
+        self._memory.close()
+        if self._owner :
+            self._memory.unlink()
+        self._memory = None
+
+_dtype = None
+
+def _numpy_dtype() :
+    global _dtype
+    if _dtype is None :
+        import numpy
+        _dtype = numpy.dtype([('state', 'u1'), ('sound', 'u1'), ('on_hook', 'u1'), ('active', 'u1'),
+            ('transitions', '<u4'), ('changed_at', '<f8'), ('calls', '<u4'), ('disconnects', '<u4')])
+        assert _dtype.itemsize == SLOT_SIZE
+    return _dtype
+
+# A phone's subscriber, which writes its slot whenever the state, sound or hook changes
+class _SlotWriter :
+    __slots__ = ('_buffer', '_offset', '_clock', '_state', '_changed_at', 'transitions', 'calls', 'disconnects')
+
+    def __init__(self, buffer, offset, clock) :
+        self._buffer = buffer
+        self._offset = offset
+        self._clock = clock
+        self._state = None
+        self._changed_at = 0.0
+        self.transitions = 0
+        self.calls = 0
+        self.disconnects = 0
+
+    def __call__(self, snapshot, changed) :
+        state = snapshot.state
+        if state != self._state :
+            if self._state is not None :
+                self.transitions += 1
+                if state == PhoneState.DISCONNECTED :
+                    self.disconnects += 1
+            if state == PhoneState.CALL_CONNECTED :
+                self.calls += 1
+            self._state = state
+            self._changed_at = self._clock()
+        _SLOT.pack_into(self._buffer, self._offset, state, _SOUND_CODES[snapshot.sound], snapshot.on_hook, 1,
+            self.transitions, self._changed_at, self.calls, self.disconnects)
+
+# The fleet at a glance: how many phones are in each state, the totals of their counters, and the
+# numbers of phones stuck in one of the TRANSIENT_STATES for more than stuck_after seconds.  Done
+# with numpy over the shared memory when it's installed, and slot by slot when it isn't.
+def summarize(board, stuck_after=STUCK_AFTER, now=None) :
+    if now is None :
+        now = board.clock()
+    try :
+        import numpy
+    except ImportError :
+        numpy = None
+
+    if numpy is not None :
+        slots = board.array()
+        active = slots['active'] != 0
+        states = slots['state']
+        counts = numpy.bincount(states[active], minlength=len(PhoneState))
+        stuck = numpy.flatnonzero(active & numpy.isin(states, TRANSIENT_STATES)
+            & (slots['changed_at'] < now - stuck_after))
+        summary = {
+            'phones' : int(active.sum()),
+            'states' : {state.name : int(counts[state]) for state in PhoneState if counts[state]},
+            'transitions' : int(slots['transitions'][active].sum()),
+            'calls' : int(slots['calls'][active].sum()),
+            'disconnects' : int(slots['disconnects'][active].sum()),
+            'stuck' : [board.number(int(slot)) for slot in stuck]
+        }
+        return summary
+
+    counts = [0] * len(PhoneState)
+    transient = frozenset(TRANSIENT_STATES)
+    phones = transitions = calls = disconnects = 0
+    stuck = []
+    for slot, values in enumerate(board.slots()) :
+        state, sound, on_hook, active, slot_transitions, changed_at, slot_calls, slot_disconnects = values
+        if not active :
+            continue
+        phones += 1
+        counts[state] += 1
+        transitions += slot_transitions
+        calls += slot_calls
+        disconnects += slot_disconnects
+        if state in transient and changed_at < now - stuck_after :
+            stuck.append(board.number(slot))
+    return {
+        'phones' : phones,
+        'states' : {state.name : counts[state] for state in PhoneState if counts[state]},
+        'transitions' : transitions,
+        'calls' : calls,
+        'disconnects' : disconnects,
+        'stuck' : stuck
+    }
+
+def summary_text(summary, max_stuck=10) :
+    counts = sorted(summary['states'].items(), key=lambda item : -item[1])
+    states = ', '.join(f'{count} {state}' for state, count in counts)
+    text = f'{summary["phones"]} phones: {states}' if states else f'{summary["phones"]} phones'
+    text += f'; {summary["calls"]} calls, {summary["disconnects"]} disconnects'
+    stuck = summary['stuck']
+    if stuck :
+        more = f' and {len(stuck) - max_stuck} more' if len(stuck) > max_stuck else ''
+        text += f'; {len(stuck)} stuck: {" ".join(stuck[:max_stuck])}{more}'
+    return text
+
+if __name__ == '__main__' :
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Watch a fleet through its status board (see phone_emulator.py --status_board).')
+    parser.add_argument('name', help='The status board\'s shared memory name')
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL, help='Seconds between summaries')
+    parser.add_argument('--stuck', type=float, default=STUCK_AFTER,
+        help='Seconds in a transient state (dialing out, ringing, ...) before a phone counts as stuck')
+    parser.add_argument('--once', action='store_true', help='Print one summary and exit')
+    args = parser.parse_args()
+
+    try :
+        board = StatusBoard.attach(args.name, track=False)
+    except StatusBoardException as e :
+        parser.error(str(e))
+    # on a terminal, each summary overwrites the last
+    end = '\n' if args.once or not sys.stdout.isatty() else '\x1b[K\r'
+    try :
+        while True :
+            print(summary_text(summarize(board, args.stuck)), end=end, flush=True)
+            if args.once :
+                break
+            time.sleep(args.interval)
+    except (KeyboardInterrupt, BrokenPipeError) :
+        pass
+    finally :
+        board.close()
@@ -0,0 +1,226 @@
+import time
+
+# A stand-in for the server's phone manager (server-api/phone/phoneManager.js), without the
+# database.  It routes calls between registered phones using the same socket.io events the real
+# server sends and expects, so emulators can be driven with no Node/MongoDB/Redis stack.  The
+# transport is left to the caller: each phone is attached with a port, which is any object with
+# a send(event, *args) method that delivers an event to that phone.
+
+class CallNotPossibleReasons :
+    INACTIVE = 'not_active'
+    ALREADY_IN_CALL = 'already_in_call'
+    DIALED_SELF = 'dialed_self'
+    NO_RECIPIENT = 'no_recipient'
+    BUSY = 'busy'
+    ERROR = 'error'
+
+_NOT_IN_CALL = 0
+_CALL_INIT_OUTGOING = 1
+_CALL_INIT_INCOMING = 2
+_CALL_ACTIVE = 3
+
+class CallRecord :
+    __slots__ = ('caller', 'callee', 'start', 'end')
+
+    def __init__(self, caller, callee, start) :
+        self.caller = caller
+        self.callee = callee
+        self.start = start
+        self.end = None
+
+    @property
+    def duration(self) :
+        return None if self.end is None else self.end - self.start
+
+    def __repr__(self) :
+        return f'CallRecord({self.caller!r}, {self.callee!r}, start={self.start}, end={self.end})'
+
+class _SwitchPhone :
+    __slots__ = ('number', 'port', 'state', 'partner', 'partner_confirmed', 'call')
+
+    def __init__(self, number, port) :
+        self.number = number
+        self.port = port
+        self.state = _NOT_IN_CALL
+        self.partner = None
+        self.partner_confirmed = False
+        self.call = None
+
+    @property
+    def is_on_call(self) :
+        return self.state != _NOT_IN_CALL
+
+    def reset(self) :
+        self.state = _NOT_IN_CALL
+        self.partner = None
+        self.partner_confirmed = False
+        self.call = None
+
+class Switch :
+
+    def __init__(self, valid_numbers=None, clock=time.monotonic) :
+        self._valid_numbers = set(valid_numbers) if valid_numbers is not None else None
+        self._clock = clock
+        self._phones = {}
+        self.call_records = []
+        # cleared while the (simulated) server is down; see SimulatedFleet.restart_server
+        self.accepting = True
+
+        self._handlers = {
+            'make_call' : self._make_call,
+            'call_acknowledged' : self._call_acknowledged,
+            'call_accepted' : self._call_accepted,
+            'hang_up' : self._hang_up,
+            'call_refused' : self._call_refused,
+            'talk' : self._talk,
+            'talk_batch' : self._talk_batch,
+            'media' : self._media
+        }
+
+    def __len__(self) :
+        return len(self._phones)
+
+    def is_registered(self, number) :
+        return number in self._phones
+
+    # Attaches a phone.  Returns None on success, or the reason the connection was refused
+    # (matching the server's auth middleware).
+    def connect(self, number, port) :
+        if not number :
+            return 'No phone number provided'
+        if self._valid_numbers is not None and number not in self._valid_numbers :
+            return 'Invalid phone number'
+        existing = self._phones.get(number)
+        if existing is not None :
+            self.disconnect(number)
+        self._phones[number] = _SwitchPhone(number, port)
+        port.send('registered', number)
+        return None
+
+    # If port is given, the phone is only detached if it is still attached through that port
+    # (and not a newer connection for the same number)
+    def disconnect(self, number, port=None) :
+        phone = self._phones.get(number)
+        if phone is None or (port is not None and phone.port is not port) :
+            return
+        del self._phones[number]
+        partner = phone.partner
+        if phone.state == _CALL_INIT_OUTGOING :
+            self._call_cancelled(partner, number)
+        elif phone.state == _CALL_INIT_INCOMING :
+            self._call_refused_partner(partner, number, 'callee_disconnected')
+        elif phone.state == _CALL_ACTIVE :
+            self._close_call(phone)
+        phone.reset()
+
+    # An event sent by the phone registered as number
+    def handle(self, number, event, *args) :
+        phone = self._phones.get(number)
+        handler = self._handlers.get(event)
+        if phone is not None and handler is not None :
+            handler(phone, *args)
+
+    def _make_call(self, phone, dialed) :
+        if phone.state != _NOT_IN_CALL :
+            phone.port.send('call_not_possible', CallNotPossibleReasons.ALREADY_IN_CALL)
+            return
+        if dialed == phone.number :
+            phone.port.send('call_not_possible', CallNotPossibleReasons.DIALED_SELF)
+            return
+        other = self._phones.get(dialed)
+        if other is None :
+            phone.port.send('call_not_possible', CallNotPossibleReasons.NO_RECIPIENT)
+            return
+        if other.is_on_call :
+            phone.port.send('call_not_possible', CallNotPossibleReasons.BUSY)
+            return
+
+        phone.state = _CALL_INIT_OUTGOING
+        phone.partner = other
+        other.port.send('call_request', phone.number)
+
+    def _call_acknowledged(self, phone, caller_number) :
+        other = self._phones.get(caller_number)
+        if other is None :
+            return
+        if phone.state != _NOT_IN_CALL :
+            if phone.partner is not None and other is not phone.partner :
+                self._call_refused_partner(other, phone.number, CallNotPossibleReasons.BUSY)
+            return
+
+        phone.state = _CALL_INIT_INCOMING
+        phone.partner = other
+        other.port.send('callee_ringing')
+
+    def _call_accepted(self, phone) :
+        if phone.state == _CALL_INIT_INCOMING :
+            phone.state = _CALL_ACTIVE
+            self._partner_connected(phone.partner, phone.number)
+        elif phone.state == _CALL_INIT_OUTGOING and phone.partner_confirmed :
+            phone.state = _CALL_ACTIVE
+            phone.call = CallRecord(phone.number, phone.partner.number, self._clock())
+            self._partner_connected(phone.partner, phone.number)
+        else :
+            phone.port.send('error', 'invalid_call_accepted')
+
+    def _partner_connected(self, phone, number) :
+        if phone is not None and phone.partner is not None and phone.partner.number == number :
+            phone.partner_confirmed = True
+            phone.port.send('call_connected')
+
+    def _hang_up(self, phone) :
+        if phone.state == _CALL_ACTIVE :
+            self._close_call(phone)
+        elif phone.state == _CALL_INIT_OUTGOING :
+            self._call_cancelled(phone.partner, phone.number)
+        elif phone.state == _CALL_INIT_INCOMING :
+            self._call_refused_partner(phone.partner, phone.number, CallNotPossibleReasons.ERROR)
+        else :
+            return
+        phone.reset()
+
+    def _close_call(self, phone) :
+        partner = phone.partner
+        # only the caller holds the call record, whichever side hung up
+        call = phone.call if phone.call is not None else (partner.call if partner is not None else None)
+        if call is not None :
+            call.end = self._clock()
+            self.call_records.append(call)
+        if partner is not None and partner.partner is phone :
+            partner.port.send('call_ended')
+            partner.reset()
+
+    def _call_refused(self, phone, number, reason) :
+        if phone.partner is not None and phone.partner.number == number :
+            other = phone.partner
+            phone.reset()
+        else :
+            other = self._phones.get(number)
+        self._call_refused_partner(other, phone.number, reason)
+
+    def _call_refused_partner(self, phone, number, reason) :
+        if phone is not None and phone.partner is not None and phone.partner.number == number :
+            phone.reset()
+            phone.port.send('call_not_possible', reason)
+
+    def _call_cancelled(self, phone, number) :
+        if phone is not None and phone.partner is not None and phone.partner.number == number :
+            phone.reset()
+            phone.port.send('call_cancelled')
+
+    def _talk(self, phone, msg) :
+        partner = phone.partner
+        if phone.state == _CALL_ACTIVE and partner is not None and partner.state == _CALL_ACTIVE :
+            partner.port.send('talk', msg)
+
+    # several talk messages in one go, passed on as one
+    def _talk_batch(self, phone, messages) :
+        partner = phone.partner
+        if phone.state == _CALL_ACTIVE and partner is not None and partner.state == _CALL_ACTIVE :
+            partner.port.send('talk_batch', messages)
+
+    # audio frames (see media.py), passed on as they are
+    def _media(self, phone, frame) :
+        partner = phone.partner
+        if phone.state == _CALL_ACTIVE and partner is not None and partner.state == _CALL_ACTIVE :
+            partner.port.send('media', frame)
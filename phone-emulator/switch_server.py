@@ -0,0 +1,180 @@
+import asyncio
+from collections import deque
+
+from aiohttp import web
+import socketio
+
+from switch import Switch
+from trunk import namespace_phone_number
+
+DEFAULT_PORT = 5000
+
+# The events phones send, all of which are handed straight to the switch
+PHONE_EVENTS = ('make_call', 'call_acknowledged', 'call_accepted', 'call_refused', 'hang_up', 'talk', 'talk_batch',
+    'media')
+
+# The switch's port for one connected phone
+class _SocketPort :
+    __slots__ = ('_server', '_sid', '_namespace')
+
+    def __init__(self, server, sid, namespace='/') :
+        self._server = server
+        self._sid = sid
+        self._namespace = namespace
+
+    def send(self, event, *args) :
+        self._server._send(self._sid, self._namespace, event, args)
+
+# A socket.io server that routes calls with an in-memory Switch, speaking the same protocol as
+# the real server (auth with {'phoneNumber' : ...}, then 'registered' and the call events), so
+# emulators can be benchmarked without the Node/MongoDB/Redis stack.  It also accepts trunks (see
+# trunk.py), which connect each of their phones as a namespace named for its number instead.
+#
+# The switch works synchronously, so everything it sends is queued and emitted in order by a
+# single sender task.  messages_received and messages_sent count the phone events in each direction.
+# server_options go to socketio.AsyncServer, e.g. serializer='msgpack' to match phones run with it.
+class SwitchServer :
+
+    def __init__(self, valid_numbers=None, **server_options) :
+        self.switch = Switch(valid_numbers)
+        server_options.setdefault('cors_allowed_origins', '*')
+        server_options.setdefault('namespaces', '*')
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', **server_options)
+        self._ports = {}
+        self._outbox = deque()
+        self._wakeup = None
+        self._sender = None
+        self._runner = None
+        self.messages_received = 0
+        self.messages_sent = 0
+
+        self.sio.on('connect', self._connect)
+        self.sio.on('disconnect', self._disconnect)
+        for event in PHONE_EVENTS :
+            self.sio.on(event, self._handler(event))
+        self.sio.on('connect', self._trunk_connect, namespace='*')
+        self.sio.on('disconnect', self._trunk_disconnect, namespace='*')
+        self.sio.on('*', self._trunk_event, namespace='*')
+
+    def __len__(self) :
+        return len(self.switch)
+
+    def attach(self, app) :
+        self.sio.attach(app)
+
+    # Serves on host:port until stop() is called, over TLS if given an ssl_context.  Returns the
+    # port actually bound (useful with port=0).
+    async def start(self, host='localhost', port=DEFAULT_PORT, ssl_context=None) :
+        app = web.Application()
+        self.attach(app)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port, ssl_context=ssl_context)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) :
+        if self._runner is not None :
+            await self._runner.cleanup()
+            self._runner = None
+        if self._sender is not None :
+            self._sender.cancel()
+            self._sender = None
+
+    def _handler(self, event) :
+        switch = self.switch
+        ports = self._ports
+
+        def handler(sid, *args) :
+            self.messages_received += 1
+            port = ports.get(sid)
+            if port is not None :
+                switch.handle(port[0], event, *args)
+        return handler
+
+    def _connect(self, sid, environ, auth=None, namespace='/') :
+        if namespace == '/' :
+            number = auth.get('phoneNumber') if isinstance(auth, dict) else None
+        else :
+            number = namespace_phone_number(namespace)
+        port = _SocketPort(self, sid, namespace)
+        error = self.switch.connect(number, port)
+        if error is not None :
+            raise socketio.exceptions.ConnectionRefusedError(error)
+        self._ports[sid] = (number, port)
+
+    def _disconnect(self, sid, *args) :
+        entry = self._ports.pop(sid, None)
+        if entry is not None :
+            self.switch.disconnect(*entry)
+
+    # the handlers for every namespace but '/', which get the namespace first
+    def _trunk_connect(self, namespace, sid, environ, auth=None) :
+        self._connect(sid, environ, auth, namespace)
+
+    def _trunk_disconnect(self, namespace, sid, *args) :
+        self._disconnect(sid)
+
+    def _trunk_event(self, event, namespace, sid, *args) :
+        self.messages_received += 1
+        entry = self._ports.get(sid)
+        if entry is not None and event in PHONE_EVENTS :
+            self.switch.handle(entry[0], event, *args)
+
+    def _send(self, sid, namespace, event, args) :
+        self._outbox.append((sid, namespace, event, args))
+        if self._sender is None :
+            # started on first use, so attach() works without start()
+            self._wakeup = asyncio.Event()
+            self._sender = asyncio.create_task(self._send_loop())
+        self._wakeup.set()
+
+    async def _send_loop(self) :
+        outbox = self._outbox
+        while True :
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while outbox :
+                sid, namespace, event, args = outbox.popleft()
+                data = args[0] if len(args) == 1 else (args or None)
+                self.messages_sent += 1
+                await self.sio.emit(event, data, to=sid, namespace=namespace)
+
+# A server-side SSLContext for start(), from a PEM certificate chain and private key
+def server_ssl_context(certfile, keyfile=None) :
+    import ssl
+
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+async def serve(host, port, valid_numbers=None, serializer='default', ssl_context=None) :
+    server = SwitchServer(valid_numbers, serializer=serializer)
+    port = await server.start(host, port, ssl_context)
+    scheme = 'https' if ssl_context is not None else 'http'
+    print(f'Switch listening on {scheme}://{host}:{port}.  Press Ctrl-C to stop.')
+    try :
+        await asyncio.Event().wait()
+    finally :
+        await server.stop()
+
+if __name__ == '__main__' :
+    import argparse
+    from fleet import parse_number_range
+
+    parser = argparse.ArgumentParser(description='Run a stand-in switch for benchmarking phone emulators without the full server.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--numbers', metavar='RANGE', help='Only accept these phone numbers, e.g. 0001-4999 (default: any)')
+    parser.add_argument('--msgpack', action='store_true',
+        help='Use the msgpack serializer (needs msgpack, and phones run with --msgpack)')
+    parser.add_argument('--certfile', metavar='PATH', help='Serve over TLS with this PEM certificate (chain)')
+    parser.add_argument('--keyfile', metavar='PATH', help='The certificate\'s private key, if it isn\'t in --certfile')
+    args = parser.parse_args()
+
+    valid_numbers = parse_number_range(args.numbers) if args.numbers is not None else None
+    ssl_context = server_ssl_context(args.certfile, args.keyfile) if args.certfile is not None else None
+    try :
+        asyncio.run(serve(args.host, args.port, valid_numbers, 'msgpack' if args.msgpack else 'default', ssl_context))
+    except KeyboardInterrupt :
+        pass
@@ -0,0 +1,93 @@
+import threading
+
+DEFAULT_CAPACITY = 1000
+
+# What talk() does once a phone has capacity messages on the way: refuse (and count) the new
+# ones, or wait for room.  BLOCK is only for callers on another thread than the phone's (the
+# threaded PhoneEmulator); on the phone's own thread or event loop it would wait forever.
+DROP = 'drop'
+BLOCK = 'block'
+POLICIES = (DROP, BLOCK)
+
+# Flow control for a phone's outgoing talk.  Every message is reserved here before it's queued,
+# and released once it's been sent, so no more than capacity messages are ever waiting between
+# talk() and the socket, however fast a phone is flooded.  The counters are totals since the
+# phone was created.
+class TalkBuffer :
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, policy=DROP) :
+        if capacity < 1 :
+            raise ValueError(f'Invalid talk buffer capacity: {capacity}')
+        if policy not in POLICIES :
+            raise ValueError(f'Invalid talk buffer policy: {policy}')
+        self._capacity = capacity
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self.pending = 0
+        self.queued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.batches = 0
+
+    @property
+    def capacity(self) :
+        return self._capacity
+
+    @property
+    def policy(self) :
+        return self._policy
+
+    def __len__(self) :
+        return self.pending
+
+    # Makes room for up to count messages, waiting up to timeout (forever if None) for it under
+    # BLOCK.  Returns how many were let through; the rest are counted as dropped.
+    def reserve(self, count=1, timeout=None) :
+        with self._lock :
+            room = self._capacity - self.pending
+            if room < count and self._policy == BLOCK :
+                # whatever fits now goes now, so a large burst can't wait on itself
+                if room <= 0 :
+                    self._not_full.wait_for(lambda : self.pending < self._capacity, timeout)
+                    room = self._capacity - self.pending
+            accepted = max(0, min(count, room))
+            self.pending += accepted
+            self.queued += accepted
+            self.dropped += count - accepted
+            return accepted
+
+    # count messages went out in one emit
+    def sent_batch(self, count) :
+        with self._lock :
+            # talk dispatched straight to the state machine (as in benchmarks and replays) was never reserved
+            self.pending = max(0, self.pending - count)
+            self.sent += count
+            self.batches += 1
+            self._not_full.notify_all()
+
+    # Forgets whatever is still on the way (the call ended first), counting it as dropped
+    def discard(self) :
+        with self._lock :
+            self.dropped += self.pending
+            self.pending = 0
+            self._not_full.notify_all()
+
+    # count messages reached the phone outside a call, and were dropped there.  Only what is still
+    # pending is counted, as discard() has already counted the talk left over when a call ended.
+    def drop(self, count=1) :
+        with self._lock :
+            dropped = min(count, self.pending)
+            self.pending -= dropped
+            self.dropped += dropped
+            self._not_full.notify_all()
+
+    def stats(self) :
+        with self._lock :
+            return {
+                'pending' : self.pending,
+                'queued' : self.queued,
+                'dropped' : self.dropped,
+                'sent' : self.sent,
+                'batches' : self.batches
+            }
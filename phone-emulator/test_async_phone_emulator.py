@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from async_phone_emulator import AsyncPhoneEmulator, PhoneEngine
+from phone_emulator import PhoneSounds
+
+class TestAsyncPhoneEmulator(unittest.IsolatedAsyncioTestCase) :
+
+    async def asyncSetUp(self) :
+        patcher = patch('socketio.AsyncClient', autospec=True)
+        MockSocketIoClient = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.phone = AsyncPhoneEmulator('0000', 'https://localhost:5000')
+        self.task = asyncio.create_task(self.phone.run())
+        self.phone._socket_connect_event()
+        self.phone._socket_registered_event('0000')
+        await self.phone._events.join()
+
+        self.sio = MockSocketIoClient.return_value
+
+    async def asyncTearDown(self) :
+        if not self.task.done() :
+            self.phone.shutdown()
+            await self.task
+
+    async def test_full_call(self) :
+        self.sio.connect.assert_awaited_once()
+        self.assertEqual(self.phone._state, self.phone._on_hook_idle)
+
+        self.phone.off_hook()
+        for key in '1234' :
+            self.phone.key_press(key)
+        await self.phone._events.join()
+        self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
+        self.sio.emit.assert_awaited_with('make_call', '1234')
+
+        self.phone._socket_callee_ringing_event()
+        await self.phone._events.join()
+        self.assertEqual(self.phone._state, self.phone._outgoing_call_ringing)
+        self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
+
+        self.phone._socket_call_connected_event()
+        await self.phone._events.join()
+        self.sio.emit.assert_awaited_with('call_accepted')
+        self.assertEqual(self.phone._state, self.phone._call_connected)
+
+        self.phone.talk('Hello, 1234!')
+        self.phone._socket_talk_event('foo bar baz')
+        await self.phone._events.join()
+        self.sio.emit.assert_awaited_with('talk', 'Hello, 1234!')
+        self.assertEqual(self.phone._call_dialogue, 'Connected to 1234\n0000 : Hello, 1234!\n1234 : foo bar baz')
+
+        self.phone.on_hook()
+        await self.phone._events.join()
+        self.sio.emit.assert_awaited_with('hang_up')
+        self.assertEqual(self.phone._state, self.phone._on_hook_idle)
+
+        self.phone.shutdown()
+        await self.task
+        self.sio.disconnect.assert_awaited_once()
+
+    async def test_incoming_call_timeout(self) :
+        with patch('async_phone_emulator.AsyncPhoneEmulator._start_timer') as start_timer :
+            self.phone._socket_call_request_event('2222')
+            await self.phone._events.join()
+        self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
+        self.sio.emit.assert_awaited_with('call_acknowledged', '2222')
+
+        # fire the timeout by hand instead of waiting for it
+        delay, callback = start_timer.call_args.args
+        callback()
+        await self.phone._events.join()
+        self.assertEqual(self.phone._state, self.phone._on_hook_idle)
+        self.sio.emit.assert_awaited_with('call_refused', ('2222', 'timeout'))
+
+class TestPhoneEngine(unittest.IsolatedAsyncioTestCase) :
+
+    async def test_start_and_shutdown(self) :
+        with patch('socketio.AsyncClient', autospec=True) as MockSocketIoClient :
+            sio = MockSocketIoClient.return_value
+            engine = PhoneEngine('https://localhost:5000', max_concurrent_connects=2)
+            for number in ('0001', '0002', '0003') :
+                engine.add_phone(number)
+            await engine.start()
+            await asyncio.sleep(0)
+            self.assertEqual(sio.connect.await_count, 3)
+            await engine.shutdown()
+            self.assertEqual(sio.disconnect.await_count, 3)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+
+import benchmarks
+
+class TestBenchmarks(unittest.TestCase) :
+
+    def test_dispatch(self) :
+        results = benchmarks.dispatch(calls=10, talk_lines=2)
+        self.assertEqual(results['events'], 10 * 12)
+        self.assertGreater(results['run_loop_events_per_second'], 0)
+        self.assertGreater(results['dispatch_events_per_second'], 0)
+
+    def test_replay(self) :
+        with tempfile.TemporaryDirectory() as corpus :
+            results = benchmarks.replay(corpus)
+        self.assertEqual(results['traces'], 1)
+        self.assertEqual(results['divergences'], 0)
+        self.assertGreater(results['replay_events_per_second'], 0)
+
+    def test_memory(self) :
+        results = benchmarks.memory(count=50, talk_lines=2)
+        self.assertGreater(results['state_machine_in_call_bytes'], results['state_machine_idle_bytes'])
+        # the same state machine, plus a Thread
+        self.assertGreater(results['emulator_idle_bytes'], results['state_machine_idle_bytes'])
+
+    def test_transports(self) :
+        results = benchmarks.transports(pairs=2, rounds=1, talk_lines=1)
+        self.assertIn('polling_json_plain', results)
+        self.assertIn('websocket_json_plain', results)
+        for name, result in results.items() :
+            if name.endswith('_skipped') :
+                continue
+            # make_call, ringing, answer, connected (both ways), a line each way and the hang up
+            self.assertGreaterEqual(result['call_messages'], 8)
+            self.assertGreater(result['call_sent_bytes'], 0)
+            self.assertGreater(result['phone_message_cpu_us'], 0)
+            self.assertIsNotNone(result['connect_to_registered_ms']['p50'])
+
+    def test_talk_throughput(self) :
+        results = benchmarks.talk_throughput(pairs=2, messages=50, talk_batches=(1, 10))
+        self.assertEqual(results['talk_batch_1']['emits'], 100)
+        self.assertEqual(results['talk_batch_10']['emits'], 10)
+        for result in results.values() :
+            self.assertEqual(result['dropped'], 0)
+            self.assertGreater(result['messages_per_second'], 0)
+
+    def test_compare(self) :
+        baseline = {'results' : {'dispatch' : {'events' : 100, 'dispatch_events_per_second' : 1000},
+            'memory' : {'state_machine_idle_bytes' : 1000}}}
+        self.assertEqual(benchmarks.compare(baseline, baseline), [])
+
+        current = {'results' : {'dispatch' : {'events' : 50, 'dispatch_events_per_second' : 800},
+            'memory' : {'state_machine_idle_bytes' : 1050}}}
+        self.assertEqual(benchmarks.compare(baseline, current),
+            [('dispatch.dispatch_events_per_second', 1000, 800, -0.2)])
+        self.assertEqual([metric for metric, *_ in benchmarks.compare(baseline, current, tolerance=0.01)],
+            ['dispatch.dispatch_events_per_second', 'memory.state_machine_idle_bytes'])
+
+if __name__ == '__main__' :
+    unittest.main()
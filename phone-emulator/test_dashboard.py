@@ -0,0 +1,66 @@
+import unittest
+
+from dashboard import COLUMNS, row_values, summary_text
+from phone_emulator import PhoneState
+from simulation import SimulatedFleet
+
+def _fleet(count) :
+    fleet = SimulatedFleet([str(n).zfill(4) for n in range(1, count + 1)])
+    fleet.phones['0002'].auto_answer(1.0)
+    fleet.start()
+    fleet.phones['0001'].place_call(1.0, '0002', hold=60.0, talk=['hello'])
+    fleet.run(40.0)
+    return fleet
+
+class TestRows(unittest.TestCase) :
+
+    def test_row_values(self) :
+        fleet = _fleet(3)
+        values = row_values(fleet.phones['0001'].snapshot())
+        self.assertEqual(len(values), len(COLUMNS))
+        self.assertEqual(values[:3], ('0001', 'CALL_CONNECTED', 'Off hook'))
+        self.assertEqual((values[4], values[5]), ('0002', '0001 : hello'))
+        self.assertEqual(row_values(fleet.phones['0003'].snapshot())[1:3], ('ON_HOOK_IDLE', 'On hook'))
+        self.assertEqual(summary_text(phone.snapshot() for phone in fleet.phones.values()),
+            '3 phones: 2 CALL_CONNECTED, 1 ON_HOOK_IDLE')
+        self.assertEqual(summary_text([]), '0 phones')
+        fleet.shutdown()
+
+class TestDashboard(unittest.TestCase) :
+
+    def setUp(self) :
+        import tkinter as tk
+        try :
+            self.root = tk.Tk()
+        except tk.TclError as e :
+            self.skipTest(f'no display: {e}')
+        self.root.withdraw()
+
+    def tearDown(self) :
+        self.root.destroy()
+
+    def test_virtual_rows(self) :
+        from dashboard import PhoneDashboard
+
+        fleet = _fleet(5000)
+        dashboard = PhoneDashboard(fleet.phones.values(), self.root, rows=10)
+        # only the rows on screen have widgets, however many phones there are
+        self.assertEqual(len(dashboard.table_frame.winfo_children()), len(COLUMNS) * 11)
+        self.assertEqual(dashboard._cells[0][0].cget('text'), '0001')
+        self.assertEqual(dashboard._cells[0][1].cget('text'), 'CALL_CONNECTED')
+
+        dashboard.find_entry.insert(0, '2500')
+        dashboard.find()
+        self.assertEqual(dashboard.first_row, 2499)
+        self.assertEqual(dashboard._cells[0][0].cget('text'), '2500')
+        dashboard.scroll_to(10000)
+        self.assertEqual(dashboard._cells[9][0].cget('text'), '5000')
+
+        dashboard.scroll_to(0)
+        fleet.run(100.0)
+        dashboard._render()
+        self.assertEqual(dashboard._cells[0][1].cget('text'), 'ON_HOOK_IDLE')
+        fleet.shutdown()
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from event_log import EventLog, EventLogException, load, merge
+from phone_emulator import PhoneEmulator, PhoneEvent, PhoneEventType, PhoneState
+from timer_wheel import ManualTimerWheel
+
+class TestEventLog(unittest.TestCase) :
+
+    def setUp(self) :
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _path(self, name) :
+        return os.path.join(self.directory.name, name)
+
+    def test_phone(self) :
+        patcher = patch('socketio.Client', autospec=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        path = self._path('phone.log')
+        with EventLog(path) as log :
+            phone = PhoneEmulator('0001', 'https://localhost:5000', timers=ManualTimerWheel(), event_log=log)
+            phone.step()
+            phone._socket_connect_event()
+            phone._socket_registered_event('0001')
+            # no handler for key presses on hook
+            phone.key_press('5')
+            phone.off_hook()
+            for key in '0002' :
+                phone.key_press(key)
+            phone._socket_callee_ringing_event()
+            phone._socket_call_connected_event()
+            phone._socket_talk_event('hello')
+            phone.process_pending()
+            phone.shutdown()
+            phone.process_pending()
+
+        records = load(path)
+        self.assertEqual([(record.event, record.before, record.after, record.handled) for record in records], [
+            (PhoneEventType.SERVER_CONNECT, PhoneState.DISCONNECTED, PhoneState.UNREGISTERED, True),
+            (PhoneEventType.REGISTERED, PhoneState.UNREGISTERED, PhoneState.ON_HOOK_IDLE, True),
+            (PhoneEventType.KEY_PRESS, PhoneState.ON_HOOK_IDLE, PhoneState.ON_HOOK_IDLE, False),
+            (PhoneEventType.OFF_HOOK, PhoneState.ON_HOOK_IDLE, PhoneState.OFF_HOOK_DIALING, True),
+            # the four key presses arrived together, and were coalesced
+            (PhoneEventType.KEY_PRESS, PhoneState.OFF_HOOK_DIALING, PhoneState.INIT_OUTGOING_CALL, True),
+            (PhoneEventType.CALLEE_RINGING, PhoneState.INIT_OUTGOING_CALL, PhoneState.OUTGOING_CALL_RINGING, True),
+            (PhoneEventType.CALL_CONNECTED, PhoneState.OUTGOING_CALL_RINGING, PhoneState.CALL_CONNECTED, True),
+            (PhoneEventType.INCOMING_TALK, PhoneState.CALL_CONNECTED, PhoneState.CALL_CONNECTED, True)
+        ])
+        self.assertEqual({record.phone_number for record in records}, {'0001'})
+        self.assertEqual(records[-1].payload_size, 5)
+        self.assertEqual(records[4].payload_size, 4)
+        self.assertEqual([record.timestamp for record in records], sorted(record.timestamp for record in records))
+
+    def test_ring_wraps(self) :
+        path = self._path('ring.log')
+        event = PhoneEvent(PhoneEventType.OUTGOING_TALK, ['ab', 'cde'])
+        with EventLog(path, capacity=4, flush_interval=60.0) as log :
+            for i in range(100) :
+                log.record(f'{i:04d}', PhoneState.CALL_CONNECTED, PhoneState.CALL_CONNECTED, event)
+                if i % 3 == 2 :
+                    log.flush()
+            self.assertEqual((log.logged, log.dropped), (100, 0))
+        records = load(path)
+        self.assertEqual([record.phone_number for record in records], [f'{i:04d}' for i in range(100)])
+        self.assertEqual(records[0].payload_size, 5)
+
+    def test_never_blocks(self) :
+        path = self._path('full.log')
+        event = PhoneEvent(PhoneEventType.KEY_PRESS, '1')
+        with EventLog(path, capacity=8, flush_interval=60.0) as log :
+            for _ in range(10000) :
+                log.record('0001', PhoneState.OFF_HOOK_DIALING, PhoneState.OFF_HOOK_DIALING, event)
+            logged = log.logged
+            # whatever didn't fit while the writer caught up was dropped, not waited for
+            self.assertEqual(log.logged + log.dropped, 10000)
+        self.assertEqual(len(load(path)), logged)
+
+    def test_merge(self) :
+        now = [0]
+        def clock() :
+            now[0] += 10
+            return now[0]
+        event = PhoneEvent(PhoneEventType.ON_HOOK)
+        logs = [EventLog(self._path(f'worker.{i}'), clock=clock) for i in range(2)]
+        for i in range(6) :
+            logs[i % 2].record(f'{i:04d}', PhoneState.CALL_ENDED, PhoneState.ON_HOOK_IDLE, event)
+        for log in logs :
+            log.close()
+        records = merge([self._path('worker.0'), self._path('worker.1')])
+        self.assertEqual([record.phone_number for record in records], [f'{i:04d}' for i in range(6)])
+        self.assertIn('0005 ON_HOOK CALL_ENDED -> ON_HOOK_IDLE 0', str(records[-1]))
+        self.assertEqual(records[0].to_dict()['after'], 'ON_HOOK_IDLE')
+
+    def test_truncated(self) :
+        path = self._path('truncated.log')
+        with EventLog(path) as log :
+            for _ in range(3) :
+                log.record('0001', PhoneState.ON_HOOK_IDLE, PhoneState.OFF_HOOK_DIALING, PhoneEvent(PhoneEventType.OFF_HOOK))
+        with open(path, 'rb+') as f :
+            f.truncate(os.path.getsize(path) - 5)
+        self.assertEqual(len(load(path)), 2)
+
+        with open(path, 'wb') as f :
+            f.write(b'not a log')
+        with self.assertRaises(EventLogException) :
+            load(path)
+
+    def test_long_numbers(self) :
+        with EventLog(self._path('long.log')) as log :
+            log.register('12345678')
+            # would be cut down to the same eight characters as the first
+            with self.assertRaises(EventLogException) :
+                log.register('123456789')
+            with self.assertRaises(EventLogException) :
+                log.record('123456780', PhoneState.ON_HOOK_IDLE, PhoneState.OFF_HOOK_DIALING,
+                    PhoneEvent(PhoneEventType.OFF_HOOK))
+            with self.assertRaises(EventLogException) :
+                PhoneEmulator('123456789', 'https://localhost:5000', timers=ManualTimerWheel(), event_log=log)
+            self.assertEqual(log.logged, 0)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,41 @@
+import threading
+import unittest
+
+from event_queue import EventQueue
+
+class TestEventQueue(unittest.TestCase) :
+
+    def test_batches(self) :
+        queue = EventQueue()
+        for i in range(5) :
+            queue.put(i)
+        self.assertEqual(len(queue), 5)
+        self.assertEqual(queue.get_batch(), [0, 1, 2, 3, 4])
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.get_batch(timeout=0.01), [])
+
+        queue.put('a')
+        self.assertEqual(queue.get(), 'a')
+
+    def test_join(self) :
+        queue = EventQueue()
+        done = []
+
+        def consume() :
+            while len(done) < 100 :
+                batch = queue.get_batch()
+                done.extend(batch)
+                queue.task_done(len(batch))
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        for i in range(100) :
+            queue.put(i)
+        queue.join()
+        self.assertEqual(done, list(range(100)))
+        consumer.join()
+        with self.assertRaises(ValueError) :
+            queue.task_done()
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from event_trace import EVENT, PHONE, TRANSITION, Trace, TraceWriter, replay
+from phone_emulator import PhoneEvent, PhoneEventType, PhoneState
+from simulation import SimulatedFleet
+
+class TestEventTrace(unittest.TestCase) :
+
+    def setUp(self) :
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'calls.trace')
+
+    def _record_call(self) :
+        fleet = SimulatedFleet(['0001', '0002', '0003'], latency=0.01, trace_path=self.path)
+        fleet.phones['0002'].auto_answer(2.0)
+        fleet.start()
+        fleet.phones['0001'].place_call(10.0, '0002', hold=60.0, talk=['Hello, 0002!'])
+        fleet.run(100.0)
+        fleet.shutdown()
+        return fleet
+
+    def test_record(self) :
+        self._record_call()
+        trace = Trace.load(self.path)
+        self.assertFalse(trace.truncated)
+        self.assertEqual(trace.phones, ['0001', '0002', '0003'])
+        self.assertEqual([record[2] for record in trace.records[:3]], [PHONE] * 3)
+
+        caller_events = [event for phone, event in trace.events() if phone == 0]
+        self.assertEqual([event.type for event in caller_events[:4]],
+            [PhoneEventType.SERVER_CONNECT, PhoneEventType.REGISTERED, PhoneEventType.OFF_HOOK, PhoneEventType.KEY_PRESS])
+        self.assertIn('Hello, 0002!', [event.data for event in caller_events if event.type == PhoneEventType.OUTGOING_TALK])
+        self.assertIn(PhoneState.CALL_CONNECTED, trace.transitions()[1])
+        # in simulated time: the last record is the callee hanging up, about 72 seconds in
+        self.assertAlmostEqual(trace.duration, 72.0, delta=1.0)
+
+    def test_replay(self) :
+        self._record_call()
+        results = replay(Trace.load(self.path))
+        self.assertEqual(results['phones'], 3)
+        self.assertEqual(results['divergences'], [])
+        self.assertGreater(results['events'], 10)
+        self.assertGreater(results['emitted'], 0)
+
+    def test_replay_server_restart(self) :
+        fleet = SimulatedFleet(['0001', '0002'], latency=0.01, trace_path=self.path)
+        fleet.start()
+        fleet.run(1.0)
+        fleet.restart_server(5.0)
+        fleet.run(60.0)
+        self.assertEqual(fleet.reconnect_policy.stats.reconnects, 2)
+        self.assertGreater(fleet.reconnect_policy.stats.failures, 0)
+        fleet.shutdown()
+
+        trace = Trace.load(self.path)
+        self.assertIn(PhoneEventType.RECONNECT, [event.type for phone, event in trace.events()])
+        self.assertEqual(replay(trace)['divergences'], [])
+
+    def test_divergence(self) :
+        self._record_call()
+        trace = Trace.load(self.path)
+        # drop the callee's answer
+        index = next(i for i, record in enumerate(trace.records)
+            if record[1] == 1 and record[2] == EVENT and record[3] == PhoneEventType.OFF_HOOK)
+        del trace.records[index]
+        divergences = replay(trace)['divergences']
+        self.assertEqual(len(divergences), 1)
+        self.assertTrue(divergences[0].startswith('0002: '))
+
+    def test_payloads_and_truncation(self) :
+        with TraceWriter(self.path) as writer :
+            phone = writer.phone('0001')
+            phone.event(PhoneEvent(PhoneEventType.SERVER_CONNECT_ERROR, {'message' : 'Invalid phone number'}))
+            phone.transition(PhoneState.REGISTRATION_FAILED)
+            phone.event(PhoneEvent(PhoneEventType.INCOMING_TALK, 'héllo'))
+        trace = Trace.load(self.path)
+        self.assertEqual([(kind, code, data) for _, _, kind, code, data in trace.records], [
+            (PHONE, 0, '0001'),
+            (EVENT, PhoneEventType.SERVER_CONNECT_ERROR, {'message' : 'Invalid phone number'}),
+            (TRANSITION, PhoneState.REGISTRATION_FAILED, None),
+            (EVENT, PhoneEventType.INCOMING_TALK, 'héllo')])
+
+        with open(self.path, 'rb') as f :
+            data = f.read()
+        with open(self.path, 'wb') as f :
+            f.write(data[:-3])
+        trace = Trace.load(self.path)
+        self.assertTrue(trace.truncated)
+        self.assertEqual(len(trace.records), 3)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from fleet import FleetException, parse_number_range, shard
+
+class TestFleet(unittest.TestCase) :
+
+    def test_parse_number_range(self) :
+        self.assertEqual(parse_number_range('0001-0003'), ['0001', '0002', '0003'])
+        self.assertEqual(parse_number_range('0009-0010,0100'), ['0009', '0010', '0100'])
+        self.assertEqual(len(parse_number_range('0001-4999')), 4999)
+        with self.assertRaises(FleetException) :
+            parse_number_range('0005-0001')
+        with self.assertRaises(FleetException) :
+            parse_number_range('abcd')
+
+    def test_shard(self) :
+        numbers = parse_number_range('0001-0010')
+        shards = shard(numbers, 3)
+        self.assertEqual([len(s) for s in shards], [4, 3, 3])
+        self.assertEqual(sum(shards, []), numbers)
+        self.assertEqual(len(shard(numbers, 20)), 10)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+from unittest.mock import patch
+
+from latency import (CONNECT_TO_REGISTERED, HANG_UP_TO_CALL_ENDED, MAKE_CALL_TO_RINGING, RINGING_TO_CONNECTED,
+    Histogram, LatencyRecorder, default_latency_recorder)
+from phone_emulator import PhoneEmulator
+from simulation import SimulatedFleet
+from timer_wheel import ManualTimerWheel
+
+class TestHistogram(unittest.TestCase) :
+
+    def test_buckets(self) :
+        previous_high = -1
+        for index in range(2000) :
+            low, high = Histogram.bucket_range(index)
+            self.assertEqual(low, previous_high + 1)
+            self.assertEqual(Histogram._index(low), index)
+            self.assertEqual(Histogram._index(high), index)
+            previous_high = high
+
+    def test_percentiles(self) :
+        rng = random.Random(0)
+        values = sorted(rng.randrange(1000, 10 ** 10) for _ in range(10000))
+        histogram = Histogram()
+        for value in values :
+            histogram.record(value)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.min, values[0])
+        self.assertEqual(histogram.max, values[-1])
+        for percent in (50, 90, 99) :
+            exact = values[len(values) * percent // 100 - 1]
+            self.assertAlmostEqual(histogram.percentile(percent) / exact, 1.0, delta=1 / 64)
+        self.assertEqual(Histogram().percentile(50), None)
+
+    def test_merge_and_round_trip(self) :
+        first, second = Histogram(), Histogram()
+        for value in range(100) :
+            first.record(value * 1000)
+            second.record(value * 7)
+        merged = Histogram.from_dict(first.to_dict())
+        merged.merge(second)
+        self.assertEqual(merged.count, 200)
+        self.assertEqual(merged.min, 0)
+        self.assertEqual(merged.max, 99000)
+        self.assertEqual(merged.mean, (first.mean + second.mean) / 2)
+
+class TestLatencyRecorder(unittest.TestCase) :
+
+    def test_simulated_call(self) :
+        fleet = SimulatedFleet(['0001', '0002'], latency=0.01)
+        fleet.start()
+        fleet.phones['0002'].auto_answer(2.0)
+        fleet.phones['0001'].place_call(10.0, '0002', hold=30.0)
+        fleet.run(100.0)
+
+        recorder = fleet.latency_recorder
+        self.assertEqual(recorder[CONNECT_TO_REGISTERED].count, 2)
+        self.assertAlmostEqual(recorder[CONNECT_TO_REGISTERED].mean, 0.01e9, delta=1e3)
+        # make_call -> switch -> callee, and call_acknowledged -> switch -> caller
+        self.assertAlmostEqual(recorder[MAKE_CALL_TO_RINGING].mean, 0.04e9, delta=1e3)
+        # the callee starts ringing 20ms before the caller hears about it, and answering takes 20ms to get back
+        self.assertAlmostEqual(recorder[RINGING_TO_CONNECTED].mean, 2.0e9, delta=1e3)
+        self.assertAlmostEqual(recorder[HANG_UP_TO_CALL_ENDED].mean, 0.02e9, delta=1e3)
+
+    def test_reports(self) :
+        recorder = LatencyRecorder(clock=lambda : 0)
+        recorder.record(MAKE_CALL_TO_RINGING, 5000000)
+        recorder.record(MAKE_CALL_TO_RINGING, 20000000)
+        merged = LatencyRecorder.from_dict(recorder.to_dict())
+        merged.merge(recorder)
+        self.assertEqual(merged[MAKE_CALL_TO_RINGING].count, 4)
+        self.assertEqual(merged.summary()[MAKE_CALL_TO_RINGING]['max'], 20000000)
+
+        text = merged.to_prometheus()
+        self.assertIn('# TYPE phone_emulator_latency_seconds histogram', text)
+        self.assertIn('phone_emulator_latency_seconds_bucket{phase="make_call_to_ringing",le="+Inf"} 4', text)
+        self.assertIn('phone_emulator_latency_seconds_count{phase="connect_to_registered"} 0', text)
+
+    def test_default_recorder(self) :
+        with patch('socketio.Client', autospec=True) :
+            phone = PhoneEmulator('0001', 'https://localhost:5000', timers=ManualTimerWheel())
+            recorder = LatencyRecorder()
+            other = PhoneEmulator('0002', 'https://localhost:5000', timers=ManualTimerWheel(), latency_recorder=recorder)
+        self.assertIs(phone._latency_recorder, default_latency_recorder())
+        self.assertIs(other._latency_recorder, recorder)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from load_generator import LoadGenerator, LoadProfile, LoadProfileException, make_distribution, run_simulated
+from phone_emulator import PhoneState
+from simulation import SimulatedFleet
+
+class TestLoadGenerator(unittest.TestCase) :
+
+    def test_distributions(self) :
+        rng = random.Random(0)
+        self.assertEqual(make_distribution(5, rng)(), 5)
+        self.assertEqual(make_distribution({'distribution' : 'constant', 'value' : 2.5}, rng)(), 2.5)
+        samples = [make_distribution({'distribution' : 'uniform', 'low' : 1, 'high' : 2}, rng)() for _ in range(100)]
+        self.assertTrue(all(1 <= sample <= 2 for sample in samples))
+        with self.assertRaises(LoadProfileException) :
+            make_distribution({'distribution' : 'exponential'}, rng)
+        with self.assertRaises(LoadProfileException) :
+            make_distribution({'distribution' : 'zipf'}, rng)
+
+    def test_profile_from_dict(self) :
+        profile = LoadProfile.from_dict({'duration' : 60, 'hold_time' : {'distribution' : 'exponential', 'mean' : 30}})
+        self.assertEqual(profile.duration, 60)
+        with self.assertRaises(LoadProfileException) :
+            LoadProfile.from_dict({'calls_per_hour' : 1})
+        with self.assertRaises(LoadProfileException) :
+            LoadProfile.from_dict({'callee_selection' : 'list'})
+
+    def test_scripted_calls(self) :
+        fleet = SimulatedFleet(['0001', '0002'])
+        fleet.start()
+        fleet.run(1.0)
+        profile = LoadProfile(duration=600.0, calls_per_second=0.01, callee_selection='list', callees=['0002'],
+            answer_probability=1.0, answer_delay=2.0, hold_time=20.0, talk_rate=0.5, seed=3)
+        # only 0001 places calls
+        generator = LoadGenerator({'0001' : fleet.phones['0001']}, profile, fleet.simulation.call_later, fleet.simulation.clock)
+        callee = LoadGenerator({'0002' : fleet.phones['0002']}, LoadProfile(calls_per_second=0, answer_probability=1.0,
+            answer_delay=2.0), fleet.simulation.call_later, fleet.simulation.clock)
+        generator.start()
+        callee.start()
+        fleet.run(601.0)
+        generator.stop()
+        callee.stop()
+
+        stats = generator.stats
+        self.assertGreater(stats.attempted, 0)
+        self.assertEqual(stats.busy + stats.not_available, 0)
+        self.assertEqual(stats.connected, stats.ringing)
+        self.assertEqual(callee.stats.answered, stats.connected)
+        self.assertEqual(len(fleet.switch.call_records), stats.completed)
+        for record in fleet.switch.call_records :
+            self.assertAlmostEqual(record.duration, 20.0, places=1)
+        self.assertGreater(stats.talk_sent, 0)
+        self.assertAlmostEqual(stats.as_dict()['mean_time_to_connected'], 2.02, places=2)
+        fleet.shutdown()
+
+    def test_run_simulated(self) :
+        numbers = [str(n).zfill(4) for n in range(1, 51)]
+        profile = LoadProfile(duration=3600.0, calls_per_second=1.0 / 600.0, seed=1)
+        stats, latency_recorder = run_simulated(numbers, profile)
+        self.assertGreater(stats.attempted, 100)
+        self.assertGreaterEqual(stats.attempted, stats.ringing)
+        self.assertEqual(run_simulated(numbers, profile)[0].as_dict(), stats.as_dict())
+        self.assertEqual(latency_recorder['make_call_to_ringing'].count, stats.ringing)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,186 @@
+import asyncio
+import tracemalloc
+import unittest
+
+from async_phone_emulator import PhoneEngine
+from media import RING_FRAMES, MediaStats, MediaStream
+from phone_emulator import PhoneEmulator, PhoneState
+from simulation import SimulatedFleet
+from switch_server import SwitchServer
+from timer_wheel import ManualTimerWheel
+
+class TestMediaStream(unittest.TestCase) :
+
+    def setUp(self) :
+        self.now = [0]
+        self.sender = MediaStream(lambda : self.now[0])
+        self.receiver = MediaStream(lambda : self.now[0])
+
+    def test_frames_reuse_the_ring(self) :
+        frames = [self.sender.next_frame() for _ in range(RING_FRAMES + 1)]
+        self.assertEqual(len({id(frame) for frame in frames[:RING_FRAMES]}), RING_FRAMES)
+        self.assertIs(frames[RING_FRAMES], frames[0])
+        self.assertEqual(self.sender.sent, RING_FRAMES + 1)
+
+    def test_loss_duplicates_and_reordering(self) :
+        frames = []
+        for _ in range(10) :
+            frames.append(bytes(self.sender.next_frame()))
+        for i in (0, 1, 3, 2, 2, 5, 9) :
+            self.receiver.receive(frames[i])
+        self.assertEqual(self.receiver.received, 6)
+        self.assertEqual(self.receiver.duplicates, 1)
+        self.assertEqual(self.receiver.reordered, 1)
+        # 4, 6, 7 and 8 never arrived
+        self.assertEqual(self.receiver.lost, 4)
+
+    def test_delay_and_jitter(self) :
+        # 20 ms apart, arriving after 5 ms, then 15 ms, then 5 ms again
+        for sent, delay in ((0, 5), (20, 15), (40, 5)) :
+            self.now[0] = sent * 1000000
+            frame = self.sender.next_frame()
+            self.now[0] += delay * 1000000
+            self.receiver.receive(frame)
+        self.assertEqual((self.receiver.delay.min, self.receiver.delay.max), (5000000, 15000000))
+        # RFC 3550: J += (|D| - J) / 16, with D = 10 ms both times
+        jitter = 10000000 / 16
+        jitter += (10000000 - jitter) / 16
+        self.assertAlmostEqual(self.receiver.jitter.max, jitter, delta=jitter / 50)
+
+    def test_stats(self) :
+        for _ in range(3) :
+            self.receiver.receive(self.sender.next_frame())
+        stats = MediaStats()
+        stats.add(self.sender)
+        stats.add(self.receiver)
+        merged = MediaStats.from_dict(stats.to_dict())
+        merged.merge(stats)
+        summary = merged.summary()
+        self.assertEqual((summary['calls'], summary['frames_sent'], summary['frames_received']), (4, 6, 6))
+        self.assertEqual(summary['loss'], 0.0)
+
+# Stands in for the socketio.Client of a stepped phone, sending its media straight back to it
+class LoopbackSocket :
+
+    def __init__(self) :
+        self.phone = None
+
+    def connect(self, *args, **kwargs) :
+        pass
+
+    def disconnect(self) :
+        pass
+
+    def emit(self, event, *args) :
+        if event == 'media' :
+            self.phone._socket_media_event(args[0])
+
+class TestMediaAllocations(unittest.TestCase) :
+
+    def setUp(self) :
+        self.timers = ManualTimerWheel()
+        self.phone = PhoneEmulator('0001', 'https://localhost:5000', timers=self.timers, clock=self.timers.time,
+            media=MediaStats(lambda : int(self.timers.time() * 1e9)))
+        self.phone._sio = LoopbackSocket()
+        self.phone._sio.phone = self.phone
+        self.phone.step()
+        self.phone._socket_connect_event()
+        self.phone._socket_registered_event('0001')
+        self.phone.off_hook()
+        for key in '0002' :
+            self.phone.key_press(key)
+        self.phone.process_pending()
+        self.phone._socket_callee_ringing_event()
+        self.phone._socket_call_connected_event()
+        self.phone.process_pending()
+        self.assertEqual(self.phone.snapshot().state, PhoneState.CALL_CONNECTED)
+
+    def tearDown(self) :
+        self.phone.shutdown()
+        self.phone.process_pending()
+
+    def frames(self, count) :
+        for _ in range(count) :
+            self.timers.advance_by(0.02)
+            self.phone.process_pending()
+
+    def test_steady_state(self) :
+        self.frames(100)
+        timer = self.phone._media_timer
+        version = self.phone.snapshot().version
+        tracemalloc.start()
+        try :
+            before = tracemalloc.get_traced_memory()[0]
+            self.frames(500)
+            after = tracemalloc.get_traced_memory()[0]
+        finally :
+            tracemalloc.stop()
+        self.assertEqual(self.phone._media_stream.received, 600)
+        self.assertIs(self.phone._media_timer, timer)
+        self.assertEqual(self.phone.snapshot().version, version)
+        # nothing outlives its frame (a few counters just hold bigger ints)
+        self.assertLess(after - before, 1024)
+
+class TestSimulatedMedia(unittest.TestCase) :
+
+    def test_call(self) :
+        fleet = SimulatedFleet(['0001', '0002'], media=True)
+        fleet.phones['0002'].auto_answer(1.0)
+        fleet.start()
+        fleet.phones['0001'].place_call(1.0, '0002', hold=10.0)
+        fleet.run(20.0)
+        fleet.shutdown()
+
+        summary = fleet.media.summary()
+        self.assertEqual(summary['calls'], 2)
+        # dialed by 3s, answered a second later and hung up at 13s: about 9 seconds each way, at 50
+        # frames a second
+        self.assertGreater(summary['frames_sent'], 850)
+        self.assertLess(summary['frames_sent'], 950)
+        # frames still on the way at the hang up are lost to the call
+        self.assertLessEqual(summary['frames_sent'] - summary['frames_received'], 2)
+        self.assertEqual(summary['frames_lost'], 0)
+        # phone to switch to phone, on a fixed 5 ms each way
+        self.assertAlmostEqual(summary['delay_ms']['p50'], 10.0, delta=0.2)
+        self.assertEqual(summary['jitter_ms']['max'], 0.0)
+
+class TestServerMedia(unittest.IsolatedAsyncioTestCase) :
+
+    async def test_call(self) :
+        server = SwitchServer(['0001', '0002'])
+        port = await server.start('localhost', 0)
+        engine = PhoneEngine(f'http://localhost:{port}', media=MediaStats())
+        try :
+            caller = engine.add_phone('0001')
+            callee = engine.add_phone('0002')
+            callee.subscribe(lambda snapshot, changed : callee.off_hook()
+                if snapshot.state == PhoneState.INCOMING_CALL_RINGING else None, ('state',))
+            await engine.start()
+            for _ in range(200) :
+                if caller.snapshot().state == PhoneState.ON_HOOK_IDLE and callee.snapshot().state == PhoneState.ON_HOOK_IDLE :
+                    break
+                await asyncio.sleep(0.01)
+            caller.off_hook()
+            for key in '0002' :
+                caller.key_press(key)
+            for _ in range(200) :
+                if caller.snapshot().state == PhoneState.CALL_CONNECTED :
+                    break
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.5)
+            caller.on_hook()
+            for _ in range(200) :
+                if callee.snapshot().state == PhoneState.CALL_ENDED :
+                    break
+                await asyncio.sleep(0.01)
+        finally :
+            await engine.shutdown()
+            await server.stop()
+
+        summary = engine.media.summary()
+        self.assertEqual(summary['calls'], 2)
+        self.assertGreater(summary['frames_received'], 30)
+        self.assertIsNotNone(summary['delay_ms']['p50'])
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -1,8 +1,15 @@
+import contextlib
+import io
+import signal
+import threading
 import unittest
 from unittest.mock import patch
 
-from phone_emulator import PhoneEmulator, PhoneSounds
+from phone_emulator import CALL_TIMEOUT, PhoneEmulator, PhoneEvent, PhoneEventType, PhoneSounds, PhoneState, run_headless
+from timer_wheel import ManualTimerWheel
 
+# The phone is stepped on the test's own thread, with timers that only fire when the test
+# advances them (TestThreadedPhoneEmulator covers the thread)
 class TestPhoneEmulator(unittest.TestCase) :
     
     def setUp(self) :
@@ -10,32 +17,33 @@ class TestPhoneEmulator(unittest.TestCase) :
         MockSocketIoClient = patcher.start()
         self.addCleanup(patcher.stop)
 
-        self.phone = PhoneEmulator('0000', 'https://localhost:5000')
-        self.phone.start()
+        self.timers = ManualTimerWheel()
+        self.phone = PhoneEmulator('0000', 'https://localhost:5000', timers=self.timers, clock=self.timers.time)
+        self.phone.step()
         self.phone._socket_connect_event()
         self.phone._socket_registered_event('0000')
 
         self.sio = MockSocketIoClient.return_value
 
     def tearDown(self) :
-        if self.phone.is_alive() :
-            self.phone.shutdown()
+        self.phone.shutdown()
+        self.phone.process_pending()
 
     def test_make_call_request(self) :
         #print('In test_make_call_request')
 
         # Reset the usual setUp for this one test
         self.phone.shutdown()
-        self.phone.join()
+        self.phone.process_pending()
         self.sio.reset_mock()
-        self.phone = PhoneEmulator('0000', 'https://localhost:5000')
+        self.phone = PhoneEmulator('0000', 'https://localhost:5000', timers=self.timers, clock=self.timers.time)
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._disconnected)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
         
-        self.phone.start()
+        self.phone.step()
         self.phone._socket_connect_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._unregistered)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -43,7 +51,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.sio.emit.assert_not_called()
 
         self.phone._socket_registered_event('0000')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -52,14 +60,14 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # make sure there's a dial tone
         self.phone.off_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._off_hook_dialing)
         self.assertEqual(self.phone._sound, PhoneSounds.DIAL_TONE)
 
         # make sure that dialing while on hook doesn't make a call request
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -67,7 +75,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('1')
         self.phone.key_press('1')
         self.phone.key_press('1')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
         self.assertEqual(self.sio.emit.call_count, emit_call_count)
@@ -78,7 +86,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('2')
         self.phone.key_press('2')
         self.phone.key_press('2')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertTrue(self.phone._emit_hangup)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
@@ -89,7 +97,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # interrupt the call request
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertFalse(self.phone._emit_hangup)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
@@ -98,7 +106,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.assertEqual(self.sio.emit.call_count, emit_call_count)
 
         self.phone.shutdown()
-        self.phone.join()
+        self.phone.process_pending()
         self.sio.disconnect.assert_called_once()
 
     def test_make_call_busy(self) :
@@ -110,7 +118,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('2')
         self.phone.key_press('3')
         self.phone.key_press('4')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -121,7 +129,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # simulate a 'busy' response from the server
         self.phone._socket_call_not_possible_event('busy')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_busy)
         self.assertEqual(self.phone._sound, PhoneSounds.BUSY)
@@ -130,7 +138,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # finish the call
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -145,7 +153,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('2')
         self.phone.key_press('3')
         self.phone.key_press('4')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -156,7 +164,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # simulate a 'no_recipient' response from the server
         self.phone._socket_call_not_possible_event('no_recipient')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_not_available)
         self.assertEqual(self.phone._sound, PhoneSounds.FAST_BUSY)
@@ -165,7 +173,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # finish the call
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -179,7 +187,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('2')
         self.phone.key_press('3')
         self.phone.key_press('4')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -189,13 +197,13 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # now dial some more
         self.phone.key_press('5')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
         self.assertEqual(self.sio.emit.call_count, emit_call_count)
         self.phone.key_press('6')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -214,7 +222,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('4')
         self.phone._socket_call_not_possible_event('busy')
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -226,20 +234,20 @@ class TestPhoneEmulator(unittest.TestCase) :
         # until all four new digits have been entered
         self.phone.off_hook()
         self.phone.key_press('5')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._off_hook_dialing)
         self.assertEqual(self.sio.emit.call_count, emit_call_count)
         self.phone.key_press('6')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertEqual(self.phone._state, self.phone._off_hook_dialing)
         self.assertEqual(self.sio.emit.call_count, emit_call_count)
         self.phone.key_press('7')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertEqual(self.phone._state, self.phone._off_hook_dialing)
         self.assertEqual(self.sio.emit.call_count, emit_call_count)
         self.phone.key_press('8')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.sio.emit.assert_called_with('make_call', '5678')
         emit_call_count += 1
@@ -254,7 +262,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('3')
         self.phone.key_press('4')
         self.phone._socket_callee_ringing_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._outgoing_call_ringing)
         self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
@@ -262,7 +270,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         
         # now establish a connection
         self.phone._socket_call_connected_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.sio.emit.assert_called_with('call_accepted')
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
@@ -272,7 +280,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # outgoing talk
         self.phone.talk('Hello, 1234!')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.sio.emit.assert_called_with('talk', 'Hello, 1234!')
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
@@ -282,7 +290,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # incoming talk
         self.phone._socket_talk_event('foo bar baz')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
         self.assertEqual(self.phone._sound, PhoneSounds.CALL)
@@ -291,7 +299,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # now hang up
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.sio.emit.assert_called_with('hang_up')
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
@@ -306,7 +314,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('3')
         self.phone.key_press('4')
         self.phone._socket_callee_ringing_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._outgoing_call_ringing)
         self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
@@ -314,7 +322,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         
         # now establish a connection
         self.phone._socket_call_connected_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.sio.emit.assert_called_with('call_accepted')
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
@@ -323,7 +331,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # outgoing talk
         self.phone.talk('Hello, 1234!')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.sio.emit.assert_called_with('talk', 'Hello, 1234!')
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
@@ -332,7 +340,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # incoming talk
         self.phone._socket_talk_event('I can\'t talk now')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
         self.assertEqual(self.phone._sound, PhoneSounds.CALL)
@@ -340,7 +348,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # the other side hangs up
         self.phone._socket_call_ended_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_ended)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -349,7 +357,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # now hang up
         self.phone.on_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -363,7 +371,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         self.phone.key_press('1')
         self.phone.key_press('1')
         self.phone.key_press('1')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
         self.assertTrue(self.phone._emit_hangup)
@@ -371,14 +379,14 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # set the call as ringing
         self.phone._socket_callee_ringing_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._outgoing_call_ringing)
         self.assertTrue(self.phone._emit_hangup)
 
         # set the call as timed out
         self.phone._socket_call_not_possible_event('timeout')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_not_available)
         self.assertEqual(self.phone._sound, PhoneSounds.FAST_BUSY)
@@ -388,7 +396,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         #print('In test_incoming_call')
         # signal an incoming call
         self.phone._socket_call_request_event('2222')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
         self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
@@ -400,7 +408,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # accept the call
         self.phone.off_hook()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._incoming_call_finalize)
         self.assertEqual(self.phone._sound, PhoneSounds.CALL)
@@ -410,7 +418,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         call_count = self.sio.emit.call_count
 
         self.phone._socket_call_connected_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_connected)
         self.assertEqual(self.phone._sound, PhoneSounds.CALL)
@@ -421,7 +429,7 @@ class TestPhoneEmulator(unittest.TestCase) :
         #print('In test_incoming_call_cancelled')
         # signal an incoming call
         self.phone._socket_call_request_event('2222')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
         self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
@@ -434,7 +442,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # signal that the caller has hung up
         self.phone._socket_call_cancelled_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
@@ -445,7 +453,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         # now to test if the caller hangs up immediately before we pick up
         self.phone._socket_call_request_event('2222')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
         self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
@@ -459,7 +467,7 @@ class TestPhoneEmulator(unittest.TestCase) :
 
         self.phone.off_hook()
         self.phone._socket_call_cancelled_event()
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertFalse(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._call_not_available)
         self.assertEqual(self.phone._sound, PhoneSounds.FAST_BUSY)
@@ -468,20 +476,168 @@ class TestPhoneEmulator(unittest.TestCase) :
     def test_incoming_call_timeout(self) :
         #print('In test_incoming_call_timeout')
         self.phone._socket_call_request_event('2222')
-        self.phone._events.join()
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
         self.assertEqual(self.phone._sound, PhoneSounds.RINGING)
         self.assertTrue(self.phone._call_timer.is_alive())
 
-        # wait for the timer to expire
-        self.phone._call_timer.join()
-        self.phone._events.join()
+        # let the timer expire
+        self.timers.advance_by(CALL_TIMEOUT - 0.1)
+        self.phone.process_pending()
+        self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
+        self.timers.advance_by(0.1)
+        self.phone.process_pending()
         self.assertTrue(self.phone._on_hook)
         self.assertEqual(self.phone._state, self.phone._on_hook_idle)
         self.assertEqual(self.phone._sound, PhoneSounds.SILENT)
         self.assertIsNone(self.phone._call_timer)
         self.sio.emit.assert_called_with('call_refused', ('2222', 'timeout'))
 
+    def test_snapshots(self) :
+        self.phone.process_pending()
+        published = []
+        self.phone.subscribe(lambda snapshot, changed : published.append((snapshot, changed)), ('state', 'sound'))
+        snapshot = self.phone.snapshot()
+        self.assertEqual(snapshot.state, PhoneState.ON_HOOK_IDLE)
+        self.assertTrue(snapshot.on_hook)
+        with self.assertRaises(AttributeError) :
+            snapshot.on_hook = False
+
+        self.phone.off_hook()
+        self.phone.key_press('1')
+        self.phone.process_pending()
+        self.assertEqual(len(published), 1)
+        snapshot, changed = published[0]
+        self.assertTrue({'state', 'on_hook', 'sound'} <= changed)
+        self.assertNotIn('number_dialed', changed)
+        self.assertEqual(snapshot.state, PhoneState.OFF_HOOK_DIALING)
+        self.assertEqual(snapshot.sound, PhoneSounds.DIAL_TONE)
+
+        # the key press only changed the digits, which this subscriber didn't ask for
+        latest = self.phone.snapshot()
+        self.assertEqual(latest.number_dialed, '1')
+        self.assertEqual(latest.version, snapshot.version + 1)
+
+    def test_batches(self) :
+        self.phone.process_pending()
+        notifications = []
+        class Gui :
+            def notify(self) :
+                notifications.append(None)
+        self.phone.register_gui(Gui())
+
+        # the emulator's thread is idle, so this stands in for one wakeup's worth of events
+        keys = [PhoneEvent(PhoneEventType.KEY_PRESS, key) for key in '12345']
+        self.phone._dispatch_batch([PhoneEvent(PhoneEventType.OFF_HOOK)] + keys)
+        self.assertEqual(self.phone._state, self.phone._init_outgoing_call)
+        self.assertEqual(self.phone._number_dialed, '1234')
+        self.sio.emit.assert_called_once_with('make_call', '1234')
+        self.assertEqual(len(notifications), 1)
+
+        self.phone._dispatch_batch([PhoneEvent(PhoneEventType.CALLEE_RINGING), PhoneEvent(PhoneEventType.CALL_CONNECTED)] +
+            [PhoneEvent(PhoneEventType.INCOMING_TALK, f'line {i}') for i in range(100)])
+        self.assertEqual(self.phone._state, self.phone._call_connected)
+        self.assertEqual(self.phone.snapshot().transcript_lines, 100)
+        self.assertEqual(len(notifications), 2)
+
+    def test_stepping(self) :
+        self.phone.process_pending()
+        # nothing happens until the phone is stepped
+        self.phone.off_hook()
+        self.assertEqual(self.phone._state, self.phone._on_hook_idle)
+        self.assertEqual(self.phone.step(), 1)
+        self.assertEqual(self.phone._state, self.phone._off_hook_dialing)
+        self.assertEqual(self.phone.step(), 0)
+
+        # and timers only fire when they're advanced
+        self.phone._socket_call_request_event('2222')
+        self.phone.on_hook()
+        self.phone._socket_call_request_event('3333')
+        self.assertEqual(self.phone.process_pending(), 3)
+        self.assertEqual(self.phone._state, self.phone._incoming_call_ringing)
+        self.assertEqual(self.timers.advance_by(CALL_TIMEOUT), 1)
+        self.assertEqual(self.phone.process_pending(), 1)
+        self.assertEqual(self.phone._state, self.phone._on_hook_idle)
+        self.assertEqual(self.phone.snapshot().timestamp, CALL_TIMEOUT)
+
+        self.phone.shutdown()
+        self.phone.key_press('1')
+        self.assertEqual(self.phone.process_pending(), 2)
+        self.sio.disconnect.assert_called_once()
+        self.phone.off_hook()
+        self.assertEqual(self.phone.step(), 0)
+
+    def test_talk_state(self) :
+        self.phone.process_pending()
+        self.phone.off_hook()
+        for key in '1234' :
+            self.phone.key_press(key)
+        self.phone._socket_call_connected_event()
+        # queued before the connected snapshot is published, and left for the state machine to decide
+        self.assertTrue(self.phone.talk('Hello, 1234!'))
+        self.phone.process_pending()
+        self.sio.emit.assert_called_with('talk', 'Hello, 1234!')
+
+        self.phone._socket_call_ended_event()
+        self.assertTrue(self.phone.talk('Too late'))
+        self.phone.process_pending()
+        self.assertEqual(self.phone._state, self.phone._call_ended)
+        stats = self.phone.talk_stats()
+        self.assertEqual((stats['pending'], stats['sent'], stats['dropped']), (0, 1, 1))
+
+# The phone on its own thread, as it runs for real
+class TestThreadedPhoneEmulator(unittest.TestCase) :
+
+    def setUp(self) :
+        patcher = patch('socketio.Client', autospec=True)
+        MockSocketIoClient = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sio = MockSocketIoClient.return_value
+
+    def test_call(self) :
+        phone = PhoneEmulator('0000', 'https://localhost:5000')
+        phone.start()
+        phone._socket_connect_event()
+        phone._socket_registered_event('0000')
+        phone.off_hook()
+        for key in '1234' :
+            phone.key_press(key)
+        phone._events.join()
+        self.assertEqual(phone._state, phone._init_outgoing_call)
+        self.sio.emit.assert_called_with('make_call', '1234')
+
+        phone._socket_callee_ringing_event()
+        phone._socket_call_connected_event()
+        phone._events.join()
+        self.assertTrue(phone.talk('hello'))
+        phone._events.join()
+        self.sio.emit.assert_called_with('talk', 'hello')
+
+        phone.shutdown()
+        phone.join()
+        self.sio.emit.assert_called_with('hang_up')
+        self.sio.disconnect.assert_called_once()
+
+    def test_headless(self) :
+        phone = PhoneEmulator('0001', 'https://localhost:5000')
+        self.assertIsNone(phone._sio)
+
+        def drive() :
+            phone._socket_connect_event()
+            phone._socket_registered_event('0001')
+            phone._events.join()
+            phone.shutdown()
+        threading.Timer(0.1, drive).start()
+        output = io.StringIO()
+        handler = signal.getsignal(signal.SIGTERM)
+        try :
+            with contextlib.redirect_stdout(output) :
+                self.assertEqual(run_headless(phone), 0)
+        finally :
+            signal.signal(signal.SIGTERM, handler)
+        self.assertRegex(output.getvalue(), r'^0001 registered [0-9.]+s after start\n$')
+        self.sio.connect.assert_called_with('https://localhost:5000', auth={'phoneNumber' : '0001'}, transports=None)
+
 if __name__ == '__main__' :
     unittest.main()
\ No newline at end of file
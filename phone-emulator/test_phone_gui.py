@@ -0,0 +1,69 @@
+import unittest
+from queue import SimpleQueue
+
+from phone_gui import TranscriptView, drain, status_text
+from simulation import SimulatedFleet
+
+# What the display shows and when, worked out without a Tk root
+class TestTranscriptView(unittest.TestCase) :
+
+    def setUp(self) :
+        self.fleet = SimulatedFleet(['0001', '0002'])
+        self.fleet.start()
+        self.fleet.run(1.0)
+        self.phone = self.fleet.phones['0001']
+        self.callee = self.fleet.phones['0002']
+        self.callee.auto_answer(1.0)
+
+    def tearDown(self) :
+        self.fleet.shutdown()
+
+    def talk(self, at, *messages) :
+        for msg in messages :
+            self.callee.talk(msg)
+        self.fleet.run(at)
+
+    def test_update(self) :
+        view = TranscriptView(3)
+        self.assertEqual(view.update(self.phone), (True, [], 0))
+        self.assertIsNone(view.update(self.phone))
+
+        self.phone.place_call(2.0, '0002', hold=60.0)
+        self.fleet.run(10.0)
+        # connecting starts the transcript over, under a new header
+        self.assertEqual(view.update(self.phone), (True, [], 0))
+        self.assertEqual(view.header, 'Connected to 0002')
+
+        self.talk(11.0, 'a', 'b')
+        self.assertEqual(view.update(self.phone), (False, ['0002 : a', '0002 : b'], 0))
+        self.talk(12.0, 'c', 'd', 'e')
+        # five lines, against room for three
+        self.assertEqual(view.update(self.phone), (False, ['0002 : c', '0002 : d', '0002 : e'], 2))
+        self.assertEqual(view.shown_lines, 3)
+        self.assertIsNone(view.update(self.phone))
+
+        # the header goes when the other side hangs up, and the lines are shown again without it
+        self.callee.on_hook()
+        self.fleet.run(13.0)
+        self.assertEqual(view.update(self.phone), (True, [f'0002 : {msg}' for msg in 'abcde'], 2))
+        self.assertIsNone(view.header)
+        self.assertEqual(view.shown_lines, 3)
+
+    def test_status_text(self) :
+        self.assertEqual(status_text(self.phone.snapshot()), '0001: On hook (No sound)')
+        self.phone.off_hook()
+        self.phone.key_press('0')
+        self.fleet.run(2.0)
+        snapshot = self.phone.snapshot()
+        self.assertEqual(status_text(snapshot), f'0001: Off hook ({snapshot.sound.value}).  Dialing 0')
+
+class TestDrain(unittest.TestCase) :
+
+    def test_drain(self) :
+        changes = SimpleQueue()
+        self.assertFalse(drain(changes))
+        for _ in range(3) :
+            changes.put(None)
+        # a burst of notifications is one redraw
+        self.assertTrue(drain(changes))
+        self.assertFalse(drain(changes))
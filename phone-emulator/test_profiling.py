@@ -0,0 +1,123 @@
+import os
+import pstats
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from phone_emulator import PhoneEmulator
+from profiling import CPROFILE, ENV_VAR, SAMPLE, HandlerProfile, ProfileWindow, SamplingProfiler
+from timer_wheel import ManualTimerWheel
+
+class FakeClock :
+    def __init__(self) :
+        self.now = 0
+
+    # every reading is 1 us after the last
+    def __call__(self) :
+        self.now += 1000
+        return self.now
+
+class TestHandlerProfile(unittest.TestCase) :
+
+    def setUp(self) :
+        patcher = patch('socketio.Client', autospec=True)
+        MockSocketIoClient = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sio = MockSocketIoClient.return_value
+
+        self.profile = HandlerProfile(FakeClock())
+        self.phone = PhoneEmulator('0000', 'https://localhost:5000', timers=ManualTimerWheel(), profile=self.profile)
+        self.phone.step()
+
+    def tearDown(self) :
+        self.phone.shutdown()
+        self.phone.process_pending()
+
+    def _row(self, state, event, handler) :
+        for row in self.profile.rows() :
+            if (row['state'], row['event'], row['handler']) == (state, event, handler) :
+                return row
+        self.fail(f'No profile for {state} / {event} / {handler}')
+
+    def test_handlers(self) :
+        self.phone._socket_connect_event()
+        self.phone._socket_registered_event('0000')
+        self.phone.off_hook()
+        for key in '1234' :
+            self.phone.key_press(key)
+        self.phone.process_pending()
+
+        self.assertEqual(self._row('DISCONNECTED', 'SERVER_CONNECT', '_server_connect_event')['count'], 1)
+        self.assertEqual(self._row('ON_HOOK_IDLE', 'OFF_HOOK', '_off_hook_event')['count'], 1)
+        # the key presses came in one batch, so were coalesced into one event
+        row = self._row('OFF_HOOK_DIALING', 'KEY_PRESS', '_dialing_key_press_event')
+        self.assertEqual((row['count'], row['total_ms'], row['peak_us']), (1, 0.001, 1.0))
+
+    def test_socket_callbacks(self) :
+        callbacks = {call.args[0] : call.args[1] for call in self.sio.on.call_args_list}
+        callbacks['connect']()
+        self.phone.process_pending()
+        # timed under the state the phone was in when the callback ran
+        callbacks['registered']('0000')
+        self.phone.process_pending()
+        self.assertEqual(self._row('DISCONNECTED', 'socket connect', '_socket_connect_event')['count'], 1)
+        self.assertEqual(self._row('UNREGISTERED', 'socket registered', '_socket_registered_event')['count'], 1)
+        self.assertEqual(self.phone._state, self.phone._on_hook_idle)
+
+    def test_merge(self) :
+        self.phone._socket_connect_event()
+        self.phone.process_pending()
+        merged = HandlerProfile.from_dict(self.profile.to_dict())
+        merged.merge(self.profile)
+        self.assertEqual([row['count'] for row in merged.rows()], [2 * row['count'] for row in self.profile.rows()])
+        self.assertIn('_server_connect_event', merged.report())
+
+    @unittest.skipIf(os.environ.get(ENV_VAR, '') not in ('', '0'), f'{ENV_VAR} turns profiling on')
+    def test_off_by_default(self) :
+        phone = PhoneEmulator('0001', 'https://localhost:5000', timers=ManualTimerWheel())
+        self.assertIsNone(phone._profile)
+
+class TestProfileWindow(unittest.TestCase) :
+
+    def _busy(self, stop) :
+        while not stop.is_set() :
+            sum(range(1000))
+
+    def test_sampling(self) :
+        stop = threading.Event()
+        busy = threading.Thread(target=self._busy, args=(stop,))
+        busy.start()
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        try :
+            while profiler.samples < 20 :
+                stop.wait(0.01)
+        finally :
+            profiler.stop()
+            stop.set()
+            busy.join()
+        self.assertTrue(any('_busy (test_profiling.py' in line for line in profiler.collapsed()))
+
+    def test_windows(self) :
+        with tempfile.TemporaryDirectory() as directory :
+            path = os.path.join(directory, 'window.prof')
+            window = ProfileWindow(path, CPROFILE)
+            window.start()
+            sum(range(1000))
+            window.stop()
+            self.assertFalse(window.running)
+            self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+            path = os.path.join(directory, 'window.folded')
+            window = ProfileWindow(path, SAMPLE)
+            window.start()
+            threading.Event().wait(0.05)
+            window.stop()
+            self.assertTrue(os.path.getsize(path) > 0)
+
+        with self.assertRaises(ValueError) :
+            ProfileWindow(path, 'perf')
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,96 @@
+import random
+import unittest
+
+from phone_emulator import PhoneState
+from reconnect import ReconnectPolicy, ReconnectStats, TokenBucket
+from simulation import SimulatedFleet
+
+class TestTokenBucket(unittest.TestCase) :
+
+    def test_rate_and_burst(self) :
+        now = [0.0]
+        bucket = TokenBucket(rate=10.0, burst=3, clock=lambda : now[0])
+        self.assertEqual([round(bucket.reserve(), 6) for _ in range(5)], [0.0, 0.0, 0.0, 0.1, 0.2])
+
+        # the bucket refills while nothing is asked of it
+        now[0] = 10.0
+        self.assertEqual([round(bucket.reserve(), 6) for _ in range(4)], [0.0, 0.0, 0.0, 0.1])
+        now[0] = 10.15
+        self.assertEqual(round(bucket.reserve(), 6), 0.05)
+
+class TestReconnectPolicy(unittest.TestCase) :
+
+    def test_backoff(self) :
+        policy = ReconnectPolicy(initial_delay=1.0, max_delay=8.0, max_attempts=6, rng=random.Random(0))
+        for attempt in range(6) :
+            ceiling = min(8.0, 2.0 ** attempt)
+            delays = [policy.delay(attempt) for _ in range(200)]
+            self.assertTrue(all(0.0 <= delay <= ceiling for delay in delays))
+            # full jitter: spread over the whole range
+            self.assertLess(min(delays), ceiling * 0.1)
+            self.assertGreater(max(delays), ceiling * 0.9)
+        self.assertIsNone(policy.delay(6))
+        self.assertLessEqual(ReconnectPolicy(max_delay=30.0).delay(5000), 30.0)
+
+class TestReconnectStorm(unittest.TestCase) :
+
+    def setUp(self) :
+        self.numbers = [str(n).zfill(4) for n in range(1, 201)]
+        self.fleet = SimulatedFleet(self.numbers, max_reconnects_per_second=20.0)
+        self.fleet.start()
+        self.fleet.run(1.0)
+
+    def states(self) :
+        return {phone.snapshot().state for phone in self.fleet.phones.values()}
+
+    def test_storm(self) :
+        attempts = []
+        def on_header(snapshot, changed) :
+            if snapshot.header and snapshot.header.startswith('Reconnecting') :
+                attempts.append(self.fleet.simulation.now)
+        for phone in self.fleet.phones.values() :
+            phone.subscribe(on_header, ('header',))
+
+        self.fleet.restart_server(5.0)
+        self.fleet.run(3.0)
+        self.assertEqual(self.states(), {PhoneState.DISCONNECTED})
+        self.fleet.run(100.0)
+        self.assertEqual(self.states(), {PhoneState.ON_HOOK_IDLE})
+        self.assertEqual(len(self.fleet.switch), 200)
+
+        stats = self.fleet.reconnect_policy.stats.summary()
+        self.assertEqual(stats['disconnects'], 200)
+        self.assertEqual(stats['reconnects'], 200)
+        self.assertEqual(stats['storms'], 1)
+        self.assertFalse(stats['in_storm'])
+        self.assertEqual(stats['attempts'], stats['reconnects'] + stats['failures'])
+        # 200 phones at 20 attempts a second (after the first burst of 20) can't all be back in
+        # under 9 seconds
+        self.assertGreater(stats['max_storm_seconds'], 9.0)
+        self.assertEqual(len(attempts), stats['attempts'])
+        # no more than a burst plus a second's worth in any one second
+        for second in range(100) :
+            in_second = sum(1 for when in attempts if second <= when < second + 1)
+            self.assertLessEqual(in_second, 40)
+
+    def test_refused_while_reconnecting(self) :
+        self.fleet.switch._valid_numbers.discard('0001')
+        self.fleet.restart_server(1.0)
+        self.fleet.run(60.0)
+        self.assertEqual(self.fleet.phones['0001'].snapshot().state, PhoneState.REGISTRATION_FAILED)
+        self.assertEqual(self.fleet.phones['0002'].snapshot().state, PhoneState.ON_HOOK_IDLE)
+        stats = self.fleet.reconnect_policy.stats
+        self.assertEqual((stats.gave_up, stats.reconnects), (1, 199))
+        self.assertEqual(len(stats.storm_durations), 1)
+
+    def test_merge(self) :
+        self.fleet.restart_server(1.0)
+        self.fleet.run(60.0)
+        stats = self.fleet.reconnect_policy.stats
+        merged = ReconnectStats.from_dict(stats.to_dict())
+        merged.merge(stats)
+        self.assertEqual(merged.summary()['reconnects'], 400)
+        self.assertEqual(merged.summary()['storms'], 2)
+
+if __name__ == '__main__' :
+    unittest.main()
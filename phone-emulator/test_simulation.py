@@ -0,0 +1,61 @@
+import unittest
+
+from phone_emulator import PhoneSounds, PhoneState
+from simulation import SimulatedFleet
+
+class TestSimulation(unittest.TestCase) :
+
+    def setUp(self) :
+        self.fleet = SimulatedFleet(['0001', '0002', '0003'], latency=0.01)
+        self.fleet.start()
+        self.fleet.run(1.0)
+        self.caller = self.fleet.phones['0001']
+        self.callee = self.fleet.phones['0002']
+
+    def test_registration(self) :
+        for phone in self.fleet.phones.values() :
+            self.assertEqual(phone.snapshot().state, PhoneState.ON_HOOK_IDLE)
+        self.assertEqual(len(self.fleet.switch), 3)
+
+    def test_full_call(self) :
+        self.callee.auto_answer(2.0)
+        self.caller.place_call(10.0, '0002', hold=60.0, talk=['Hello, 0002!'])
+        self.fleet.run(20.0)
+        self.assertEqual(self.caller.snapshot().state, PhoneState.CALL_CONNECTED)
+        self.assertEqual(self.callee.snapshot().state, PhoneState.CALL_CONNECTED)
+        self.assertEqual(self.callee.snapshot().sound, PhoneSounds.CALL)
+
+        self.fleet.run(50.0)
+        self.assertEqual(self.callee._call_dialogue, 'Connected to 0001\n0001 : Hello, 0002!')
+
+        self.fleet.run(100.0)
+        self.assertEqual(self.caller.snapshot().state, PhoneState.ON_HOOK_IDLE)
+        self.assertEqual(self.callee.snapshot().state, PhoneState.ON_HOOK_IDLE)
+
+        [record] = self.fleet.switch.call_records
+        self.assertEqual((record.caller, record.callee), ('0001', '0002'))
+        # dialing finished at 12.0 and the call was torn down at 72.0; answering and signalling take the rest
+        self.assertAlmostEqual(record.start, 14.05)
+        self.assertAlmostEqual(record.end, 72.01)
+
+    def test_ring_timeout(self) :
+        self.caller.place_call(10.0, '0002', hold=60.0)
+        self.fleet.run(13.0)
+        self.assertEqual(self.callee.snapshot().state, PhoneState.INCOMING_CALL_RINGING)
+        self.assertEqual(self.caller.snapshot().state, PhoneState.OUTGOING_CALL_RINGING)
+
+        # 15 simulated seconds later the callee gives up ringing
+        self.fleet.run(30.0)
+        self.assertEqual(self.callee.snapshot().state, PhoneState.ON_HOOK_IDLE)
+        self.assertEqual(self.caller.snapshot().state, PhoneState.CALL_NOT_AVAILABLE)
+        self.assertEqual(self.fleet.switch.call_records, [])
+
+    def test_busy(self) :
+        self.callee.auto_answer(1.0)
+        self.caller.place_call(10.0, '0002', hold=60.0)
+        self.fleet.phones['0003'].place_call(20.0, '0001', hold=60.0)
+        self.fleet.run(25.0)
+        self.assertEqual(self.fleet.phones['0003'].snapshot().state, PhoneState.CALL_BUSY)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,134 @@
+import multiprocessing
+import sys
+import unittest
+import uuid
+from unittest.mock import patch
+
+from phone_emulator import PhoneEmulator, PhoneSnapshot, PhoneSounds, PhoneState
+from status_board import SLOT_SIZE, SOUNDS, StatusBoard, StatusBoardException, summarize, summary_text
+from timer_wheel import ManualTimerWheel
+
+try :
+    import numpy
+except ImportError :
+    numpy = None
+
+class FakeClock :
+    def __init__(self) :
+        self.now = 1000.0
+
+    def __call__(self) :
+        return self.now
+
+# Just enough of a phone to publish
+class FakePhone :
+    def __init__(self, number, state) :
+        self._snapshot = PhoneSnapshot(0, 0.0, number, state, True, PhoneSounds.SILENT, '', '', 0, 0, '')
+
+    def snapshot(self) :
+        return self._snapshot
+
+    def subscribe(self, listener, fields=None) :
+        pass
+
+def _publish_from_worker(name, numbers) :
+    board = StatusBoard.attach(name)
+    for number in numbers :
+        board.publish(FakePhone(number, PhoneState.ON_HOOK_IDLE))
+    board.close()
+
+class TestStatusBoard(unittest.TestCase) :
+
+    def setUp(self) :
+        self.clock = FakeClock()
+        self.board = StatusBoard.create(['0010', '0011', '0012', '0020'], f'test-{uuid.uuid4().hex[:12]}', self.clock)
+        self.addCleanup(self.board.close)
+
+    def test_phone(self) :
+        patcher = patch('socketio.Client', autospec=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        phone = PhoneEmulator('0011', 'https://localhost:5000', timers=ManualTimerWheel())
+        phone.step()
+        self.board.publish(phone)
+        self.assertEqual(self.board.read('0011')['state'], PhoneState.DISCONNECTED)
+        self.assertIsNone(self.board.read('0010'))
+
+        phone._socket_connect_event()
+        phone._socket_registered_event('0011')
+        phone.process_pending()
+        self.clock.now += 5
+        phone.off_hook()
+        for key in '0012' :
+            phone.key_press(key)
+        phone._socket_callee_ringing_event()
+        phone._socket_call_connected_event()
+        phone.process_pending()
+        slot = self.board.read('0011')
+        self.assertEqual((slot['state'], slot['sound'], slot['on_hook']), (PhoneState.CALL_CONNECTED, PhoneSounds.CALL, False))
+        self.assertEqual((slot['calls'], slot['disconnects'], slot['changed_at']), (1, 0, 1005.0))
+
+        phone._socket_disconnect_event()
+        phone.process_pending()
+        slot = self.board.read('0011')
+        self.assertEqual((slot['state'], slot['disconnects']), (PhoneState.DISCONNECTED, 1))
+        self.assertEqual(slot['transitions'], summarize(self.board)['transitions'])
+        phone.shutdown()
+        phone.process_pending()
+
+    def test_summarize(self) :
+        self.board.publish(FakePhone('0010', PhoneState.ON_HOOK_IDLE))
+        self.board.publish(FakePhone('0012', PhoneState.INIT_OUTGOING_CALL))
+        self.clock.now += 60
+        self.board.publish(FakePhone('0020', PhoneState.INCOMING_CALL_RINGING))
+        summary = summarize(self.board, stuck_after=30.0)
+        self.assertEqual(summary['phones'], 3)
+        self.assertEqual(summary['states'], {'ON_HOOK_IDLE' : 1, 'INIT_OUTGOING_CALL' : 1, 'INCOMING_CALL_RINGING' : 1})
+        # idle for as long, but idle isn't stuck
+        self.assertEqual(summary['stuck'], ['0012'])
+        self.assertIn('1 stuck: 0012', summary_text(summary))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed (see requirements-optional.txt)')
+    def test_numpy(self) :
+        writer = self.board.publish(FakePhone('0010', PhoneState.CALL_CONNECTED))
+        self.board.publish(FakePhone('0011', PhoneState.UNREGISTERED))
+        self.clock.now += 60
+        self.board.publish(FakePhone('0012', PhoneState.OUTGOING_CALL_RINGING))
+        # some counters, and a sound other than the first
+        writer(PhoneSnapshot(1, 0.0, '0010', PhoneState.DISCONNECTED, True, PhoneSounds.FAST_BUSY, '', '', 0, 0, ''), None)
+
+        # the structured array sees every field where struct put it
+        slots = self.board.array()
+        self.assertEqual(slots.dtype.itemsize, SLOT_SIZE)
+        for slot, values in enumerate(self.board.slots()) :
+            self.assertEqual(tuple(slots[slot].tolist()), values)
+        self.assertEqual(int(slots['sound'][0]), SOUNDS.index(PhoneSounds.FAST_BUSY))
+        self.assertEqual(float(slots['changed_at'][0]), 1060.0)
+
+        with_numpy = summarize(self.board, stuck_after=30.0)
+        with patch.dict(sys.modules, {'numpy' : None}) :
+            without_numpy = summarize(self.board, stuck_after=30.0)
+        self.assertEqual(with_numpy, without_numpy)
+        self.assertEqual(with_numpy['stuck'], ['0011'])
+        self.assertEqual((with_numpy['phones'], with_numpy['calls'], with_numpy['disconnects']), (3, 1, 1))
+
+        # a view, not a copy
+        slots['calls'][1] = 7
+        self.assertEqual(self.board.read('0011')['calls'], 7)
+        del slots
+
+    def test_other_process(self) :
+        process = multiprocessing.Process(target=_publish_from_worker, args=(self.board.name, ['0010', '0020']))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(summarize(self.board)['states'], {'ON_HOOK_IDLE' : 2})
+
+    def test_errors(self) :
+        with self.assertRaises(StatusBoardException) :
+            self.board.slot('0021')
+        with self.assertRaises(StatusBoardException) :
+            StatusBoard.attach(f'missing-{uuid.uuid4().hex[:12]}')
+
+if __name__ == '__main__' :
+    unittest.main()
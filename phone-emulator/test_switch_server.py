@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from async_phone_emulator import PhoneEngine
+from phone_emulator import PhoneState
+from switch_server import SwitchServer
+
+class TestSwitchServer(unittest.IsolatedAsyncioTestCase) :
+
+    async def asyncSetUp(self) :
+        self.server = SwitchServer(['0001', '0002'])
+        port = await self.server.start('localhost', 0)
+        self.engine = PhoneEngine(f'http://localhost:{port}')
+
+    async def asyncTearDown(self) :
+        await self.engine.shutdown()
+        await self.server.stop()
+
+    async def _wait_for(self, phone, state) :
+        for _ in range(200) :
+            if phone.snapshot().state == state :
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'{phone.snapshot().phone_number} is {phone.snapshot().state.name}, not {state.name}')
+
+    async def test_call(self) :
+        caller = self.engine.add_phone('0001')
+        callee = self.engine.add_phone('0002')
+        await self.engine.start()
+        await self._wait_for(caller, PhoneState.ON_HOOK_IDLE)
+        await self._wait_for(callee, PhoneState.ON_HOOK_IDLE)
+        self.assertEqual(len(self.server), 2)
+
+        caller.off_hook()
+        for key in '0002' :
+            caller.key_press(key)
+        await self._wait_for(caller, PhoneState.OUTGOING_CALL_RINGING)
+        await self._wait_for(callee, PhoneState.INCOMING_CALL_RINGING)
+
+        callee.off_hook()
+        await self._wait_for(caller, PhoneState.CALL_CONNECTED)
+        await self._wait_for(callee, PhoneState.CALL_CONNECTED)
+        caller.talk('Hello, 0002!')
+        for _ in range(200) :
+            if callee.snapshot().last_line is not None :
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(callee.snapshot().last_line, '0001 : Hello, 0002!')
+
+        caller.on_hook()
+        await self._wait_for(callee, PhoneState.CALL_ENDED)
+        [record] = self.server.switch.call_records
+        self.assertEqual((record.caller, record.callee), ('0001', '0002'))
+
+    async def test_invalid_number(self) :
+        phone = self.engine.add_phone('0003')
+        await self.engine.start()
+        await self._wait_for(phone, PhoneState.REGISTRATION_FAILED)
+        self.assertIn('Invalid phone number', phone.snapshot().header)
+        self.assertEqual(len(self.server), 0)
+
+if __name__ == '__main__' :
+    unittest.main()
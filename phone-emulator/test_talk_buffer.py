@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from async_phone_emulator import PhoneEngine
+from phone_emulator import PhoneState
+from simulation import SimulatedFleet
+from switch_server import SwitchServer
+from talk_buffer import BLOCK, DROP, TalkBuffer
+
+class TestTalkBuffer(unittest.TestCase) :
+
+    def test_invalid(self) :
+        with self.assertRaises(ValueError) :
+            TalkBuffer(0)
+        with self.assertRaises(ValueError) :
+            TalkBuffer(10, 'spill')
+
+    def test_drop(self) :
+        buffer = TalkBuffer(10, DROP)
+        self.assertEqual(buffer.reserve(8), 8)
+        self.assertEqual(buffer.reserve(5), 2)
+        self.assertEqual(buffer.reserve(), 0)
+        self.assertEqual(len(buffer), 10)
+        buffer.sent_batch(4)
+        self.assertEqual(buffer.reserve(5), 4)
+        self.assertEqual(buffer.stats(), {'pending' : 10, 'queued' : 14, 'dropped' : 5, 'sent' : 4, 'batches' : 1})
+
+    def test_block(self) :
+        buffer = TalkBuffer(10, BLOCK)
+        # whatever fits goes straight away
+        self.assertEqual(buffer.reserve(15), 10)
+        started = time.perf_counter()
+        self.assertEqual(buffer.reserve(1, timeout=0.05), 0)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+        threading.Timer(0.05, buffer.sent_batch, (3,)).start()
+        self.assertEqual(buffer.reserve(5, timeout=5.0), 3)
+        self.assertEqual(buffer.dropped, 5 + 1 + 2)
+
+    def test_discard(self) :
+        buffer = TalkBuffer(10, BLOCK)
+        buffer.reserve(10)
+        threading.Timer(0.05, buffer.discard).start()
+        self.assertEqual(buffer.reserve(2, timeout=5.0), 2)
+        self.assertEqual(buffer.dropped, 10)
+        # talk that never went through reserve doesn't leave pending negative
+        buffer.sent_batch(5)
+        self.assertEqual(len(buffer), 0)
+
+    def test_drop_outside_call(self) :
+        buffer = TalkBuffer(10)
+        buffer.reserve(3)
+        buffer.drop(2)
+        self.assertEqual((len(buffer), buffer.dropped), (1, 2))
+        # left over from a call that has already been discarded, so not counted twice
+        buffer.discard()
+        buffer.drop(1)
+        self.assertEqual((len(buffer), buffer.dropped), (0, 3))
+
+class TestSimulatedTalk(unittest.TestCase) :
+
+    def setUp(self) :
+        self.fleet = SimulatedFleet(['0001', '0002'])
+        self.caller = self.fleet.phones['0001']
+        self.callee = self.fleet.phones['0002']
+        self.callee.auto_answer(1.0)
+        self.fleet.start()
+
+    def test_talk_many(self) :
+        # not in a call yet, so it's dropped once it reaches the state machine
+        self.assertTrue(self.caller.talk('hello'))
+        self.fleet.run(0.5)
+        self.assertEqual(self.caller.talk_stats()['dropped'], 1)
+        self.caller.place_call(1.0, '0002', hold=60.0)
+        self.fleet.run(10.0)
+        self.assertEqual(self.caller.snapshot().state, PhoneState.CALL_CONNECTED)
+
+        self.assertEqual(self.caller.talk_many(f'line {i}' for i in range(300)), 300)
+        self.fleet.run(20.0)
+        self.assertEqual(self.callee._transcript.lines()[-300:], [f'0001 : line {i}' for i in range(300)])
+        stats = self.caller.talk_stats()
+        self.assertEqual((stats['pending'], stats['sent'], stats['dropped']), (0, 300, 1))
+        self.fleet.shutdown()
+
+    def test_drop(self) :
+        self.caller.place_call(1.0, '0002', hold=60.0)
+        self.fleet.run(10.0)
+        # nothing is sent until the simulation runs again, so the buffer fills
+        self.assertEqual(self.caller.talk_many(str(i) for i in range(1500)), 1000)
+        self.assertEqual(self.caller.talk_stats()['dropped'], 500)
+        self.fleet.run(20.0)
+        self.assertEqual(self.callee._transcript.line_count, 1000)
+        self.assertEqual(self.caller.talk_many(str(i) for i in range(10)), 10)
+        self.fleet.shutdown()
+
+class TestServerTalk(unittest.IsolatedAsyncioTestCase) :
+
+    async def test_batches(self) :
+        server = SwitchServer(['0001', '0002'])
+        port = await server.start('localhost', 0)
+        engine = PhoneEngine(f'http://localhost:{port}', talk_batch=10)
+        try :
+            caller = engine.add_phone('0001')
+            callee = engine.add_phone('0002')
+            callee.subscribe(lambda snapshot, changed : callee.off_hook()
+                if snapshot.state == PhoneState.INCOMING_CALL_RINGING else None, ('state',))
+            await engine.start()
+            for _ in range(200) :
+                if caller.snapshot().state == PhoneState.ON_HOOK_IDLE and callee.snapshot().state == PhoneState.ON_HOOK_IDLE :
+                    break
+                await asyncio.sleep(0.01)
+            caller.off_hook()
+            for key in '0002' :
+                caller.key_press(key)
+            for _ in range(200) :
+                if caller.snapshot().state == PhoneState.CALL_CONNECTED :
+                    break
+                await asyncio.sleep(0.01)
+
+            lines = callee.snapshot().transcript_lines
+            self.assertEqual(caller.talk_many(f'line {i}' for i in range(95)), 95)
+            for _ in range(200) :
+                if callee.snapshot().transcript_lines == lines + 95 :
+                    break
+                await asyncio.sleep(0.01)
+        finally :
+            await engine.shutdown()
+            await server.stop()
+
+        self.assertEqual(callee._transcript.lines()[-95:], [f'0001 : line {i}' for i in range(95)])
+        stats = caller.talk_stats()
+        self.assertEqual(stats['sent'], 95)
+        # 95 messages at 10 an emit
+        self.assertEqual(stats['batches'], 10)
+
+if __name__ == '__main__' :
+    unittest.main()
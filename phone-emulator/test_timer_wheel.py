@@ -0,0 +1,106 @@
+import unittest
+
+from timer_wheel import ManualTimerWheel, TimerWheel
+
+class FakeClock :
+    def __init__(self) :
+        self.now = 0.0
+
+    def __call__(self) :
+        return self.now
+
+class TestTimerWheel(unittest.TestCase) :
+
+    def setUp(self) :
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(tick=0.01, slots=8, levels=3, clock=self.clock)
+        self.fired = []
+
+    def advance_to(self, now) :
+        self.clock.now = now
+        return self.wheel.advance()
+
+    def schedule(self, delay, name) :
+        return self.wheel.schedule(delay, lambda : self.fired.append((name, self.clock.now)))
+
+    def test_fires_across_levels(self) :
+        # 8 slots and 3 levels covers 5.12s, so these land on every level plus the overflow
+        for delay in (0.05, 0.5, 3.0, 20.0) :
+            self.schedule(delay, delay)
+        self.assertEqual(len(self.wheel), 4)
+
+        now = 0.0
+        while len(self.wheel) > 0 :
+            now = round(now + 0.01, 2)
+            self.advance_to(now)
+        self.assertEqual(self.fired, [(0.05, 0.05), (0.5, 0.5), (3.0, 3.0), (20.0, 20.0)])
+
+    def test_late_advance_fires_everything_due(self) :
+        self.schedule(0.1, 'a')
+        self.schedule(1.0, 'b')
+        self.schedule(10.0, 'c')
+        self.assertEqual(self.advance_to(2.0), 2)
+        self.assertEqual([name for name, _ in self.fired], ['a', 'b'])
+        self.assertEqual(len(self.wheel), 1)
+
+    def test_cancel(self) :
+        handle = self.schedule(15.0, 'ring')
+        self.assertTrue(handle.is_alive())
+        handle.cancel()
+        self.assertFalse(handle.is_alive())
+        self.assertTrue(handle.cancelled())
+        self.assertEqual(len(self.wheel), 0)
+        self.advance_to(20.0)
+        self.assertEqual(self.fired, [])
+
+        # cancelling after firing is harmless
+        handle = self.schedule(0.5, 'ring')
+        self.advance_to(21.0)
+        handle.cancel()
+        self.assertFalse(handle.cancelled())
+        self.assertEqual(len(self.fired), 1)
+        handle.join()
+
+    def test_reschedule(self) :
+        handle = self.schedule(0.1, 'tick')
+        self.advance_to(0.1)
+        self.assertFalse(handle.is_alive())
+        self.assertIs(self.wheel.reschedule(handle, 0.1), handle)
+        self.assertTrue(handle.is_alive())
+        self.assertEqual(len(self.wheel), 1)
+        # a pending handle just moves
+        self.wheel.reschedule(handle, 0.5)
+        self.assertEqual(len(self.wheel), 1)
+        self.advance_to(0.2)
+        self.assertEqual(len(self.fired), 1)
+        self.advance_to(0.6)
+        self.assertEqual(self.fired, [('tick', 0.1), ('tick', 0.6)])
+        handle.cancel()
+        self.wheel.reschedule(handle, 0.1)
+        self.advance_to(0.7)
+        self.assertEqual(len(self.fired), 3)
+
+    def test_schedule_after_idle_period(self) :
+        self.advance_to(1000.0)
+        self.schedule(0.02, 'a')
+        self.advance_to(1000.01)
+        self.assertEqual(self.fired, [])
+        self.advance_to(1000.02)
+        self.assertEqual(self.fired, [('a', 1000.02)])
+
+class TestManualTimerWheel(unittest.TestCase) :
+
+    def test_advance_by(self) :
+        wheel = ManualTimerWheel(start=100.0)
+        fired = []
+        for delay in (0.3, 15.0, 15.0 + wheel.tick) :
+            wheel.schedule(delay, lambda delay=delay : fired.append((delay, round(wheel.time(), 6))))
+        self.assertEqual(wheel.advance_by(0.29), 0)
+        # due exactly at the deadline, in spite of floating point
+        self.assertEqual(wheel.advance_by(0.01), 1)
+        self.assertEqual(wheel.advance_by(14.7), 1)
+        self.assertEqual(fired, [(0.3, 100.3), (15.0, 115.0)])
+        self.assertEqual(len(wheel), 1)
+
+if __name__ == '__main__' :
+    unittest.main()
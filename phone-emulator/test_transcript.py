@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from transcript import Transcript
+
+class TestTranscript(unittest.TestCase) :
+
+    def test_text(self) :
+        transcript = Transcript()
+        self.assertIsNone(transcript.text())
+        transcript.reset('Connected to 1234')
+        self.assertEqual(transcript.text(), 'Connected to 1234')
+        transcript.append('0000 : hi')
+        transcript.append('1234 : hello')
+        self.assertEqual(transcript.text(), 'Connected to 1234\n0000 : hi\n1234 : hello')
+        transcript.set_header(None)
+        self.assertEqual(transcript.text(), '0000 : hi\n1234 : hello')
+        self.assertEqual(transcript.last_line, '1234 : hello')
+
+    def test_read_since(self) :
+        transcript = Transcript(max_lines=3)
+        reset, lines, cursor = transcript.read_since()
+        self.assertTrue(reset)
+        self.assertEqual(lines, [])
+
+        transcript.append('a')
+        transcript.append('b')
+        reset, lines, cursor = transcript.read_since(cursor)
+        self.assertFalse(reset)
+        self.assertEqual(lines, ['a', 'b'])
+        reset, lines, cursor = transcript.read_since(cursor)
+        self.assertEqual(lines, [])
+
+        # more lines than the buffer holds arrive between reads
+        for line in 'cdefg' :
+            transcript.append(line)
+        reset, lines, cursor = transcript.read_since(cursor)
+        self.assertFalse(reset)
+        self.assertEqual(lines, ['e', 'f', 'g'])
+        self.assertEqual(transcript.line_count, 7)
+
+        transcript.reset('Not connected to server')
+        transcript.append('h')
+        reset, lines, cursor = transcript.read_since(cursor)
+        self.assertTrue(reset)
+        self.assertEqual(lines, ['h'])
+
+        header, reset, lines, cursor = transcript.read_with_header(cursor)
+        self.assertEqual((header, reset, lines), ('Not connected to server', False, []))
+        transcript.set_header(None)
+        transcript.append('i')
+        self.assertEqual(transcript.read_with_header(cursor)[:3], (None, False, ['i']))
+
+    def test_spill(self) :
+        with tempfile.TemporaryDirectory() as directory :
+            path = os.path.join(directory, 'spill.txt')
+            transcript = Transcript(max_lines=2, spill_path=path)
+            for line in 'abcd' :
+                transcript.append(line)
+            transcript.close()
+            self.assertEqual(transcript.lines(), ['c', 'd'])
+            with open(path, encoding='utf-8') as spill :
+                self.assertEqual(spill.read(), 'a\nb\n')
+
+if __name__ == '__main__' :
+    unittest.main()
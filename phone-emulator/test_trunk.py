@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+
+from async_phone_emulator import PhoneEngine
+from phone_emulator import PhoneState
+from switch_server import SwitchServer
+from trunk import namespace_phone_number, phone_namespace
+
+class TestTrunk(unittest.IsolatedAsyncioTestCase) :
+
+    async def asyncSetUp(self) :
+        self.server = SwitchServer(['0001', '0002', '0003', '0004', '0005'])
+        port = await self.server.start('localhost', 0)
+        self.engine = PhoneEngine(f'http://localhost:{port}', trunk_size=2)
+
+    async def asyncTearDown(self) :
+        await self.engine.shutdown()
+        await self.server.stop()
+
+    async def _wait_for(self, phone, state) :
+        for _ in range(200) :
+            if phone.snapshot().state == state :
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'{phone.snapshot().phone_number} is {phone.snapshot().state.name}, not {state.name}')
+
+    def test_namespaces(self) :
+        self.assertEqual(phone_namespace('0001'), '/phone/0001')
+        self.assertEqual(namespace_phone_number('/phone/0001'), '0001')
+        self.assertIsNone(namespace_phone_number('/'))
+        self.assertIsNone(namespace_phone_number('/phone/'))
+
+    async def test_call_across_trunks(self) :
+        phones = {number : self.engine.add_phone(number) for number in ('0001', '0002', '0003', '0006')}
+        self.assertEqual(self.engine.connections, 2)
+        await self.engine.start()
+        for number in ('0001', '0002', '0003') :
+            await self._wait_for(phones[number], PhoneState.ON_HOOK_IDLE)
+        # refused on its own, without taking its trunk down
+        await self._wait_for(phones['0006'], PhoneState.REGISTRATION_FAILED)
+        self.assertIn('Invalid phone number', phones['0006'].snapshot().header)
+        self.assertEqual(len(self.server), 3)
+
+        # 0001 and 0002 share a trunk; 0003 is on the other one
+        caller, callee = phones['0001'], phones['0003']
+        caller.off_hook()
+        for key in '0003' :
+            caller.key_press(key)
+        await self._wait_for(callee, PhoneState.INCOMING_CALL_RINGING)
+        callee.off_hook()
+        await self._wait_for(caller, PhoneState.CALL_CONNECTED)
+        await self._wait_for(callee, PhoneState.CALL_CONNECTED)
+        self.assertEqual(phones['0002'].snapshot().state, PhoneState.ON_HOOK_IDLE)
+
+        caller.talk('Hello, 0003!')
+        for _ in range(200) :
+            if callee.snapshot().last_line is not None :
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(callee.snapshot().last_line, '0001 : Hello, 0003!')
+
+        caller.on_hook()
+        await self._wait_for(callee, PhoneState.CALL_ENDED)
+        [record] = self.server.switch.call_records
+        self.assertEqual((record.caller, record.callee), ('0001', '0003'))
+
+    async def test_shutdown_hangs_up(self) :
+        caller = self.engine.add_phone('0001')
+        callee = self.engine.add_phone('0004')
+        await self.engine.start()
+        await self._wait_for(callee, PhoneState.ON_HOOK_IDLE)
+        callee.subscribe(lambda snapshot, changed : callee.off_hook()
+            if snapshot.state == PhoneState.INCOMING_CALL_RINGING else None, ('state',))
+        caller.off_hook()
+        for key in '0004' :
+            caller.key_press(key)
+        await self._wait_for(caller, PhoneState.CALL_CONNECTED)
+
+        await self.engine.shutdown()
+        for _ in range(200) :
+            if len(self.server) == 0 :
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(len(self.server), 0)
+        [record] = self.server.switch.call_records
+        self.assertIsNotNone(record.end)
+
+if __name__ == '__main__' :
+    unittest.main()
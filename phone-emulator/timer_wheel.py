@@ -0,0 +1,265 @@
+import math
+import os
+import threading
+import time
+import traceback
+import weakref
+
+DEFAULT_TICK = 0.01
+DEFAULT_SLOTS = 64
+DEFAULT_LEVELS = 4
+
+_PENDING = 0
+_FIRED = 1
+_CANCELLED = 2
+
+# Returned by TimerWheel.schedule (and reusable with reschedule).  Mirrors the parts of threading.Timer the emulator relies on.
+class TimerHandle :
+    __slots__ = ('_wheel', '_expires', '_callback', '_slot', '_state', '_waiter')
+
+    def __init__(self, wheel, expires, callback) :
+        self._wheel = wheel
+        self._expires = expires
+        self._callback = callback
+        self._slot = None
+        self._state = _PENDING
+        self._waiter = None
+
+    def cancel(self) :
+        self._wheel._cancel(self)
+
+    def cancelled(self) :
+        return self._state == _CANCELLED
+
+    def is_alive(self) :
+        return self._state == _PENDING
+
+    # Blocks until the callback has run or the timer was cancelled
+    def join(self, timeout=None) :
+        with self._wheel._lock :
+            if self._state != _PENDING :
+                return
+            if self._waiter is None :
+                self._waiter = threading.Event()
+            waiter = self._waiter
+        waiter.wait(timeout)
+
+# A hierarchical timing wheel.  Level 0 has one slot per tick, and each higher level has slots
+# that are `slots` times wider, so inserting and cancelling are O(1) no matter how many timers
+# are pending.  Something else has to call advance() regularly (see ThreadedTimerWheel and
+# AsyncTimerWheel).
+class TimerWheel :
+
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, levels=DEFAULT_LEVELS, clock=time.monotonic) :
+        self._tick = tick
+        self._slots = slots
+        self._levels = levels
+        self._clock = clock
+        self._origin = clock()
+        self._current_tick = 0
+        self._count = 0
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self._overflow = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) :
+        return self._count
+
+    @property
+    def tick(self) :
+        return self._tick
+
+    def schedule(self, delay, callback) :
+        return self.reschedule(TimerHandle(self, None, callback), delay)
+
+    # Runs handle's callback again delay seconds from now, once it has fired or been cancelled
+    # (a pending handle is moved), so a periodic timer can keep one handle instead of scheduling
+    # a new one every period.  Returns handle.
+    def reschedule(self, handle, delay) :
+        with self._lock :
+            if handle._slot is not None :
+                handle._slot.discard(handle)
+                self._count -= 1
+            now_tick = self._time_to_tick(self._clock())
+            if self._count == 0 and now_tick > self._current_tick :
+                # nothing to cascade, so skip straight over the idle period
+                self._current_tick = now_tick
+            handle._expires = max(self._current_tick + 1, now_tick + math.ceil(max(delay, 0.0) / self._tick))
+            handle._state = _PENDING
+            self._insert(handle)
+            self._count += 1
+        return handle
+
+    def advance(self, now=None) :
+        if now is None :
+            now = self._clock()
+        expired = []
+        with self._lock :
+            target = self._time_to_tick(now)
+            if self._count == 0 :
+                self._current_tick = max(self._current_tick, target)
+                return 0
+            while self._current_tick < target and self._count > 0 :
+                self._current_tick += 1
+                self._cascade()
+                slot = self._wheels[0][self._current_tick % self._slots]
+                if slot :
+                    for handle in slot :
+                        handle._slot = None
+                    expired.extend(slot)
+                    self._count -= len(slot)
+                    slot.clear()
+            if self._count == 0 :
+                self._current_tick = max(self._current_tick, target)
+
+        for handle in expired :
+            try :
+                handle._callback()
+            except Exception :
+                # one misbehaving callback shouldn't take out every other timer
+                traceback.print_exc()
+            with self._lock :
+                # unless the callback has already rescheduled it
+                if handle._slot is None :
+                    handle._state = _FIRED
+                waiter = handle._waiter
+                handle._waiter = None
+            if waiter is not None :
+                waiter.set()
+        return len(expired)
+
+    def _time_to_tick(self, now) :
+        return int((now - self._origin) / self._tick)
+
+    def _insert(self, handle) :
+        delta = handle._expires - self._current_tick
+        for level in range(self._levels) :
+            if delta < self._spans[level + 1] :
+                slot = self._wheels[level][(handle._expires // self._spans[level]) % self._slots]
+                break
+        else :
+            slot = self._overflow
+        slot.add(handle)
+        handle._slot = slot
+
+    def _cascade(self) :
+        # move timers down from the coarser levels whose slot boundary was just crossed,
+        # starting with the coarsest so they can trickle all the way down in one pass
+        for level in range(self._levels, 0, -1) :
+            if self._current_tick % self._spans[level] == 0 :
+                if level == self._levels :
+                    slot = self._overflow
+                else :
+                    slot = self._wheels[level][(self._current_tick // self._spans[level]) % self._slots]
+                if slot :
+                    handles = list(slot)
+                    slot.clear()
+                    for handle in handles :
+                        self._insert(handle)
+
+    def _cancel(self, handle) :
+        with self._lock :
+            if handle._state != _PENDING or handle._slot is None :
+                return
+            handle._slot.discard(handle)
+            handle._slot = None
+            handle._state = _CANCELLED
+            self._count -= 1
+            waiter = handle._waiter
+            handle._waiter = None
+        if waiter is not None :
+            waiter.set()
+
+# A timer wheel driven by a single daemon thread, which sleeps while no timers are pending.
+# Callbacks run on that thread, just like threading.Timer.
+class ThreadedTimerWheel(TimerWheel) :
+
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, levels=DEFAULT_LEVELS) :
+        super().__init__(tick, slots, levels)
+        self._has_timers = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='timer-wheel', daemon=True)
+        self._thread.start()
+
+    def reschedule(self, handle, delay) :
+        super().reschedule(handle, delay)
+        self._has_timers.set()
+        return handle
+
+    def _run(self) :
+        while True :
+            self._has_timers.wait()
+            time.sleep(self._tick)
+            self.advance()
+            with self._lock :
+                if self._count == 0 :
+                    self._has_timers.clear()
+
+# A timer wheel ticked by its event loop while timers are pending.  Callbacks run on the loop.
+class AsyncTimerWheel(TimerWheel) :
+
+    def __init__(self, loop, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, levels=DEFAULT_LEVELS) :
+        super().__init__(tick, slots, levels, clock=loop.time)
+        self._loop = loop
+        self._ticker = None
+
+    def reschedule(self, handle, delay) :
+        super().reschedule(handle, delay)
+        if self._ticker is None :
+            self._ticker = self._loop.call_later(self._tick, self._on_tick)
+        return handle
+
+    def _on_tick(self) :
+        self._ticker = None
+        self.advance()
+        if self._count > 0 :
+            self._ticker = self._loop.call_later(self._tick, self._on_tick)
+
+# A timer wheel on a clock of its own that only moves when advance_by is called, so timers fire
+# exactly when a test (or a stepped PhoneEmulator's driver) says so.  Callbacks run on the thread
+# that advances it.
+class ManualTimerWheel(TimerWheel) :
+
+    def __init__(self, start=0.0, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, levels=DEFAULT_LEVELS) :
+        self._now = start
+        super().__init__(tick, slots, levels, clock=self.time)
+
+    def time(self) :
+        return self._now
+
+    # Moves the clock on by seconds and fires every timer that has come due.  Returns how many.
+    def advance_by(self, seconds) :
+        self._now += seconds
+        return self.advance()
+
+    def _time_to_tick(self, now) :
+        # a delay of exactly 15 seconds, advanced by exactly 15 seconds, is due whatever the
+        # floating point rounding
+        return math.floor((now - self._origin) / self._tick + 1e-9)
+
+_default_wheel = None
+_default_wheel_pid = None
+_default_wheel_lock = threading.Lock()
+_loop_wheels = weakref.WeakKeyDictionary()
+
+# The wheel shared by every threaded emulator in this process
+def default_timer_wheel() :
+    global _default_wheel, _default_wheel_pid
+    with _default_wheel_lock :
+        # the wheel's thread doesn't survive a fork, so each process gets its own
+        if _default_wheel is None or _default_wheel_pid != os.getpid() :
+            _default_wheel = ThreadedTimerWheel()
+            _default_wheel_pid = os.getpid()
+        return _default_wheel
+
+# The wheel shared by every asyncio emulator on the running event loop
+def event_loop_timer_wheel() :
+    # only asyncio emulators need this, so the threaded ones don't pay for importing asyncio
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    wheel = _loop_wheels.get(loop)
+    if wheel is None :
+        wheel = AsyncTimerWheel(loop)
+        _loop_wheels[loop] = wheel
+    return wheel
@@ -0,0 +1,130 @@
+from collections import deque
+from itertools import islice
+import threading
+
+DEFAULT_MAX_LINES = 1000
+
+# What a phone shows on its display: an optional header (a status message, or who the call is
+# connected to) followed by the lines of conversation.  Lines go into a ring buffer, so appending
+# is O(1) and a long call only keeps the last max_lines in memory.  Lines pushed out of the
+# buffer are appended to spill_path, if one is given.
+#
+# Consumers that only want new lines keep a cursor from read_since() and pass it back in.
+class Transcript :
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, spill_path=None, header=None) :
+        self._lines = deque()
+        self._max_lines = max_lines
+        self._header = header
+        self._count = 0
+        self._generation = 0
+        self._spill_path = spill_path
+        self._spill_file = None
+        self._lock = threading.Lock()
+
+    @property
+    def max_lines(self) :
+        return self._max_lines
+
+    @property
+    def header(self) :
+        return self._header
+
+    # Bumped every time the transcript is cleared
+    @property
+    def generation(self) :
+        return self._generation
+
+    # The total number of lines appended since the last reset, including any that were dropped
+    @property
+    def line_count(self) :
+        return self._count
+
+    @property
+    def last_line(self) :
+        with self._lock :
+            return self._lines[-1] if self._lines else None
+
+    def __len__(self) :
+        return len(self._lines)
+
+    def reset(self, header=None) :
+        with self._lock :
+            self._lines.clear()
+            self._header = header
+            self._count = 0
+            self._generation += 1
+
+    def set_header(self, header) :
+        with self._lock :
+            self._header = header
+
+    def append(self, line) :
+        with self._lock :
+            if len(self._lines) == self._max_lines :
+                dropped = self._lines.popleft()
+                if self._spill_path is not None :
+                    self._spill(dropped)
+            self._lines.append(line)
+            self._count += 1
+
+    def extend(self, lines) :
+        with self._lock :
+            for line in lines :
+                if len(self._lines) == self._max_lines :
+                    dropped = self._lines.popleft()
+                    if self._spill_path is not None :
+                        self._spill(dropped)
+                self._lines.append(line)
+                self._count += 1
+
+    def lines(self) :
+        with self._lock :
+            return list(self._lines)
+
+    # Returns (reset, lines, cursor).  reset is True when the transcript was cleared since cursor
+    # was handed out (or cursor is None), in which case lines holds everything still buffered.
+    def read_since(self, cursor=None) :
+        with self._lock :
+            return self._read_since(cursor)
+
+    # The header along with read_since(cursor), both as of the same moment: (header, reset, lines,
+    # cursor)
+    def read_with_header(self, cursor=None) :
+        with self._lock :
+            return (self._header,) + self._read_since(cursor)
+
+    def _read_since(self, cursor) :
+        new_cursor = (self._generation, self._count)
+        if cursor is None or cursor[0] != self._generation :
+            return True, list(self._lines), new_cursor
+        new = min(self._count - cursor[1], len(self._lines))
+        if new <= 0 :
+            return False, [], new_cursor
+        return False, list(islice(self._lines, len(self._lines) - new, None)), new_cursor
+
+    # The full display text, or None when there is nothing to show
+    def text(self) :
+        with self._lock :
+            if self._header is None :
+                if not self._lines :
+                    return None
+                return '\n'.join(self._lines)
+            if not self._lines :
+                return self._header
+            return self._header + '\n' + '\n'.join(self._lines)
+
+    def __str__(self) :
+        return self.text() or ''
+
+    def close(self) :
+        with self._lock :
+            if self._spill_file is not None :
+                self._spill_file.close()
+                self._spill_file = None
+
+    def _spill(self, line) :
+        if self._spill_file is None :
+            self._spill_file = open(self._spill_path, 'a', encoding='utf-8')
+        self._spill_file.write(line)
+        self._spill_file.write('\n')
@@ -0,0 +1,182 @@
+import asyncio
+import socketio
+
+from phone_emulator import PhoneEventType, PhoneStateMachine
+from timer_wheel import event_loop_timer_wheel
+
+# Each phone on a trunk is a socket.io namespace of its own, named for its number
+NAMESPACE_PREFIX = '/phone/'
+
+def phone_namespace(phone_number) :
+    return NAMESPACE_PREFIX + phone_number
+
+# The phone number a trunk namespace stands for, or None if it isn't one
+def namespace_phone_number(namespace) :
+    if namespace.startswith(NAMESPACE_PREFIX) :
+        return namespace[len(NAMESPACE_PREFIX):] or None
+    return None
+
+# Lets a phone's _register_socket_events file its handlers with the trunk
+class _NamespaceSocket :
+    __slots__ = ('_handlers', '_namespace')
+
+    def __init__(self, handlers, namespace) :
+        self._handlers = handlers
+        self._namespace = namespace
+
+    def on(self, event, handler) :
+        self._handlers[(self._namespace, event)] = handler
+
+# A phone on a PhoneTrunk.  It has no queue or task of its own: events wait on the phone until the
+# trunk gets round to it, and everything it sends goes out through the trunk's connection.  Must
+# be used from the trunk's event loop.
+class TrunkPhone(PhoneStateMachine) :
+    __slots__ = ('_trunk', '_namespace', '_pending', '_stopped')
+
+    def __init__(self, phone_number, trunk, latency_recorder=None, trace=None, media=None, event_log=None) :
+        super().__init__(phone_number, trunk.server_url, latency_recorder=latency_recorder, trace=trace, media=media,
+            event_log=event_log)
+        self._trunk = trunk
+        self._namespace = phone_namespace(phone_number)
+        self._pending = []
+        self._stopped = False
+        self._sio = _NamespaceSocket(trunk._handlers, self._namespace)
+        self._register_socket_events()
+
+    def _put_event(self, event) :
+        if self._stopped :
+            return
+        if not self._pending :
+            self._trunk._ready(self)
+        self._pending.append(event)
+
+    def _emit(self, event, *args) :
+        self._trunk._outbox.append((self._namespace, event, args))
+
+    def _start_timer(self, delay, callback) :
+        if self._timers is None :
+            self._timers = event_loop_timer_wheel()
+        return super()._start_timer(delay, callback)
+
+    def _process(self) :
+        events = self._pending
+        self._pending = []
+        for i, event in enumerate(events) :
+            if event.type == PhoneEventType.SHUTDOWN :
+                self._dispatch_batch(events[:i])
+                self._shutting_down()
+                self._stopped = True
+                if self._emit_hangup :
+                    self._emit('hang_up')
+                return
+        self._dispatch_batch(events)
+
+# Carries many phones over a single socket.io connection (one TCP connection, one Engine.IO
+# heartbeat), one namespace per phone, and hands the events for each namespace to its phone.
+# The phones are connected (and so registered, since the server takes the number from the
+# namespace) all at once.  A trunk only has the one connection to look after, so it leaves
+# reconnecting to socketio.  Add every phone before start().  transports and serializer are as for
+# PhoneEmulator.
+class PhoneTrunk :
+
+    def __init__(self, server_url, ssl_verify=False, latency_recorder=None, trace=None, http_session=None,
+            transports=None, serializer='default', media=None, event_log=None) :
+        self.server_url = server_url
+        self._latency_recorder = latency_recorder
+        self._trace = trace
+        self._media = media
+        self._event_log = event_log
+        self._transports = transports
+        if http_session is None :
+            self._sio = socketio.AsyncClient(ssl_verify=ssl_verify, handle_sigint=False, serializer=serializer)
+        else :
+            self._sio = socketio.AsyncClient(http_session=http_session, handle_sigint=False, serializer=serializer,
+                websocket_extra_options=None if ssl_verify else {'ssl' : False})
+        self._sio.on('connect', self._on_connect, namespace='*')
+        self._sio.on('connect_error', self._on_connect_error, namespace='*')
+        self._sio.on('disconnect', self._on_disconnect, namespace='*')
+        self._sio.on('*', self._on_event, namespace='*')
+        self._handlers = {}
+        self._phones = {}
+        self._waiting = []
+        self._outbox = []
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self) :
+        return len(self._phones)
+
+    @property
+    def phones(self) :
+        return self._phones
+
+    def add_phone(self, phone_number) :
+        phone = TrunkPhone(phone_number, self, self._latency_recorder, self._trace, self._media, self._event_log)
+        self._phones[phone_number] = phone
+        return phone
+
+    async def start(self) :
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        namespaces = [phone._namespace for phone in self._phones.values()]
+        try :
+            # don't wait for the namespaces: socketio drops the whole connection if any one of them
+            # is refused, where a refused phone should just fail on its own
+            await self._sio.connect(self.server_url, namespaces=namespaces, transports=self._transports, wait=False)
+        except socketio.exceptions.ConnectionError :
+            # reported to each phone through connect_error
+            pass
+
+    async def shutdown(self) :
+        for phone in self._phones.values() :
+            phone.shutdown()
+        self._process()
+        await self._flush_outbox()
+        if self._task is not None :
+            self._task.cancel()
+            self._task = None
+        await self._sio.disconnect()
+
+    def _ready(self, phone) :
+        self._waiting.append(phone)
+        if self._wakeup is not None :
+            self._wakeup.set()
+
+    def _process(self) :
+        while self._waiting :
+            waiting = self._waiting
+            self._waiting = []
+            for phone in waiting :
+                phone._process()
+
+    async def _run(self) :
+        while True :
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            self._process()
+            await self._flush_outbox()
+
+    async def _flush_outbox(self) :
+        while self._outbox :
+            outbox = self._outbox
+            self._outbox = []
+            for namespace, event, args in outbox :
+                await self._sio.emit(event, args[0] if args else None, namespace=namespace)
+
+    def _handle(self, namespace, event, args) :
+        handler = self._handlers.get((namespace, event))
+        if handler is not None :
+            handler(*args)
+
+    def _on_connect(self, namespace) :
+        self._handle(namespace, 'connect', ())
+
+    def _on_connect_error(self, namespace, *args) :
+        self._handle(namespace, 'connect_error', args)
+
+    def _on_disconnect(self, namespace, *args) :
+        # the phones' handlers don't take the reason
+        self._handle(namespace, 'disconnect', ())
+
+    def _on_event(self, event, namespace, *args) :
+        self._handle(namespace, event, args)